@@ -0,0 +1,45 @@
+"""
+auth_cache.py - ข้อมูล user ที่ login แล้วสำหรับเก็บใน cache (ใช้ใน current_user)
+
+หน้าที่หลัก:
+- Principal: ข้อมูล user แบบอ่านอย่างเดียว (ไม่มี password_hash และ field ที่เปลี่ยนบ่อยอย่าง diary_count)
+  pickle ได้ จึงเก็บใน tier ร่วมของ core/cache.py ได้
+- token_fingerprint(): ส่วนหนึ่งของ cache key (token ใหม่จึงไม่ใช้ข้อมูลของ token เก่า)
+
+หมายเหตุ:
+- การเก็บ/invalidate อยู่ใน routers/profile.py (namespace "principal", scope = user_id)
+  ตั้ง CACHE_REDIS_URL แล้วการ invalidate มีผลทุก worker ไม่ตั้งมีผลเฉพาะ process ที่รับ request นั้น
+  worker อื่นอาจเห็นข้อมูลเก่าได้นานสุดเท่า AUTH_CACHE_TTL_SECONDS
+- ตั้ง AUTH_CACHE_TTL_SECONDS=0 เพื่อปิด cache
+"""
+
+import hashlib
+from dataclasses import dataclass
+from uuid import UUID
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """user ที่ login อยู่ (อ่านอย่างเดียว) - มี attribute ชื่อเดียวกับ models.user.User"""
+
+    id: UUID
+    email: str
+    username: str
+    gender: str
+    age: int
+    avatar_url: str | None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            username=user.username,
+            gender=user.gender,
+            age=user.age,
+            avatar_url=user.avatar_url,
+        )
+
+
+def token_fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
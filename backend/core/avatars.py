@@ -0,0 +1,143 @@
+"""
+avatars.py - ที่เก็บรูป avatar แบบ content-addressed
+
+หน้าที่หลัก:
+- เขียนไฟล์ที่อัปโหลดลง disk ทีละ chunk พร้อมคำนวณ SHA-256 ไปด้วย
+- ตั้งชื่อไฟล์ตาม hash ของเนื้อหา: media/avatars/<sha256>.<ext>
+  ไฟล์เดียวกันถูกเก็บครั้งเดียว (อัปโหลดซ้ำ/หลาย user ใช้รูปเดียวกัน ไม่เปลือง disk)
+- สร้างรูปย่อสี่เหลี่ยมจัตุรัส 64/128/512 px เป็น WebP: <sha256>_<px>.webp
+- URL มี hash อยู่ในชื่อ เนื้อหาไม่มีวันเปลี่ยน client/proxy จึง cache ได้ตลอด
+
+หมายเหตุ:
+- avatar แบบเก่า (ชื่อเป็น UUID) ยังใช้งานได้ แต่จะไม่มีรูปย่อ
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import BinaryIO
+
+from core.config import settings
+
+AVATAR_SIZES = (64, 128, 512)
+AVATAR_URL_PREFIX = "/media/avatars/"
+CHUNK_SIZE = 64 * 1024
+
+_HASH_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AvatarTooLarge(Exception):
+    pass
+
+
+class InvalidAvatar(Exception):
+    pass
+
+
+def _avatars_dir() -> Path:
+    return Path(settings.avatars_dir)
+
+
+def _variant_name(digest: str, px: int) -> str:
+    return f"{digest}_{px}.webp"
+
+
+def _make_variants(original: Path, digest: str) -> None:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(original) as source:
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            for px in AVATAR_SIZES:
+                target = _avatars_dir() / _variant_name(digest, px)
+                if target.exists():
+                    continue
+                tmp = target.with_name(target.name + f".{uuid.uuid4().hex}.tmp")
+                ImageOps.fit(image, (px, px)).save(tmp, format="WEBP", quality=85, method=4)
+                os.replace(tmp, target)
+    except (UnidentifiedImageError, OSError) as exc:
+        raise InvalidAvatar(str(exc)) from exc
+
+
+def store_avatar(stream: BinaryIO, ext: str) -> str:
+    """
+    เก็บไฟล์ avatar แบบ content-addressed คืน URL ของต้นฉบับ เช่น "/media/avatars/<sha256>.jpg"
+
+    Raises:
+        AvatarTooLarge: ไฟล์ใหญ่เกิน settings.avatar_max_bytes
+        InvalidAvatar: ไฟล์ไม่ใช่รูปที่อ่านได้
+    """
+    folder = _avatars_dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    tmp = folder / f".upload-{uuid.uuid4().hex}.tmp"
+
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > settings.avatar_max_bytes:
+                    raise AvatarTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = digest.hexdigest()
+        target = folder / f"{name}{ext}"
+        created = not target.exists()
+        if created:
+            os.replace(tmp, target)
+        # ถ้ามีไฟล์เดียวกันอยู่แล้ว (dedup) tmp จะถูกลบใน finally
+
+        try:
+            _make_variants(target, name)
+        except InvalidAvatar:
+            if created:
+                target.unlink(missing_ok=True)
+            raise
+        return f"{AVATAR_URL_PREFIX}{target.name}"
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _digest_of(avatar_url: str | None) -> str | None:
+    if not avatar_url or not avatar_url.startswith(AVATAR_URL_PREFIX):
+        return None
+    stem = Path(avatar_url).stem
+    return stem if _HASH_NAME.match(stem) else None
+
+
+def avatar_variant_urls(avatar_url: str | None) -> dict[str, str] | None:
+    """URL ของรูปย่อแต่ละขนาด เช่น {"64": "/media/avatars/<sha256>_64.webp", ...}"""
+    digest = _digest_of(avatar_url)
+    if digest is None:
+        return None
+    return {str(px): f"{AVATAR_URL_PREFIX}{_variant_name(digest, px)}" for px in AVATAR_SIZES}
+
+
+def avatar_files_exist(avatar_url: str) -> bool:
+    """ไฟล์ต้นฉบับและรูปย่อ (ถ้าเป็นชื่อแบบ hash) ยังอยู่ครบหรือไม่"""
+    folder = _avatars_dir()
+    if not (folder / Path(avatar_url).name).exists():
+        return False
+    digest = _digest_of(avatar_url)
+    return digest is None or all((folder / _variant_name(digest, px)).exists() for px in AVATAR_SIZES)
+
+
+def remove_avatar(avatar_url: str | None) -> None:
+    """ลบไฟล์ avatar (และรูปย่อ) - ผู้เรียกต้องถือ lock ของ URL และเช็คก่อนว่าไม่มี user อื่นใช้ URL นี้อยู่"""
+    if not avatar_url or not avatar_url.startswith(AVATAR_URL_PREFIX):
+        return
+    folder = _avatars_dir()
+    (folder / Path(avatar_url).name).unlink(missing_ok=True)
+    digest = _digest_of(avatar_url)
+    if digest is not None:
+        for px in AVATAR_SIZES:
+            (folder / _variant_name(digest, px)).unlink(missing_ok=True)
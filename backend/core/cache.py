@@ -0,0 +1,310 @@
+"""
+cache.py - Cache สองชั้นที่ใช้ร่วมกันได้ทุก worker (in-process LRU + TTL และ Redis แบบ optional)
+
+หน้าที่หลัก:
+- LocalTier: LRU + TTL ใน process (CACHE_LOCAL_MAX_ENTRIES) อ่านได้โดยไม่มี I/O
+- RedisTier: tier ร่วมทุก worker ผ่าน Redis protocol (redis.asyncio) เปิดเมื่อตั้ง CACHE_REDIS_URL
+    - redis://host:6379/0, unix:///run/redis/redis.sock หรือ fakeredis:// (ใน process เดียว สำหรับ test/dev)
+    - ค่าถูก pickle ก่อนเก็บ (Redis ต้องเป็นของระบบเราเองเท่านั้น)
+    - Redis ล่ม/ช้า: นับเป็น miss แล้วโหลดจาก DB ตามปกติ (ไม่ทำให้ request error)
+- key แบ่งตาม namespace และ scope: planary:{namespace}:{scope}:v{version}:{key}
+- invalidate แบบ versioned: invalidate(namespace, scope) เพิ่ม version ของ scope นั้น
+  key เดิมทั้งหมดจึงไม่ถูกอ่านอีก (ไม่ต้องไล่ลบ) แล้วหมดอายุไปเองตาม TTL
+    - มี Redis: version อยู่ใน Redis (INCR) แต่ละ worker จำไว้ CACHE_VERSION_TTL_SECONDS
+      worker อื่นเห็นการ invalidate ช้าสุดเท่านี้ (worker ที่ invalidate เห็นทันที)
+    - ไม่มี Redis: version อยู่ใน process (invalidate มีผลเฉพาะ worker นั้น เหมือน cache เดิม)
+- single-flight: miss ของ key เดียวกันพร้อมกันหลาย request โหลดจาก DB ครั้งเดียว
+    - ใน process: request ที่ตามมารอ Future ของ request แรก
+    - ข้าม worker: lock ใน Redis (SET NX PX) worker ที่ไม่ได้ lock รอค่าจาก Redis ไม่เกิน CACHE_LOCK_SECONDS
+- exception จาก loader ไม่ถูก cache (request ที่รออยู่ได้ exception เดียวกัน)
+- @cached(namespace, key=..., scope=..., ttl=...): ให้ router เลือกใช้กับ async function ได้
+  และมี fn.invalidate(scope) สำหรับเรียกหลังแก้ข้อมูล
+  shared_only=True: cache เฉพาะเมื่อมี Redis (ข้อมูลที่อ่านค่าเก่าจาก worker อื่นไม่ได้ เช่นแม่แบบกิจกรรม)
+  ไม่ตั้ง CACHE_REDIS_URL = เรียก function ตรงทุกครั้ง
+
+การใช้งาน:
+    @cached("routines", key=lambda db, user_id: "all", scope=lambda db, user_id: user_id, shared_only=True)
+    async def routine_templates(db, user_id): ...
+
+    await routine_templates.invalidate(me.id)
+
+หมายเหตุ: redis (และ fakeredis สำหรับ test) เป็น optional dependency - ไม่ตั้ง CACHE_REDIS_URL ใช้แค่ tier ใน process
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_LOCK_POLL_SECONDS = 0.05  # worker ที่ไม่ได้ lock เช็กค่าใน Redis ทุกเท่านี้
+
+stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+
+class LocalTier:
+    """LRU + TTL ใน process"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisTier:
+    """tier ร่วมทุก worker (Redis protocol)"""
+
+    def __init__(self, url: str):
+        if url.startswith("fakeredis://"):
+            from fakeredis import aioredis  # optional dependency: สำหรับ test/dev
+
+            self._redis = aioredis.FakeRedis()
+        else:
+            import redis.asyncio as redis  # optional dependency: ใช้เฉพาะเมื่อตั้ง CACHE_REDIS_URL
+
+            self._redis = redis.from_url(url)
+
+    async def get(self, key: str):
+        raw = await self._redis.get(key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        await self._redis.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), px=max(int(ttl * 1000), 1))
+
+    async def version(self, key: str) -> int:
+        return int(await self._redis.get(key) or 0)
+
+    async def bump(self, key: str) -> int:
+        return int(await self._redis.incr(key))
+
+    async def acquire(self, key: str, ttl: float) -> bool:
+        return bool(await self._redis.set(key, b"1", nx=True, px=max(int(ttl * 1000), 1)))
+
+    async def held(self, key: str) -> bool:
+        return bool(await self._redis.exists(key))
+
+    async def release(self, key: str) -> None:
+        await self._redis.delete(key)
+
+    async def close(self) -> None:
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+
+def _part(value) -> str:
+    if isinstance(value, (tuple, list)):
+        return ",".join(_part(v) for v in value)
+    return str(value)
+
+
+def _version_key(namespace: str, scope) -> str:
+    return f"planary:ver:{namespace}" if scope is None else f"planary:ver:{namespace}:{_part(scope)}"
+
+
+class Cache:
+    def __init__(self):
+        self._local = LocalTier(settings.cache_local_max_entries)
+        self._versions: dict[str, int] = {}  # ไม่มี Redis: version ต่อ (namespace, scope) ใน process
+        self._version_counter = itertools.count(1)
+        self._shared_versions = LocalTier(settings.cache_local_max_entries)  # มี Redis: version ที่อ่านมาแล้ว
+        self._shared: RedisTier | None = None
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def _shared_tier(self) -> RedisTier | None:
+        if self._shared is None and settings.cache_redis_url:
+            self._shared = RedisTier(settings.cache_redis_url)
+        return self._shared
+
+    async def _call(self, fn, *args, default=None):
+        """เรียก Redis - error นับและ log แล้วคืน default (cache ต้องไม่ทำให้ request ล้ม)"""
+        try:
+            return await fn(*args)
+        except Exception:
+            stats["errors"] += 1
+            logger.warning("shared cache call failed", exc_info=True)
+            return default
+
+    async def _version(self, vkey: str) -> int | None:
+        shared = self._shared_tier()
+        if shared is None:
+            return self._versions.get(vkey, 0)
+        version = self._shared_versions.get(vkey)
+        if version is _MISSING:
+            version = await self._call(shared.version, vkey)
+            if version is None:
+                return None
+            self._shared_versions.set(vkey, version, settings.cache_version_ttl_seconds)
+        return version
+
+    async def get_or_load(
+        self, namespace: str, key, loader, *, ttl: float | None = None, scope=None, shared_only: bool = False
+    ):
+        """คืนค่าจาก cache หรือ await loader() (ครั้งเดียวต่อ key แม้ miss พร้อมกันหลาย request)"""
+        ttl = settings.cache_default_ttl_seconds if ttl is None else ttl
+        if not settings.cache_enabled or ttl <= 0:
+            return await loader()
+        if shared_only and self._shared_tier() is None:
+            return await loader()
+        version = await self._version(_version_key(namespace, scope))
+        if version is None:  # อ่าน version จาก Redis ไม่ได้: ไม่รู้ว่าค่าไหนยังใช้ได้ จึงโหลดตรง
+            return await loader()
+        scope_part = "-" if scope is None else _part(scope)
+        full_key = f"planary:{namespace}:{scope_part}:v{version}:{_part(key)}"
+
+        value = self._local.get(full_key)
+        if value is not _MISSING:
+            stats["local_hits"] += 1
+            return value
+
+        pending = self._inflight.get(full_key)
+        if pending is not None:
+            stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # request นี้ถูกยกเลิกเอง
+                return await loader()  # request ที่โหลดอยู่ถูกยกเลิก: โหลดเอง
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await self._load(full_key, loader, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # ไม่ให้ asyncio เตือนเมื่อไม่มีใครรอ
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(full_key, None)
+
+    async def _load(self, full_key: str, loader, ttl: float):
+        shared = self._shared_tier()
+        if shared is None:
+            stats["misses"] += 1
+            value = await loader()
+            self._local.set(full_key, value, ttl)
+            return value
+
+        value = await self._call(shared.get, full_key, default=_MISSING)
+        if value is not _MISSING:
+            stats["shared_hits"] += 1
+            self._local.set(full_key, value, ttl)
+            return value
+
+        lock_key = f"{full_key}:lock"
+        locked = await self._call(shared.acquire, lock_key, settings.cache_lock_seconds, default=True)
+        if not locked:
+            # worker อื่นกำลังโหลด key นี้: รอค่าจาก Redis แทนการยิง DB ซ้ำ
+            deadline = time.monotonic() + settings.cache_lock_seconds
+            while time.monotonic() < deadline:
+                await asyncio.sleep(_LOCK_POLL_SECONDS)
+                value = await self._call(shared.get, full_key, default=_MISSING)
+                if value is not _MISSING:
+                    stats["coalesced"] += 1
+                    self._local.set(full_key, value, ttl)
+                    return value
+                if not await self._call(shared.held, lock_key, default=False):
+                    break  # worker นั้นโหลดไม่สำเร็จ
+
+        stats["misses"] += 1
+        try:
+            value = await loader()
+            self._local.set(full_key, value, ttl)
+            await self._call(shared.set, full_key, value, ttl)
+        finally:
+            if locked:
+                await self._call(shared.release, lock_key)
+        return value
+
+    async def invalidate(self, namespace: str, scope=None, *, shared_only: bool = False) -> None:
+        """ทำให้ค่าทั้งหมดของ namespace (และ scope) ใช้ไม่ได้"""
+        vkey = _version_key(namespace, scope)
+        shared = self._shared_tier()
+        if shared is None:
+            if not shared_only:  # shared_only ไม่มี Redis: ไม่ได้ cache ไว้ตั้งแต่แรก
+                self._versions[vkey] = next(self._version_counter)
+            return
+        version = await self._call(shared.bump, vkey)
+        if version is not None:
+            self._shared_versions.set(vkey, version, settings.cache_version_ttl_seconds)
+
+    def clear_local(self) -> None:
+        self._local.clear()
+        self._shared_versions.clear()
+
+    async def close(self) -> None:
+        if self._shared is not None:
+            await self._call(self._shared.close)
+            self._shared = None
+
+
+cache = Cache()
+
+
+def cached(namespace: str, *, key, scope=None, ttl: float | None = None, shared_only: bool = False):
+    """
+    decorator สำหรับ async function: cache ผลลัพธ์ใน namespace
+
+    key / scope: callable ที่รับ argument ชุดเดียวกับ function แล้วคืนส่วนของ key
+    (scope คือหน่วยที่ invalidate พร้อมกัน เช่น user id) ttl: None = CACHE_DEFAULT_TTL_SECONDS
+    shared_only: cache เฉพาะเมื่อตั้ง CACHE_REDIS_URL (invalidate ต้องถึงทุก worker)
+    """
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await cache.get_or_load(
+                namespace,
+                key(*args, **kwargs),
+                lambda: fn(*args, **kwargs),
+                ttl=ttl,
+                scope=scope(*args, **kwargs) if scope is not None else None,
+                shared_only=shared_only,
+            )
+
+        async def invalidate(scope_value=None) -> None:
+            await cache.invalidate(namespace, scope_value, shared_only=shared_only)
+
+        wrapper.invalidate = invalidate
+        return wrapper
+
+    return decorate
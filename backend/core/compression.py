@@ -0,0 +1,292 @@
+"""
+compression.py - บีบอัด response (br / zstd / gzip) ตาม Accept-Encoding
+
+หน้าที่หลัก:
+- CompressionMiddleware: ASGI middleware เลือก encoding ที่ client รับและ server มี
+  (br ถ้าติดตั้ง brotli, zstd ถ้าติดตั้ง zstandard, gzip มีเสมอ) เรียงตาม COMPRESSION_ENCODINGS
+- บีบเฉพาะชนิดที่เป็นข้อความ (JSON, NDJSON, text/*, iCalendar) ที่ใหญ่กว่า COMPRESSION_MIN_BYTES
+  ไม่แตะ response ที่บีบมาแล้ว/รูปภาพ/zip, 204/206/304, request ที่มี Range และ Cache-Control: no-transform
+- response ปกติ (body ก้อนเดียว): บีบทั้งก้อน body ใหญ่ (>= 64 KB) บีบใน threadpool ไม่จอง event loop
+- StreamingResponse (more_body): บีบต่อเนื่องทีละ chunk ไม่ buffer ทั้ง body และ flush ทุก ~32 KB
+  ของข้อมูลเข้า client จึงได้ข้อมูลเป็นช่วง ๆ (ตัด content-length ออกเพราะไม่รู้ขนาดหลังบีบ)
+- cache ของ body ที่บีบแล้ว: response ที่มี ETag ถูกเก็บตาม (ETag, encoding) แบบ LRU (COMPRESSION_CACHE_ENTRIES)
+  request ถัดไปที่ได้ body เดิม (ETag เดิม) ไม่ต้องบีบซ้ำ - ใช้กับ payload ที่ถูกเรียกบ่อยเช่น /trends/summary
+- ETag ของ response ที่บีบแล้วถูกเปลี่ยนเป็น weak (W/"...") เพราะ byte ไม่ตรงกับ representation เดิม
+  และใส่ Vary: Accept-Encoding ทุก response ที่บีบได้
+
+หมายเหตุ: brotli/zstandard เป็น optional dependency (ไม่ติดตั้ง = ข้าม encoding นั้น)
+"""
+
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+from core.config import settings
+
+# ชนิดที่บีบได้คุ้ม (นอกเหนือจาก text/*)
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+_THREAD_MIN_BYTES = 64 * 1024  # body ใหญ่กว่านี้บีบใน threadpool
+_STREAM_FLUSH_BYTES = 32 * 1024  # streaming: flush ให้ client ทุกครั้งที่รับข้อมูลเข้ามาครบเท่านี้
+
+stats = {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cache_hits": 0}
+
+
+class _Gzip:
+    def __init__(self):
+        self._z = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)  # 31 = gzip header
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        import brotli  # optional dependency
+
+        self._c = brotli.Compressor(quality=settings.compression_brotli_quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        import zstandard  # optional dependency
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._c = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+_CODECS = {"br": _Brotli, "zstd": _Zstd, "gzip": _Gzip}
+
+
+@lru_cache(maxsize=None)
+def available_encodings() -> tuple[str, ...]:
+    """encoding ที่ใช้ได้จริงใน process นี้ ตามลำดับที่ต้องการ"""
+    usable = []
+    for name in (e.strip().lower() for e in settings.compression_encodings.split(",")):
+        if name not in _CODECS:
+            continue
+        try:
+            _CODECS[name]()
+        except ImportError:
+            continue
+        usable.append(name)
+    return tuple(usable)
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """encoding แรก (ตามลำดับของ server) ที่ client รับ (q > 0) - None = ส่งแบบไม่บีบ"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    for name in available_encodings():
+        if weights.get(name, weights.get("*", 0)) > 0:
+            return name
+    return None
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    codec = _CODECS[encoding]()
+    return codec.compress(data) + codec.finish()
+
+
+class _CompressedCache:
+    """LRU ของ body ที่บีบแล้ว key = (ETag, encoding) - แก้จาก event loop เท่านั้น"""
+
+    def __init__(self):
+        self._items: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+
+    def get(self, key) -> bytes | None:
+        body = self._items.get(key)
+        if body is not None:
+            self._items.move_to_end(key)
+        return body
+
+    def put(self, key, body: bytes) -> None:
+        if settings.compression_cache_entries <= 0:
+            return
+        self._items[key] = body
+        self._items.move_to_end(key)
+        while len(self._items) > settings.compression_cache_entries:
+            self._items.popitem(last=False)
+
+
+cache = _CompressedCache()
+
+
+def _compressible(start: dict) -> bool:
+    if start["status"] < 200 or start["status"] in (204, 206, 304):
+        return False
+    headers = Headers(raw=start["headers"])
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+def _mark_encoded(start: dict, encoding: str) -> MutableHeaders:
+    headers = MutableHeaders(raw=start["headers"])
+    headers["content-encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+    return headers
+
+
+class _Responder:
+    """ห่อ send ของ request หนึ่ง: รอ response start ไว้จนเห็น body ก้อนแรกแล้วค่อยตัดสินใจ"""
+
+    def __init__(self, send, encoding: str):
+        self.send = send
+        self.encoding = encoding
+        self.start: dict | None = None
+        self.mode: str | None = None  # "identity" | "stream" (body ก้อนเดียวส่งจบในครั้งแรก)
+        self.codec = None
+        self.pending = 0
+
+    async def __call__(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message
+            return
+        if kind != "http.response.body" or self.mode == "identity":
+            await self._send_start()
+            await self.send(message)
+            return
+        if self.mode == "stream":
+            await self._stream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not _compressible(self.start):
+            self.mode = "identity"
+        elif not more_body:
+            await self._send_whole(body)
+            return
+        else:
+            length = Headers(raw=self.start["headers"]).get("content-length")
+            if length is not None and int(length) < settings.compression_min_bytes:
+                self.mode = "identity"
+            else:
+                self.mode = "stream"
+                self.codec = _CODECS[self.encoding]()
+                headers = _mark_encoded(self.start, self.encoding)
+                del headers["content-length"]
+                stats["responses"] += 1
+                await self._send_start()
+                await self._stream(message)
+                return
+        await self._send_start()
+        await self.send(message)
+
+    async def _send_start(self) -> None:
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self.send(start)
+
+    async def _send_whole(self, body: bytes) -> None:
+        self.mode = "identity"
+        if len(body) < settings.compression_min_bytes:
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            await self._send_start()
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        etag = Headers(raw=self.start["headers"]).get("etag")
+        key = (etag, self.encoding) if etag else None
+        compressed = cache.get(key) if key else None
+        if compressed is not None:
+            stats["cache_hits"] += 1
+        else:
+            if len(body) >= _THREAD_MIN_BYTES:
+                compressed = await anyio.to_thread.run_sync(compress, self.encoding, body)
+            else:
+                compressed = compress(self.encoding, body)
+            if key:
+                cache.put(key, compressed)
+        stats["responses"] += 1
+        stats["bytes_in"] += len(body)
+        stats["bytes_out"] += len(compressed)
+
+        headers = _mark_encoded(self.start, self.encoding)
+        headers["content-length"] = str(len(compressed))
+        await self._send_start()
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    async def _stream(self, message: dict) -> None:
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        chunk = self.codec.compress(body)
+        self.pending += len(body)
+        if not more_body:
+            chunk += self.codec.finish()
+        elif self.pending >= _STREAM_FLUSH_BYTES:
+            chunk += self.codec.flush()
+            self.pending = 0
+        stats["bytes_in"] += len(body)
+        stats["bytes_out"] += len(chunk)
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """ASGI middleware: บีบ response ตาม Accept-Encoding"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = None if "range" in headers else negotiate(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(send, encoding))
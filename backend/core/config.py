@@ -5,6 +5,7 @@ config.py - การตั้งค่าแอปพลิเคชัน (Con
 - อ่านค่าตั้งค่าจากไฟล์ .env (environment variables)
 - เก็บค่าคงที่ต่างๆ เช่น DATABASE_URL, SECRET_KEY, token expiration
 - กำหนด path สำหรับเก็บไฟล์ media (รูปภาพ avatars)
+- ตั้งค่าการอัปโหลดรูป diary (ขนาดสูงสุด, ขนาด thumbnail, จำนวน worker)
 
 ค่าที่ต้องตั้งใน .env:
 - DATABASE_URL: connection string สำหรับ PostgreSQL
@@ -18,12 +19,76 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     env: str = Field("dev", alias="ENV")  # สภาพแวดล้อม (dev/prod)
     database_url: str = Field(..., alias="DATABASE_URL")  # URL สำหรับเชื่อมต่อ PostgreSQL
+    async_database_url: str | None = Field(None, alias="ASYNC_DATABASE_URL")  # URL สำหรับ async engine (ไม่ตั้ง = DATABASE_URL + asyncpg)
+    # Connection pool (ใช้ค่าเดียวกันทั้ง engine sync และ async ต่อ worker process)
+    db_pool_size: int = Field(5, ge=1, alias="DB_POOL_SIZE")  # connection ที่เปิดค้างไว้
+    db_max_overflow: int = Field(10, ge=0, alias="DB_MAX_OVERFLOW")  # เปิดเพิ่มชั่วคราวได้อีกกี่ตัวเมื่อ pool เต็ม
+    db_pool_timeout: float = Field(30, gt=0, alias="DB_POOL_TIMEOUT")  # รอ connection ว่างได้นานสุด (วินาที) ก่อน error
+    db_pool_recycle: int = Field(1800, alias="DB_POOL_RECYCLE")  # ปิด connection ที่อายุเกินนี้ (วินาที, -1 = ไม่ recycle)
+    db_pool_pre_ping: bool = Field(True, alias="DB_POOL_PRE_PING")  # ping ก่อนยืมทุกครั้ง (ปิดแล้วพึ่ง DB_POOL_RECYCLE แทน ประหยัด 1 round trip)
+    db_statement_timeout_ms: int = Field(0, ge=0, alias="DB_STATEMENT_TIMEOUT_MS")  # 0 = ไม่จำกัด
+    # ต่อผ่าน pgbouncer แบบ transaction pooling: ปิด prepared statement cache ของ asyncpg และไม่ส่ง startup options
+    db_pgbouncer: bool = Field(False, alias="DB_PGBOUNCER")
     secret_key: str = Field(..., alias="SECRET_KEY")  # Secret key สำหรับเข้ารหัส JWT
     access_token_expire_minutes: int = Field(30, alias="ACCESS_TOKEN_EXPIRE_MINUTES")  # Access token default 30 นาที
     refresh_token_expire_days: int = Field(7, alias="REFRESH_TOKEN_EXPIRE_DAYS")  # Refresh token default 7 วัน
     algorithm: str = "HS256"  # Algorithm สำหรับเข้ารหัส JWT
     media_dir: str = "media"  # Folder หลักสำหรับเก็บไฟล์ media
     avatars_dir: str = "media/avatars"  # Folder สำหรับเก็บรูป avatar ของ user
+    avatar_max_bytes: int = Field(5 * 1024 * 1024, alias="AVATAR_MAX_BYTES")  # ขนาดไฟล์ avatar สูงสุด 5 MB
+    # Diary images: ขนาดไฟล์สูงสุดต่อรูป และขนาดรูปย่อที่สร้างเป็น WebP
+    diary_image_max_bytes: int = Field(10 * 1024 * 1024, alias="DIARY_IMAGE_MAX_BYTES")  # 10 MB
+    image_thumbnail_px: int = Field(320, alias="IMAGE_THUMBNAIL_PX")  # รูปย่อในไทม์ไลน์
+    image_display_px: int = Field(1280, alias="IMAGE_DISPLAY_PX")  # รูปสำหรับเปิดดูเต็มจอ
+    image_workers: int = Field(2, alias="IMAGE_WORKERS")  # จำนวน thread สำหรับสร้างรูปย่อ
+    export_max_concurrent: int = Field(2, alias="EXPORT_MAX_CONCURRENT")  # จำนวน export (GET /profile/export) ที่ทำพร้อมกันได้
+    # prefix ของ internal location ใน nginx (เช่น "/_protected_media/") ถ้าตั้งไว้จะให้ nginx ส่งไฟล์ media ด้วย X-Accel-Redirect
+    media_accel_redirect: str | None = Field(None, alias="MEDIA_ACCEL_REDIRECT")
+    # Cache ข้อมูล user ที่ login (current_user ผ่าน core/cache.py) - TTL 0 = ปิด cache
+    auth_cache_ttl_seconds: float = Field(60, alias="AUTH_CACHE_TTL_SECONDS")
+    # Refresh token revocation: ขนาด Bloom filter ต่อ process และความถี่ในการ sync จากตาราง revoked_tokens
+    token_revocation_capacity: int = Field(100000, alias="TOKEN_REVOCATION_CAPACITY")
+    token_revocation_sync_seconds: float = Field(30, alias="TOKEN_REVOCATION_SYNC_SECONDS")
+    # Rate limit (core/rate_limit.py): ตั้ง RATE_LIMIT_REDIS_URL เพื่อนับร่วมกันทุก worker (default นับแยกใน process)
+    rate_limit_enabled: bool = Field(True, alias="RATE_LIMIT_ENABLED")
+    rate_limit_redis_url: str | None = Field(None, alias="RATE_LIMIT_REDIS_URL")
+    rate_limit_redis_timeout_seconds: float = Field(0.2, gt=0, alias="RATE_LIMIT_REDIS_TIMEOUT_SECONDS")  # Redis ช้ากว่านี้ปล่อย request ผ่าน
+    rate_limit_trust_forwarded: bool = Field(False, alias="RATE_LIMIT_TRUST_FORWARDED")  # ใช้ X-Forwarded-For (เปิดเมื่ออยู่หลัง proxy เท่านั้น)
+    # Prometheus metrics (GET /metrics): ตั้ง METRICS_MULTIPROC_DIR เมื่อรันหลาย worker เพื่อรวมค่าทุก worker
+    metrics_enabled: bool = Field(True, alias="METRICS_ENABLED")
+    metrics_multiproc_dir: str | None = Field(None, alias="METRICS_MULTIPROC_DIR")
+    metrics_flush_seconds: float = Field(5, alias="METRICS_FLUSH_SECONDS")  # ความถี่ที่แต่ละ worker เขียน snapshot
+    # Logging (core/logs.py): เขียนผ่านคิวใน thread แยก, ข้อความซ้ำถูกจำกัด/สุ่มเก็บ
+    log_level: str = Field("INFO", alias="LOG_LEVEL")
+    log_format: str = Field("json", pattern="^(json|text)$", alias="LOG_FORMAT")
+    log_queue_size: int = Field(10000, ge=1, alias="LOG_QUEUE_SIZE")  # record ที่รอเขียนได้สูงสุด (เกินนี้ทิ้ง)
+    log_body_preview_bytes: int = Field(512, ge=0, alias="LOG_BODY_PREVIEW_BYTES")
+    log_repeat_burst: int = Field(10, ge=0, alias="LOG_REPEAT_BURST")  # ข้อความเดิมผ่านได้กี่ครั้งต่อช่วง (0 = ไม่จำกัด)
+    log_repeat_window_seconds: float = Field(60, gt=0, alias="LOG_REPEAT_WINDOW_SECONDS")
+    log_repeat_sample_every: int = Field(100, ge=0, alias="LOG_REPEAT_SAMPLE_EVERY")  # เกิน burst แล้วเก็บ 1 ใน N (0 = ทิ้งหมด)
+    # บีบอัด response (core/compression.py): br/zstd ใช้ได้เมื่อติดตั้ง brotli/zstandard
+    compression_enabled: bool = Field(True, alias="COMPRESSION_ENABLED")
+    compression_encodings: str = Field("br,zstd,gzip", alias="COMPRESSION_ENCODINGS")  # ลำดับที่เลือกใช้
+    compression_min_bytes: int = Field(1024, ge=0, alias="COMPRESSION_MIN_BYTES")  # body เล็กกว่านี้ไม่บีบ
+    compression_gzip_level: int = Field(6, ge=1, le=9, alias="COMPRESSION_GZIP_LEVEL")
+    compression_brotli_quality: int = Field(4, ge=0, le=11, alias="COMPRESSION_BROTLI_QUALITY")
+    compression_zstd_level: int = Field(3, ge=1, le=22, alias="COMPRESSION_ZSTD_LEVEL")
+    compression_cache_entries: int = Field(128, ge=0, alias="COMPRESSION_CACHE_ENTRIES")  # body ที่บีบแล้วต่อ ETag (0 = ปิด)
+    # Query budget (core/query_budget.py): statement เดียวกันซ้ำกี่ครั้งใน request ถึง log เป็น N+1 (0 = ปิด)
+    query_n_plus_one_threshold: int = Field(5, ge=0, alias="QUERY_N_PLUS_ONE_THRESHOLD")
+    query_budget_strict: bool = Field(False, alias="QUERY_BUDGET_STRICT")  # เกินงบของ endpoint แล้วโยน error (ใช้ใน CI/test)
+    # Cache (core/cache.py): ตั้ง CACHE_REDIS_URL เพื่อใช้ cache และ invalidate ร่วมกันทุก worker (default cache แยกใน process)
+    cache_enabled: bool = Field(True, alias="CACHE_ENABLED")
+    cache_redis_url: str | None = Field(None, alias="CACHE_REDIS_URL")  # redis://, unix:// หรือ fakeredis:// (test)
+    cache_local_max_entries: int = Field(10000, ge=0, alias="CACHE_LOCAL_MAX_ENTRIES")  # entry ใน process ต่อ worker
+    cache_default_ttl_seconds: float = Field(300, ge=0, alias="CACHE_DEFAULT_TTL_SECONDS")
+    cache_community_ttl_seconds: float = Field(120, ge=0, alias="CACHE_COMMUNITY_TTL_SECONDS")  # ข้อมูลรวมทุก user ใน /trends/summary (ไม่ invalidate, หมดอายุตาม TTL)
+    cache_version_ttl_seconds: float = Field(1, gt=0, alias="CACHE_VERSION_TTL_SECONDS")  # worker อื่นเห็นการ invalidate ช้าสุดเท่านี้
+    cache_lock_seconds: float = Field(5, gt=0, alias="CACHE_LOCK_SECONDS")  # single-flight ข้าม worker: รอ worker ที่กำลังโหลดได้นานสุด
+    bcrypt_rounds: int = Field(12, ge=4, le=31, alias="BCRYPT_ROUNDS")  # bcrypt cost (hash เดิมที่ cost ต่างจากนี้จะถูก hash ใหม่ตอน login)
+    # bcrypt: จำนวน process และจำนวนงานสูงสุดที่รอ/กำลังทำ (เกินนี้ตอบ 503)
+    password_workers: int = Field(2, alias="PASSWORD_WORKERS")
+    password_queue_limit: int = Field(16, alias="PASSWORD_QUEUE_LIMIT")
     # Password policy (can be overridden via .env)
     password_min_length: int = Field(8, alias="PASSWORD_MIN_LENGTH")
     password_require_upper: bool = Field(True, alias="PASSWORD_REQUIRE_UPPER")
@@ -0,0 +1,163 @@
+"""
+db_pool.py - ตัวเลือกของ connection pool และ metrics ของการยืม connection
+
+หน้าที่หลัก:
+- engine_options(): kwargs สำหรับ create_engine / create_async_engine จาก settings
+  (pool_size, max_overflow, pool_timeout, pool_recycle, pre-ping, statement_timeout, โหมด pgbouncer)
+- TimedQueuePool / TimedAsyncQueuePool: QueuePool ที่จับเวลารอ connection ทุกครั้งที่ยืม
+  นับจำนวนครั้งที่ยืม, เวลารอรวม/สูงสุด, จำนวนครั้งที่รอจน timeout
+- snapshot(pool): สถานะตอนนี้ (checked out, overflow, ว่างใน pool) + ตัวนับข้างบน
+- PoolWaitMiddleware: รวมเวลารอ connection ของแต่ละ request แล้วส่งกลับใน header Server-Timing (db-wait)
+
+โหมด pgbouncer (DB_PGBOUNCER=true, transaction pooling):
+- แต่ละ transaction อาจได้ backend คนละตัว จึงห้ามมี state ฝั่ง server ข้าม transaction
+- asyncpg: ปิด statement cache และตั้งชื่อ prepared statement แบบสุ่ม (ไม่ชนกันข้าม backend)
+- ไม่ส่ง statement_timeout เป็น startup option (pgbouncer ไม่รับ) ให้ตั้งที่ role แทน:
+      ALTER ROLE planary SET statement_timeout = '5s';
+- psycopg2 ไม่ใช้ prepared statement อยู่แล้ว server-side cursor (yield_per) อยู่ใน transaction เดียว ใช้ได้
+"""
+
+import contextvars
+import threading
+import time
+import uuid
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from core.config import settings
+
+# เวลารอ connection (วินาที) ของ request ปัจจุบัน - ใช้ list ให้ thread ที่ copy context ไปยังเขียนกลับมาได้
+_request_wait: contextvars.ContextVar[list | None] = contextvars.ContextVar("db_pool_request_wait", default=None)
+
+
+class _PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_sum += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        holder = _request_wait.get()
+        if holder is not None:
+            holder[0] += waited
+
+
+class _TimedGetMixin:
+    """จับเวลา _do_get (รอจนได้ connection จาก queue หรือเปิดใหม่ใน overflow)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = _PoolStats()
+
+    def recreate(self):
+        # dispose()/recreate() สร้าง pool ใหม่ ให้ตัวนับต่อเนื่อง
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started, timed_out=False)
+        return conn
+
+
+class TimedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(is_async: bool) -> dict:
+    """kwargs ของ create_engine (is_async=False, psycopg2) หรือ create_async_engine (asyncpg)"""
+    options = {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    connect_args = {}
+    if settings.db_pgbouncer:
+        if is_async:
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4().hex}__"
+    elif settings.db_statement_timeout_ms:
+        timeout = str(settings.db_statement_timeout_ms)
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": timeout}
+        else:
+            connect_args["options"] = f"-c statement_timeout={timeout}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def snapshot(pool) -> dict:
+    stats = getattr(pool, "stats", None)
+    data = {
+        "pool_size": pool.size(),
+        "max_overflow": settings.db_max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool.overflow() ติดลบจนกว่าจะเปิดครบ pool_size
+        "overflow": max(0, pool.overflow()),
+    }
+    if stats is not None:
+        with stats.lock:
+            data.update({
+                "checkouts_total": stats.checkouts,
+                "timeouts_total": stats.timeouts,
+                "wait_seconds_sum": round(stats.wait_seconds_sum, 6),
+                "wait_seconds_max": round(stats.wait_seconds_max, 6),
+                "wait_seconds_avg": round(stats.wait_seconds_sum / stats.checkouts, 6) if stats.checkouts else None,
+            })
+    return data
+
+
+class PoolWaitMiddleware:
+    """
+    ASGI middleware: เพิ่ม header "Server-Timing: db-wait;dur=<ms>" ให้ทุก response ที่ยืม connection
+    ดูได้จาก devtools/log ของ proxy ว่า request ที่ช้า ช้าเพราะรอ pool หรือเพราะ query
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        holder = [0.0]
+        token = _request_wait.set(holder)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and holder[0] > 0:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"db-wait;dur={holder[0] * 1000:.1f}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_wait.reset(token)
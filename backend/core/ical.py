@@ -0,0 +1,155 @@
+"""
+ical.py - Helper สำหรับสร้างข้อมูล iCalendar (RFC 5545)
+
+หน้าที่หลัก:
+- escape ข้อความตามกฎของ iCalendar (\\, ;, , และขึ้นบรรทัดใหม่)
+- พับบรรทัด (line folding) ให้ไม่เกิน 75 octets ต่อบรรทัด
+- แปลง date/time/datetime เป็นรูปแบบที่ iCalendar ใช้
+- สร้าง VEVENT ทีละรายการเป็น string (ใช้กับ StreamingResponse ได้)
+
+หมายเหตุ:
+- เวลาใน Activity/RoutineActivity ไม่มี timezone จึงส่งเป็น "floating time"
+  (ปฏิทินฝั่ง client จะแสดงตาม timezone ของเครื่อง)
+- ทุกบรรทัดจบด้วย CRLF ตามมาตรฐาน
+"""
+
+import datetime
+from typing import Iterable
+
+CRLF = "\r\n"
+PRODID = "-//Planary//Planary API//TH"
+
+# RRULE BYDAY ใช้ตัวย่อ 2 ตัวอักษร
+BYDAY = {
+    "mon": "MO",
+    "tue": "TU",
+    "wed": "WE",
+    "thu": "TH",
+    "fri": "FR",
+    "sat": "SA",
+    "sun": "SU",
+}
+
+
+def escape_text(value) -> str:
+    """Escape TEXT value ตาม RFC 5545 section 3.3.11"""
+    if value is None:
+        return ""
+    text = str(value)
+    text = text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+    return text.replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+
+
+def fold_line(line: str) -> str:
+    """พับบรรทัดยาวเกิน 75 octets (นับเป็น UTF-8 bytes ไม่ตัดกลางตัวอักษร)"""
+    if len(line.encode("utf-8")) <= 75:
+        return line + CRLF
+    parts = []
+    current = ""
+    size = 0
+    limit = 75
+    for ch in line:
+        ch_size = len(ch.encode("utf-8"))
+        if size + ch_size > limit:
+            parts.append(current)
+            current = ""
+            size = 0
+            limit = 74  # บรรทัดต่อเนื่องขึ้นต้นด้วย space 1 ตัว
+        current += ch
+        size += ch_size
+    parts.append(current)
+    return (CRLF + " ").join(parts) + CRLF
+
+
+def format_date(value: datetime.date) -> str:
+    return value.strftime("%Y%m%d")
+
+
+def format_local_datetime(day: datetime.date, at: datetime.time) -> str:
+    return f"{format_date(day)}T{at.strftime('%H%M%S')}"
+
+
+def format_utc(value: datetime.datetime | None) -> str:
+    if value is None:
+        value = datetime.datetime.now(datetime.timezone.utc)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def calendar_header(name: str) -> str:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ]
+    return "".join(fold_line(line) for line in lines)
+
+
+def calendar_footer() -> str:
+    return "END:VCALENDAR" + CRLF
+
+
+def dtstart_lines(prop: str, day: datetime.date, at: datetime.time | None) -> list[str]:
+    """DTSTART/RECURRENCE-ID: ถ้าไม่มีเวลาให้เป็นกิจกรรมทั้งวัน (VALUE=DATE)"""
+    if at is None:
+        return [f"{prop};VALUE=DATE:{format_date(day)}"]
+    return [f"{prop}:{format_local_datetime(day, at)}"]
+
+
+def build_event(
+    uid: str,
+    day: datetime.date,
+    at: datetime.time | None,
+    summary: str,
+    *,
+    stamp: datetime.datetime | None = None,
+    description: str | None = None,
+    category: str | None = None,
+    status: str | None = None,
+    rrule: str | None = None,
+    recurrence_of: tuple[datetime.date, datetime.time | None] | None = None,
+    alarm_minutes: int | None = None,
+    extra: Iterable[str] = (),
+) -> str:
+    """
+    สร้าง VEVENT หนึ่งรายการ
+
+    Args:
+        uid: UID ที่คงที่ (ใช้ id ของ record) เพื่อให้ client อัปเดตรายการเดิมได้
+        day/at: วันและเวลาเริ่ม (at=None คือทั้งวัน)
+        rrule: เช่น "FREQ=WEEKLY;BYDAY=MO" สำหรับ routine
+        recurrence_of: (date, time) ของ instance ที่ถูก override (RECURRENCE-ID)
+        alarm_minutes: ถ้ามี จะเพิ่ม VALARM แจ้งเตือนก่อนกี่นาที
+    """
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{format_utc(stamp)}",
+    ]
+    lines.extend(dtstart_lines("DTSTART", day, at))
+    if recurrence_of is not None:
+        lines.extend(dtstart_lines("RECURRENCE-ID", recurrence_of[0], recurrence_of[1]))
+    if rrule:
+        lines.append(f"RRULE:{rrule}")
+    lines.append(f"SUMMARY:{escape_text(summary)}")
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    if category:
+        lines.append(f"CATEGORIES:{escape_text(category)}")
+    if status:
+        lines.append(f"STATUS:{status}")
+    lines.extend(extra)
+    if alarm_minutes is not None and alarm_minutes > 0:
+        lines.extend([
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{escape_text(summary)}",
+            f"TRIGGER:-PT{int(alarm_minutes)}M",
+            "END:VALARM",
+        ])
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
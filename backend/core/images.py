@@ -0,0 +1,77 @@
+"""
+images.py - Helper สำหรับอ่านข้อมูลไฟล์รูปภาพ
+
+หน้าที่หลัก:
+- อ่านขนาดรูป (width, height) จาก header ของไฟล์ JPEG / PNG / WebP
+  โดยอ่านเฉพาะส่วนต้นของไฟล์ ไม่ต้อง decode ทั้งรูปและไม่ต้องพึ่ง library ภายนอก
+
+ถ้าอ่านไม่ได้ (ไฟล์เสีย/รูปแบบไม่รองรับ) จะคืน None
+"""
+
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+# ขนาด header ที่อ่านสำหรับ PNG/WebP (JPEG ต้องไล่ segment จึงอ่านแบบ stream)
+_HEADER_SIZE = 32
+
+
+def _png_size(head: bytes):
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    return None
+
+
+def _webp_size(head: bytes):
+    if head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        b = head[21:25]
+        w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return w, h
+    if chunk == b"VP8X" and len(head) >= 30:
+        w = 1 + int.from_bytes(head[24:27], "little")
+        h = 1 + int.from_bytes(head[27:30], "little")
+        return w, h
+    return None
+
+
+def _jpeg_size(f: BinaryIO):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        # marker ที่ไม่มีความยาวตามหลัง
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        # SOF0..SOF15 (ยกเว้น DHT/JPG/DAC) เก็บขนาดรูป
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return w, h
+        f.seek(length - 2, 1)
+
+
+def read_image_size(path: Path) -> tuple[int, int] | None:
+    """คืน (width, height) ของรูป หรือ None ถ้าอ่านไม่ได้"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_HEADER_SIZE)
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+            return _png_size(head) or _webp_size(head)
+    except (OSError, struct.error):
+        return None
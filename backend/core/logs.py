@@ -0,0 +1,223 @@
+"""
+logs.py - Logging แบบ structured (JSON) ที่ไม่เขียน IO บน event loop
+
+หน้าที่หลัก:
+- configure(): ตั้ง root logger ให้ส่ง record เข้าคิว (QueueHandler) แล้วให้ thread ของ QueueListener
+  เป็นคนจัดรูปแบบ + เขียน stdout - request ไม่ต้องรอ IO ของ log
+    - LOG_FORMAT=json (default): หนึ่งบรรทัดต่อ record {"ts","level","logger","msg","request_id",...extra}
+    - LOG_FORMAT=text: สำหรับอ่านเองตอน dev
+    - คิวเต็ม (LOG_QUEUE_SIZE) → ทิ้ง record แล้วนับไว้ ไม่ block request
+- RepeatFilter: ข้อความเดียวกัน (logger + level + template) ผ่านได้ LOG_REPEAT_BURST ครั้งต่อ LOG_REPEAT_WINDOW_SECONDS
+  เกินนั้นสุ่มผ่าน 1 ใน LOG_REPEAT_SAMPLE_EVERY ที่เหลือทิ้ง - record ถัดไปที่ผ่านมีฟิลด์ suppressed บอกจำนวนที่ทิ้งไป
+  (client ที่ส่ง body ผิดรัว ๆ จึงไม่ท่วม log)
+- RequestIdMiddleware: request id ต่อ request (รับจาก header X-Request-ID ถ้ารูปแบบถูก ไม่งั้นสร้างใหม่)
+  ใส่ลงทุก log ของ request นั้น และส่งกลับใน response header X-Request-ID
+- preview(): ตัด body/ข้อความยาว ๆ ก่อน log (LOG_BODY_PREVIEW_BYTES)
+
+ใช้ใน main.lifespan: configure() ตอน startup, shutdown() ตอนปิด (เขียน record ที่ค้างในคิวให้หมด)
+log ของ uvicorn (access/error) ยังใช้ handler ของ uvicorn เหมือนเดิม
+"""
+
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from core.config import settings
+
+REQUEST_ID_HEADER = b"x-request-id"
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._\-]{1,64}$")
+_MAX_REPEAT_KEYS = 1000
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# attribute มาตรฐานของ LogRecord - ที่เหลือคือ extra={...} ของผู้เรียก
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+stats = {"dropped": 0, "suppressed": 0}
+_listener: QueueListener | None = None
+_handler: QueueHandler | None = None
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+def preview(value, limit: int | None = None) -> str:
+    """ข้อความสำหรับ log ที่ยาวไม่เกิน limit (default LOG_BODY_PREVIEW_BYTES) พร้อมบอกความยาวจริงถ้าถูกตัด"""
+    limit = settings.log_body_preview_bytes if limit is None else limit
+    if isinstance(value, (bytes, bytearray)):
+        text = bytes(value[:limit]).decode("utf-8", errors="replace")
+        size = len(value)
+    else:
+        text = str(value)
+        size = len(text)
+        text = text[:limit]
+    return text if size <= limit else f"{text}... ({size} total)"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """ใส่ request id ของ context ปัจจุบันลง record (ต้องรันฝั่งผู้เรียก ก่อนเข้าคิว)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """จำกัดจำนวนครั้งของข้อความซ้ำต่อช่วงเวลา เกินแล้วสุ่มผ่านบางส่วน"""
+
+    def __init__(self, burst: int, window_seconds: float, sample_every: int):
+        super().__init__()
+        self.burst = burst
+        self.window = window_seconds
+        self.sample_every = sample_every
+        self._lock = threading.Lock()
+        # key -> [เริ่ม window, จำนวนใน window, จำนวนที่ทิ้งตั้งแต่ record ล่าสุดที่ผ่าน]
+        self._seen: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None:
+                if len(self._seen) >= _MAX_REPEAT_KEYS:
+                    self._seen.clear()
+                entry = self._seen[key] = [now, 0, 0]
+            elif now - entry[0] >= self.window:
+                entry[0], entry[1] = now, 0
+            entry[1] += 1
+            allowed = entry[1] <= self.burst or (
+                self.sample_every > 0 and random.randrange(self.sample_every) == 0
+            )
+            if not allowed:
+                entry[2] += 1
+                stats["suppressed"] += 1
+                return False
+            if entry[2]:
+                record.suppressed = entry[2]
+                entry[2] = 0
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # format message/traceback ตอนนี้ (args อาจเปลี่ยนค่าก่อน listener จะได้ทำ) แต่เก็บ extra ไว้ให้ JsonFormatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+def _formatter() -> logging.Formatter:
+    if settings.log_format == "text":
+        return logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    return JsonFormatter()
+
+
+def configure() -> None:
+    """ตั้ง root logger + เริ่ม thread ของ QueueListener (เรียกซ้ำได้ ไม่ทำอะไร)"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(_formatter())
+
+    _handler = _NonBlockingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _handler.addFilter(RequestIdFilter())
+    _handler.addFilter(RepeatFilter(
+        settings.log_repeat_burst,
+        settings.log_repeat_window_seconds,
+        settings.log_repeat_sample_every,
+    ))
+
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    root.addHandler(_handler)
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown() -> None:
+    """หยุด listener หลังเขียน record ที่ค้างในคิวจนหมด"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    _listener = _handler = None
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: ตั้ง request id ของ request และส่งกลับใน header X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
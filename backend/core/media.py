@@ -0,0 +1,163 @@
+"""
+media.py - เสิร์ฟไฟล์ใน folder media (/media/...) พร้อม header สำหรับ cache
+
+หน้าที่หลัก:
+- ไฟล์ที่ชื่อเป็น hash/UUID (avatars, diary_images, รูปย่อ WebP) เนื้อหาไม่เปลี่ยนตลอดอายุ URL
+  จึงส่ง Cache-Control: public, max-age=1 ปี, immutable ให้ client/CDN ไม่ต้องโหลดซ้ำ
+- ไฟล์อื่นๆ ส่ง Cache-Control: no-cache (client ต้อง revalidate ด้วย ETag ทุกครั้ง)
+- ETag / If-None-Match / If-Modified-Since -> 304, Range -> 206 (จาก StaticFiles/FileResponse)
+  avatar แบบ content-addressed ใช้ SHA-256 ในชื่อไฟล์เป็น ETag ตรงๆ
+- ส่งไฟล์แบบ zero-copy:
+    - ถ้า server รองรับ ASGI extension "http.response.pathsend" FileResponse จะให้ server ส่งไฟล์เอง
+    - ถ้าตั้ง MEDIA_ACCEL_REDIRECT (เช่น "/_protected_media/") จะตอบ X-Accel-Redirect
+      ให้ nginx ส่งไฟล์ด้วย sendfile แทน Python
+- รูปย่อ WebP: ถ้า client ไม่รับ image/webp (ดูจาก Accept) จะส่งต้นฉบับแทน
+
+หมายเหตุ:
+- รูป diary ต้นฉบับถูกเขียนทับหนึ่งครั้งตอน worker ลบ EXIF (core/thumbnails.py)
+  จึงส่ง immutable ให้ต้นฉบับก็ต่อเมื่อมีรูปย่อแล้ว (ประมวลผลเสร็จ ไฟล์จะไม่เปลี่ยนอีก)
+"""
+
+import os
+import re
+import stat
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from core import thumbnails
+from core.avatars import AVATAR_SIZES
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# ชื่อไฟล์ที่เนื้อหาไม่เปลี่ยน: SHA-256 (avatar ใหม่) หรือ UUID (avatar เก่า, รูป diary)
+# UUID รับทั้งแบบ hex ล้วน (uuid4().hex) และแบบมีขีด (str(uuid4()) ของไฟล์รุ่นเก่า)
+_UUID = r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}"
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_UUID_NAME = re.compile(r"^%s$" % _UUID)
+# รูปย่อ avatar: <sha256>_<px>.webp
+_AVATAR_VARIANT = re.compile(r"^([0-9a-f]{64})_(\d+)$")
+# รูปย่อ diary: _variants/<uuid>.<thumb|display>.webp
+_DIARY_VARIANT = re.compile(r"^(%s)\.(%s)$" % (_UUID, "|".join(thumbnails.VARIANTS)))
+
+_ORIGINAL_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def accepts_webp(request_headers: Headers) -> bool:
+    """
+    client รับ WebP ได้หรือไม่
+    - ระบุ image/webp มา = รับ (ยกเว้น q=0)
+    - ระบุชนิดรูปอื่นแบบเจาะจงแต่ไม่มี webp (เช่น browser รุ่นเก่า) = ไม่รับ
+    - ไม่ส่ง Accept หรือมีแต่ wildcard (*/*, image/*) เช่น mobile app = รับ
+    """
+    accept = request_headers.get("accept")
+    if not accept:
+        return True
+    specific_image = False
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        if media_type == "image/webp":
+            return "q=0" not in params.replace(" ", "").split(";")
+        if media_type.startswith("image/") and media_type != "image/*":
+            specific_image = True
+    return not specific_image
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles ที่ตั้ง Cache-Control/ETag สำหรับไฟล์ชื่อ unique และเลือก WebP ตาม Accept"""
+
+    def __init__(self, *args, accel_redirect: str | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.accel_redirect = accel_redirect.rstrip("/") + "/" if accel_redirect else None
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # ไม่เสิร์ฟไฟล์ซ่อน/ไฟล์ชั่วคราวระหว่างอัปโหลด (.upload-*.tmp, *.tmp)
+        parts = Path(path).parts
+        if any(part.startswith(".") for part in parts) or path.endswith(".tmp"):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        path = Path(full_path)
+        headers = {}
+
+        fallback = self._webp_fallback(path)
+        if fallback is not None:
+            headers["vary"] = "Accept"
+            if not accepts_webp(request_headers):
+                try:
+                    fallback_stat = os.stat(fallback)
+                except OSError:
+                    fallback_stat = None
+                if fallback_stat is not None and stat.S_ISREG(fallback_stat.st_mode):
+                    path, stat_result = fallback, fallback_stat
+
+        headers["cache-control"] = self._cache_control(path)
+        if _SHA256_NAME.match(path.stem):
+            headers["etag"] = f'"{path.stem}"'
+
+        if self.accel_redirect is not None:
+            response = self._accel_response(path, stat_result, headers)
+        else:
+            # FileResponse จัดการ Range และ pathsend เอง; header ที่ส่งไปจะไม่ถูก setdefault ทับ
+            response = FileResponse(path, status_code=status_code, headers=headers, stat_result=stat_result)
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _accel_response(self, path: Path, stat_result: os.stat_result, headers: dict) -> Response:
+        """ให้ nginx ส่งไฟล์แทน (sendfile + Range) - เราตั้งแค่ header"""
+        relative = path.resolve().relative_to(Path(self.directory).resolve()).as_posix()
+        response = Response(status_code=200, headers=headers)
+        response.headers["x-accel-redirect"] = f"{self.accel_redirect}{relative}"
+        response.headers.setdefault("etag", f'"{int(stat_result.st_mtime)}-{stat_result.st_size}"')
+        # nginx ตั้ง Content-Type/Length จากไฟล์เอง ไม่ให้ Response ใส่ content-length: 0
+        del response.headers["content-length"]
+        return response
+
+    def _webp_fallback(self, path: Path) -> Path | None:
+        """ถ้า path เป็นรูปย่อ WebP คืน path ของต้นฉบับ (ใช้กับ client ที่ไม่รับ WebP)"""
+        if path.suffix != ".webp":
+            return None
+        match = _AVATAR_VARIANT.match(path.stem)
+        if match and int(match.group(2)) in AVATAR_SIZES:
+            return self._find_original(path.parent, match.group(1))
+        match = _DIARY_VARIANT.match(path.stem)
+        if match and path.parent.name == thumbnails.VARIANTS_DIR:
+            return self._find_original(path.parent.parent, match.group(1))
+        return None
+
+    @staticmethod
+    def _find_original(folder: Path, stem: str) -> Path | None:
+        for ext in _ORIGINAL_EXTS:
+            candidate = folder / f"{stem}{ext}"
+            if candidate.exists():
+                return candidate
+        return None
+
+    @staticmethod
+    def _cache_control(path: Path) -> str:
+        stem = path.stem
+        if _SHA256_NAME.match(stem) or _AVATAR_VARIANT.match(stem) or _DIARY_VARIANT.match(stem):
+            return IMMUTABLE_CACHE_CONTROL
+        if _UUID_NAME.match(stem):
+            if path.parent.parent.name == "diary_images":
+                # ต้นฉบับรูป diary: รอ worker ลบ EXIF เสร็จก่อน (ดูจากรูปย่อ) จึง immutable
+                done = thumbnails.variant_path(path, thumbnails.VARIANTS[0]).exists()
+                return IMMUTABLE_CACHE_CONTROL if done else REVALIDATE_CACHE_CONTROL
+            return IMMUTABLE_CACHE_CONTROL
+        return REVALIDATE_CACHE_CONTROL
@@ -0,0 +1,386 @@
+"""
+metrics.py - Metrics แบบ Prometheus (text exposition format) สำหรับ GET /metrics
+
+หน้าที่หลัก:
+- MetricsMiddleware: วัดทุก HTTP request ตาม route แบบ template (เช่น /diary/{diary_id} ไม่ใช่ id จริง)
+    - planary_http_requests_total{method,route,status}
+    - planary_http_request_duration_seconds (histogram)
+    - planary_http_requests_in_progress (gauge)
+    - planary_http_request_db_queries / planary_http_request_db_seconds (histogram: จำนวน query และเวลา DB ต่อ request)
+    - planary_query_budget_exceeded_total (request ที่ใช้ query เกินงบของ endpoint - core/query_budget.py)
+- เปิด QueryStats ของ core/query_budget ต่อ request (ทำเสมอแม้ METRICS_ENABLED=false เพื่อให้ตรวจ N+1/งบ query ได้)
+- render(): รวม metrics ของ process นี้ + สถานะ pool (DB, bcrypt, threadpool ของ Starlette) เป็น text
+
+การนับไม่ใช้ lock:
+- ตัวนับ/histogram กลางถูกแก้เฉพาะใน middleware ซึ่งรันบน event loop thread เดียว
+- event ของ SQLAlchemy (อาจรันใน threadpool) เขียนลง QueryStats ของ request ตัวเองเท่านั้น (ContextVar)
+  middleware ค่อยรวมเข้าตัวนับกลางตอน request จบ - query ที่ไม่อยู่ใน request (worker/script) ไม่ถูกนับ
+
+หลาย worker (uvicorn --workers N): ตั้ง METRICS_MULTIPROC_DIR
+- แต่ละ worker เขียน snapshot ลง <dir>/<pid>.json ทุก METRICS_FLUSH_SECONDS (และตอน shutdown)
+- worker ที่รับ /metrics รวมของทุกไฟล์: counter/histogram รวมทุกไฟล์ (รวม worker ที่ตายไปแล้ว ค่าไม่ลดลง)
+  gauge รวมเฉพาะ worker ที่ยังมีชีวิต
+- ควรล้างโฟลเดอร์ก่อน start server ใหม่ทั้งชุด (เหมือน prometheus_client multiprocess mode)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import anyio.to_thread
+from starlette.routing import Match, Mount
+
+from core import cache, compression, db_pool, logs, password_pool, query_budget
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "planary_http_requests_total": ("counter", "HTTP requests by route template and status", None),
+    "planary_http_request_duration_seconds": ("histogram", "HTTP request latency", LATENCY_BUCKETS),
+    "planary_http_requests_in_progress": ("gauge", "HTTP requests currently being served", None),
+    "planary_http_request_db_queries": ("histogram", "SQL statements executed per HTTP request", DB_QUERY_BUCKETS),
+    "planary_http_request_db_seconds": ("histogram", "Time spent in SQL statements per HTTP request", DB_TIME_BUCKETS),
+    "planary_query_budget_exceeded_total": ("counter", "HTTP requests that ran more SQL statements than the endpoint's budget", None),
+    "planary_db_pool_size": ("gauge", "Configured connection pool size", None),
+    "planary_db_pool_checked_out": ("gauge", "Connections currently checked out", None),
+    "planary_db_pool_checked_in": ("gauge", "Idle connections in the pool", None),
+    "planary_db_pool_overflow": ("gauge", "Overflow connections currently open", None),
+    "planary_db_pool_checkouts_total": ("counter", "Connection checkouts", None),
+    "planary_db_pool_timeouts_total": ("counter", "Checkouts that timed out waiting for a connection", None),
+    "planary_db_pool_wait_seconds_total": ("counter", "Time spent waiting for a connection", None),
+    "planary_password_pool_in_flight": ("gauge", "bcrypt jobs queued or running", None),
+    "planary_password_pool_rejected_total": ("counter", "bcrypt jobs rejected because the queue was full", None),
+    "planary_password_pool_operations_total": ("counter", "bcrypt jobs completed", None),
+    "planary_password_pool_seconds_total": ("counter", "Time spent on bcrypt jobs including queueing", None),
+    "planary_log_records_dropped_total": ("counter", "Log records dropped because the log queue was full", None),
+    "planary_log_records_suppressed_total": ("counter", "Repeated log records suppressed by rate limiting", None),
+    "planary_compressed_responses_total": ("counter", "Responses compressed by CompressionMiddleware", None),
+    "planary_compression_bytes_in_total": ("counter", "Uncompressed bytes of compressed responses", None),
+    "planary_compression_bytes_out_total": ("counter", "Bytes sent after compression", None),
+    "planary_compression_cache_hits_total": ("counter", "Compressed bodies served from the ETag cache", None),
+    "planary_cache_hits_total": ("counter", "Cache hits by tier (local = in-process, shared = Redis)", None),
+    "planary_cache_misses_total": ("counter", "Cache misses that ran the loader", None),
+    "planary_cache_coalesced_total": ("counter", "Cache misses served by another request's in-flight load", None),
+    "planary_cache_errors_total": ("counter", "Failed calls to the shared cache tier", None),
+    "planary_threadpool_busy": ("gauge", "Threadpool tokens in use (sync endpoints, file IO)", None),
+    "planary_threadpool_size": ("gauge", "Threadpool capacity", None),
+    "planary_threadpool_waiting": ("gauge", "Tasks waiting for a threadpool token", None),
+}
+
+class _Registry:
+    """ตัวนับของ process นี้ (แก้จาก event loop thread เท่านั้น)"""
+
+    def __init__(self):
+        # name -> {labels (tuple ของคู่ (key, value)): ค่า}
+        self.counters: dict[str, dict[tuple, float]] = {}
+        # name -> {labels: [นับต่อ bucket..., นับที่เกิน bucket สุดท้าย, sum]}
+        self.histograms: dict[str, dict[tuple, list]] = {}
+        self.in_progress: dict[tuple, int] = {}
+
+    def inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        buckets = METRICS[name][2]
+        series = self.histograms.setdefault(name, {})
+        data = series.get(labels)
+        if data is None:
+            data = series[labels] = [0] * (len(buckets) + 2)
+        index = len(buckets)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                index = i
+                break
+        data[index] += 1
+        data[-1] += value
+
+
+registry = _Registry()
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+
+def _first_segment(path: str) -> str:
+    return path.split("/", 2)[1] if path.startswith("/") and len(path) > 1 else ""
+
+
+class MetricsMiddleware:
+    """ASGI middleware: วัด latency/สถานะ/จำนวน query ต่อ request ตาม route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict[str, list] | None = None
+
+    def _index_routes(self, routes) -> dict[str, list]:
+        # จัดกลุ่ม route ตาม segment แรกของ path ไม่ต้องไล่ match ทุก route ทุก request
+        # route ที่ segment แรกเป็น parameter อยู่ในกลุ่ม "*" (ลองกับทุก path)
+        index: dict[str, list] = {"*": []}
+        for route in routes:
+            segment = _first_segment(getattr(route, "path", ""))
+            index.setdefault("*" if "{" in segment else segment, []).append(route)
+        return index
+
+    def _resolve(self, scope) -> tuple[str, object]:
+        """(route template, endpoint) ของ request - endpoint ใช้อ่านงบ query"""
+        if self._routes is None:
+            self._routes = self._index_routes(scope["app"].router.routes)
+        candidates = self._routes.get(_first_segment(scope["path"]), []) + self._routes["*"]
+        partial = None
+        for route in candidates:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                if isinstance(route, Mount):
+                    return f"{route.path}/{{path}}", None
+                return route.path, getattr(route, "endpoint", None)
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path  # path ตรงแต่ method ไม่ตรง (405)
+        # path ที่ไม่มี route รวมเป็นค่าเดียว ไม่ให้จำนวน series โตตาม URL ที่ client ส่งมา
+        return partial or "unmatched", None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route, endpoint = self._resolve(scope)
+        stats = query_budget.QueryStats(budget=query_budget.budget_for(endpoint))
+        token = query_budget.activate(stats)
+        if not settings.metrics_enabled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                query_budget.deactivate(token)
+                query_budget.report(stats, scope["method"], route)
+            return
+
+        labels = (("method", scope["method"]), ("route", route))
+        registry.in_progress[labels] = registry.in_progress.get(labels, 0) + 1
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            query_budget.deactivate(token)
+            query_budget.report(stats, scope["method"], route)
+            registry.in_progress[labels] -= 1
+            registry.inc("planary_http_requests_total", labels + (("status", str(status)),))
+            registry.observe("planary_http_request_duration_seconds", labels, elapsed)
+            registry.observe("planary_http_request_db_queries", labels, stats.count)
+            registry.observe("planary_http_request_db_seconds", labels, stats.seconds)
+            if stats.budget is not None and stats.count > stats.budget:
+                registry.inc("planary_query_budget_exceeded_total", labels)
+
+
+# -------------------------------
+# Collection / exposition
+# -------------------------------
+
+def _collect_process(pools: dict) -> tuple[dict, dict]:
+    """(gauges, counters) ที่อ่านจากสถานะปัจจุบันของ process (ต้องเรียกบน event loop)"""
+    gauges: dict[str, dict[tuple, float]] = {
+        "planary_http_requests_in_progress": {k: v for k, v in registry.in_progress.items() if v},
+    }
+    counters: dict[str, dict[tuple, float]] = {}
+
+    def put(target, name, labels, value):
+        target.setdefault(name, {})[labels] = value
+
+    for engine_name, pool in pools.items():
+        labels = (("engine", engine_name),)
+        snap = db_pool.snapshot(pool)
+        put(gauges, "planary_db_pool_size", labels, snap["pool_size"])
+        put(gauges, "planary_db_pool_checked_out", labels, snap["checked_out"])
+        put(gauges, "planary_db_pool_checked_in", labels, snap["checked_in"])
+        put(gauges, "planary_db_pool_overflow", labels, snap["overflow"])
+        if "checkouts_total" in snap:
+            put(counters, "planary_db_pool_checkouts_total", labels, snap["checkouts_total"])
+            put(counters, "planary_db_pool_timeouts_total", labels, snap["timeouts_total"])
+            put(counters, "planary_db_pool_wait_seconds_total", labels, snap["wait_seconds_sum"])
+
+    pw = password_pool.metrics()
+    put(gauges, "planary_password_pool_in_flight", (), pw["in_flight"])
+    put(counters, "planary_password_pool_rejected_total", (), pw["rejected_total"])
+    for op, data in pw["operations"].items():
+        put(counters, "planary_password_pool_operations_total", (("op", op),), data["count"])
+        put(counters, "planary_password_pool_seconds_total", (("op", op),), data["seconds_sum"])
+
+    put(counters, "planary_log_records_dropped_total", (), logs.stats["dropped"])
+    put(counters, "planary_log_records_suppressed_total", (), logs.stats["suppressed"])
+    put(counters, "planary_compressed_responses_total", (), compression.stats["responses"])
+    put(counters, "planary_compression_bytes_in_total", (), compression.stats["bytes_in"])
+    put(counters, "planary_compression_bytes_out_total", (), compression.stats["bytes_out"])
+    put(counters, "planary_compression_cache_hits_total", (), compression.stats["cache_hits"])
+    put(counters, "planary_cache_hits_total", (("tier", "local"),), cache.stats["local_hits"])
+    put(counters, "planary_cache_hits_total", (("tier", "shared"),), cache.stats["shared_hits"])
+    put(counters, "planary_cache_misses_total", (), cache.stats["misses"])
+    put(counters, "planary_cache_coalesced_total", (), cache.stats["coalesced"])
+    put(counters, "planary_cache_errors_total", (), cache.stats["errors"])
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    put(gauges, "planary_threadpool_busy", (), limiter.borrowed_tokens)
+    put(gauges, "planary_threadpool_size", (), limiter.total_tokens)
+    put(gauges, "planary_threadpool_waiting", (), limiter.statistics().tasks_waiting)
+    return gauges, counters
+
+
+def _snapshot(pools: dict) -> dict:
+    gauges, counters = _collect_process(pools)
+    for name, series in registry.counters.items():
+        counters[name] = dict(series)
+    histograms = {name: {k: list(v) for k, v in series.items()} for name, series in registry.histograms.items()}
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _encode(snapshot: dict) -> dict:
+    return {
+        kind: {name: [[list(map(list, labels)), value] for labels, value in series.items()]
+               for name, series in snapshot[kind].items()}
+        for kind in ("counters", "histograms", "gauges")
+    }
+
+
+def _decode(data: dict) -> dict:
+    return {
+        kind: {name: {tuple(map(tuple, labels)): value for labels, value in series}
+               for name, series in data.get(kind, {}).items()}
+        for kind in ("counters", "histograms", "gauges")
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total: dict, other: dict, include_gauges: bool) -> None:
+    for kind in ("counters", "gauges"):
+        if kind == "gauges" and not include_gauges:
+            continue
+        for name, series in other[kind].items():
+            target = total[kind].setdefault(name, {})
+            for labels, value in series.items():
+                target[labels] = target.get(labels, 0) + value
+    for name, series in other["histograms"].items():
+        target = total["histograms"].setdefault(name, {})
+        for labels, values in series.items():
+            current = target.get(labels)
+            target[labels] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+
+
+def _multiproc_path(pid: int) -> Path:
+    return Path(settings.metrics_multiproc_dir) / f"{pid}.json"
+
+
+def _write_atomic(path: Path, data: dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def flush(pools: dict) -> None:
+    """เขียน snapshot ของ worker นี้ลงโฟลเดอร์ multiprocess (เรียกเป็นระยะและตอน shutdown)"""
+    if not settings.metrics_multiproc_dir:
+        return
+    data = {"pid": os.getpid(), **_encode(_snapshot(pools))}
+    Path(settings.metrics_multiproc_dir).mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(_write_atomic, _multiproc_path(os.getpid()), data)
+
+
+async def flush_periodically(pools: dict) -> None:
+    while True:
+        await asyncio.sleep(max(1.0, settings.metrics_flush_seconds))
+        try:
+            await flush(pools)
+        except Exception:
+            logger.exception("Failed to write metrics snapshot")
+
+
+def _read_other_workers() -> list[tuple[int, dict]]:
+    results = []
+    own = os.getpid()
+    for path in Path(settings.metrics_multiproc_dir).glob("*.json"):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue  # ไฟล์ถูกเขียนทับอยู่ / เสีย ข้ามรอบนี้
+        pid = int(data.get("pid", 0))
+        if pid != own:
+            results.append((pid, _decode(data)))
+    return results
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _exposition(snapshot: dict) -> str:
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == "histogram":
+            series = snapshot["histograms"].get(name)
+        else:
+            series = snapshot["counters" if kind == "counter" else "gauges"].get(name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series.items()):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(float(bound))),))} {cumulative}")
+            cumulative += value[len(buckets)]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+async def render(pools: dict) -> str:
+    """ข้อความสำหรับ GET /metrics (รวมทุก worker ถ้าตั้ง METRICS_MULTIPROC_DIR)"""
+    snapshot = _snapshot(pools)
+    if settings.metrics_multiproc_dir:
+        others = await asyncio.to_thread(_read_other_workers)
+        for pid, data in others:
+            _merge(snapshot, data, include_gauges=_pid_alive(pid))
+    return _exposition(snapshot)
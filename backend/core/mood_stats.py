@@ -0,0 +1,235 @@
+"""
+mood_stats.py - อัปเดตสถิติ mood vs activity แบบ incremental
+
+หน้าที่หลัก:
+- refresh_days(db, user_id, dates): เรียกหลังเขียน diary/activity ของวันเหล่านั้น (ก่อน commit)
+    1. lock แถว mood_day_stats ของวันนั้น (กันสอง request นับซ้ำ)
+    2. คำนวณค่าของวันใหม่จาก diaries/activities ของวันนั้นเท่านั้น
+    3. หักค่าเดิม + บวกค่าใหม่ลง mood_correlation_stats ด้วย UPSERT (days/mood_sum/mood_sq_sum)
+- rebuild_user(db, user_id): คำนวณใหม่ทั้งหมดของ user (ใช้ครั้งแรก/ซ่อมข้อมูล)
+- read_correlation(db, user_id): อ่านผลสำหรับ GET /trends/mood-correlation
+  อ่านแค่แถวสถิติ (จำนวนแถว = จำนวนหมวด + จำนวน band) ไม่ join ประวัติทั้งหมด
+
+นิยาม:
+- mood ของวัน = ค่าเฉลี่ย mood_score ของ diary วันนั้น (วันที่ไม่มี mood ไม่ถูกนับ)
+- completion rate ของวัน = จำนวนกิจกรรม done / กิจกรรมทั้งหมดของวันนั้น
+- "ไม่มีกิจกรรมหมวด X" = ทุกวันที่มี mood ลบด้วยวันที่มีหมวด X
+"""
+
+import math
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models.activity import Activity
+from models.diary import Diary
+from models.mood_stats import MoodCorrelationStats, MoodDayStats
+from models.user import User
+
+COMPLETION_BANDS = ("0-25", "25-50", "50-75", "75-100")
+NO_ACTIVITY_BAND = "none"
+
+
+def _band(total: int, done: int) -> str:
+    if total == 0:
+        return NO_ACTIVITY_BAND
+    index = min(int(done * 4 / total), len(COMPLETION_BANDS) - 1)
+    return COMPLETION_BANDS[index]
+
+
+def _day_keys(mood, band, categories) -> list[tuple[str, str]]:
+    """แถวสถิติที่วันหนึ่งถูกนับเข้า"""
+    if mood is None:
+        return []
+    keys = [("all", "")]
+    if band:
+        keys.append(("band", band))
+    keys.extend(("category", c) for c in categories or [])
+    return keys
+
+
+def _compute_days(db: Session, user_id, dates: set) -> dict:
+    """คืน {date: (mood, band, categories)} จากข้อมูลปัจจุบันของวันที่ระบุ"""
+    moods = {
+        day: float(avg)
+        for day, avg in db.query(Diary.date, func.avg(Diary.mood_score))
+        .filter(Diary.user_id == user_id, Diary.date.in_(dates), Diary.mood_score.isnot(None))
+        .group_by(Diary.date)
+    }
+
+    totals = defaultdict(int)
+    done = defaultdict(int)
+    categories = defaultdict(set)
+    for day, category, status in db.query(Activity.date, Activity.category, Activity.status).filter(
+        Activity.user_id == user_id, Activity.date.in_(dates)
+    ):
+        totals[day] += 1
+        if status == "done":
+            done[day] += 1
+        if category:
+            categories[day].add(category[:100])
+
+    result = {}
+    for day in dates:
+        mood = moods.get(day)
+        if mood is None:
+            result[day] = (None, None, None)
+        else:
+            result[day] = (mood, _band(totals[day], done[day]), sorted(categories[day]))
+    return result
+
+
+def _apply_deltas(db: Session, user_id, deltas: dict) -> None:
+    rows = [
+        {"user_id": user_id, "kind": kind, "key": key, "days": d[0], "mood_sum": d[1], "mood_sq_sum": d[2]}
+        for (kind, key), d in deltas.items()
+        if d[0] or d[1] or d[2]
+    ]
+    if not rows:
+        return
+    stmt = pg_insert(MoodCorrelationStats.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "kind", "key"],
+        set_={
+            "days": MoodCorrelationStats.days + stmt.excluded.days,
+            "mood_sum": MoodCorrelationStats.mood_sum + stmt.excluded.mood_sum,
+            "mood_sq_sum": MoodCorrelationStats.mood_sq_sum + stmt.excluded.mood_sq_sum,
+        },
+    )
+    db.execute(stmt)
+
+
+def refresh_days(db: Session, user_id, dates) -> None:
+    """นับวันที่ระบุใหม่ (หักค่าเดิมของวันนั้นออกแล้วบวกค่าปัจจุบัน) - ไม่ commit"""
+    dates = {d for d in dates if d is not None}
+    if not dates:
+        return
+    db.flush()
+
+    # user ที่ยังไม่เคยมีสถิติ จะถูก rebuild ทั้งหมดตอนอ่านครั้งแรกอยู่แล้ว
+    initialized = db.query(MoodCorrelationStats.user_id).filter(
+        MoodCorrelationStats.user_id == user_id,
+        MoodCorrelationStats.kind == "all",
+    ).first()
+    if initialized is None:
+        return
+
+    # สร้างแถวของวันที่ยังไม่มี แล้ว lock ทั้งหมด
+    db.execute(
+        pg_insert(MoodDayStats.__table__)
+        .values([{"user_id": user_id, "date": d} for d in dates])
+        .on_conflict_do_nothing()
+    )
+    previous = {
+        row.date: row
+        for row in db.query(MoodDayStats)
+        .filter(MoodDayStats.user_id == user_id, MoodDayStats.date.in_(dates))
+        .with_for_update()
+    }
+
+    current = _compute_days(db, user_id, dates)
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for day in dates:
+        old = previous.get(day)
+        if old is not None:
+            for key in _day_keys(old.mood, old.band, old.categories):
+                deltas[key][0] -= 1
+                deltas[key][1] -= old.mood
+                deltas[key][2] -= old.mood * old.mood
+        mood, band, categories = current[day]
+        for key in _day_keys(mood, band, categories):
+            deltas[key][0] += 1
+            deltas[key][1] += mood
+            deltas[key][2] += mood * mood
+
+        if old is not None:
+            old.mood, old.band, old.categories = mood, band, categories
+
+    _apply_deltas(db, user_id, deltas)
+    db.flush()
+    # วันที่ไม่ถูกนับไม่ต้องเก็บแถวไว้
+    db.query(MoodDayStats).filter(
+        MoodDayStats.user_id == user_id,
+        MoodDayStats.date.in_(dates),
+        MoodDayStats.mood.is_(None),
+    ).delete(synchronize_session=False)
+
+
+def rebuild_user(db: Session, user_id) -> None:
+    """ล้างแล้วคำนวณสถิติทั้งหมดของ user ใหม่ (นับเฉพาะวันที่มี diary ที่มี mood) - ไม่ commit"""
+    # lock user กันสอง request rebuild พร้อมกัน
+    db.query(User.id).filter(User.id == user_id).with_for_update().first()
+    db.query(MoodCorrelationStats).filter(MoodCorrelationStats.user_id == user_id).delete(synchronize_session=False)
+    db.query(MoodDayStats).filter(MoodDayStats.user_id == user_id).delete(synchronize_session=False)
+
+    # แถว "all" เป็นตัวบอกว่า user นี้มีสถิติแล้ว (แม้ยังไม่มีข้อมูล)
+    db.execute(
+        pg_insert(MoodCorrelationStats.__table__)
+        .values(user_id=user_id, kind="all", key="", days=0, mood_sum=0, mood_sq_sum=0)
+        .on_conflict_do_nothing()
+    )
+    dates = [
+        day
+        for (day,) in db.query(Diary.date)
+        .filter(Diary.user_id == user_id, Diary.mood_score.isnot(None))
+        .distinct()
+    ]
+    for start in range(0, len(dates), 500):
+        refresh_days(db, user_id, dates[start:start + 500])
+
+
+def _summary(days: int, mood_sum: float, mood_sq_sum: float) -> dict:
+    if days <= 0:
+        return {"days": 0, "avg_mood": None, "stddev": None}
+    mean = mood_sum / days
+    stddev = None
+    if days >= 2:
+        variance = max((mood_sq_sum - days * mean * mean) / (days - 1), 0.0)
+        stddev = round(math.sqrt(variance), 2)
+    return {"days": days, "avg_mood": round(mean, 2), "stddev": stddev}
+
+
+def read_correlation(db: Session, user_id, min_days: int = 1) -> dict:
+    """อ่านสถิติของ user (rebuild ครั้งแรกถ้ายังไม่เคยมี)"""
+    rows = db.query(MoodCorrelationStats).filter(MoodCorrelationStats.user_id == user_id).all()
+    if not any(r.kind == "all" for r in rows):
+        rebuild_user(db, user_id)
+        db.commit()
+        rows = db.query(MoodCorrelationStats).filter(MoodCorrelationStats.user_id == user_id).all()
+
+    overall = next(r for r in rows if r.kind == "all")
+    categories = []
+    for r in rows:
+        if r.kind != "category" or r.days < min_days:
+            continue
+        with_stats = _summary(r.days, r.mood_sum, r.mood_sq_sum)
+        without_stats = _summary(
+            overall.days - r.days,
+            overall.mood_sum - r.mood_sum,
+            overall.mood_sq_sum - r.mood_sq_sum,
+        )
+        difference = None
+        if with_stats["avg_mood"] is not None and without_stats["avg_mood"] is not None:
+            difference = round(with_stats["avg_mood"] - without_stats["avg_mood"], 2)
+        categories.append({
+            "category": r.key,
+            "with": with_stats,
+            "without": without_stats,
+            "difference": difference,
+        })
+    categories.sort(key=lambda c: (c["difference"] is None, -(c["difference"] or 0), c["category"]))
+
+    band_rows = {r.key: r for r in rows if r.kind == "band"}
+    bands = []
+    for band in (NO_ACTIVITY_BAND,) + COMPLETION_BANDS:
+        r = band_rows.get(band)
+        stats = _summary(r.days, r.mood_sum, r.mood_sq_sum) if r else _summary(0, 0, 0)
+        bands.append({"band": band, **stats})
+
+    return {
+        "overall": _summary(overall.days, overall.mood_sum, overall.mood_sq_sum),
+        "categories": categories,
+        "completion_bands": bands,
+    }
@@ -0,0 +1,36 @@
+"""
+pagination.py - Helper สำหรับ cursor-based (keyset) pagination
+
+หน้าที่หลัก:
+- encode ค่าของ sort key ของแถวสุดท้ายในหน้าเป็น cursor string (base64url, ไม่มี padding)
+- decode cursor กลับเป็นค่าเดิมเพื่อใช้ทำ WHERE (sort key) < (cursor) ในหน้าถัดไป
+
+ข้อดีเทียบกับ offset:
+- ไม่ต้องไล่ข้ามแถวก่อนหน้า (เร็วคงที่ไม่ว่าจะอยู่หน้าไหน)
+- ไม่มีปัญหาข้อมูลซ้ำ/หายเมื่อมีการเพิ่ม/ลบระหว่างเลื่อนหน้า
+"""
+
+import base64
+
+_SEPARATOR = "|"
+
+
+def encode_cursor(*values) -> str:
+    raw = _SEPARATOR.join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[str]:
+    """
+    แปลง cursor กลับเป็น list ของค่า (string) จำนวน size ตัว
+    โยน ValueError ถ้า cursor ไม่ถูกต้อง
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("invalid cursor") from exc
+    values = raw.split(_SEPARATOR)
+    if len(values) != size:
+        raise ValueError("invalid cursor")
+    return values
@@ -0,0 +1,144 @@
+"""
+password_pool.py - Process pool เฉพาะสำหรับ bcrypt (hash/verify รหัสผ่าน)
+
+หน้าที่หลัก:
+- รัน hash_password / verify_password ใน ProcessPoolExecutor ขนาดจำกัด (settings.password_workers)
+  ไม่กิน CPU/GIL ของ process ที่รับ request และเป็น async: ระหว่างรอไม่จอง thread ของ Starlette
+- จำกัดจำนวนงานที่รอ + กำลังทำ (settings.password_queue_limit)
+  ถ้าเต็มจะโยน PasswordPoolBusy ทันที ให้ router ตอบ 503 แทนการต่อคิว
+- เก็บ metrics: จำนวนงานในคิว, เวลาที่ใช้ (รวมเวลารอคิว), จำนวนครั้งที่ถูกปฏิเสธ
+
+การใช้งาน:
+    from core import password_pool
+    try:
+        ok = await password_pool.verify_password(plain, hashed)
+    except password_pool.PasswordPoolBusy:
+        raise HTTPException(503, ...)
+
+หมายเหตุ:
+- ควรปิด/คืน DB session ก่อนเรียก (await db.close()) เพื่อไม่ถือ connection ไว้ระหว่างรอ bcrypt
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core import security
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Retry-After (วินาที) ที่แนะนำให้ router ส่งกลับตอน 503
+RETRY_AFTER_SECONDS = 1
+
+
+class PasswordPoolBusy(Exception):
+    """คิว bcrypt เต็ม"""
+
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rejected = 0
+        self.count = {"hash": 0, "verify": 0}
+        self.seconds_sum = {"hash": 0.0, "verify": 0.0}
+        self.seconds_max = {"hash": 0.0, "verify": 0.0}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "workers": max(1, settings.password_workers),
+                "queue_limit": settings.password_queue_limit,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected_total": self.rejected,
+                "operations": {
+                    op: {
+                        "count": self.count[op],
+                        "seconds_sum": round(self.seconds_sum[op], 6),
+                        "seconds_max": round(self.seconds_max[op], 6),
+                        "seconds_avg": round(self.seconds_sum[op] / self.count[op], 6) if self.count[op] else None,
+                    }
+                    for op in self.count
+                },
+            }
+
+
+_metrics = _Metrics()
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(1, settings.password_workers))
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run(op: str, fn, *args):
+    with _metrics.lock:
+        if _metrics.in_flight >= settings.password_queue_limit:
+            _metrics.rejected += 1
+            raise PasswordPoolBusy()
+        _metrics.in_flight += 1
+        _metrics.max_in_flight = max(_metrics.max_in_flight, _metrics.in_flight)
+
+    started = time.perf_counter()
+    try:
+        executor = _get_executor()
+        try:
+            return await asyncio.wrap_future(executor.submit(fn, *args))
+        except BrokenProcessPool:
+            # worker ตาย (เช่นถูก OOM kill) สร้าง pool ใหม่แล้วลองอีกครั้ง
+            logger.warning("Password hashing pool broken; restarting")
+            _reset_executor(executor)
+            return await asyncio.wrap_future(_get_executor().submit(fn, *args))
+    finally:
+        elapsed = time.perf_counter() - started
+        with _metrics.lock:
+            _metrics.in_flight -= 1
+            _metrics.count[op] += 1
+            _metrics.seconds_sum[op] += elapsed
+            _metrics.seconds_max[op] = max(_metrics.seconds_max[op], elapsed)
+
+
+async def hash_password(password: str) -> str:
+    """เหมือน core.security.hash_password แต่รันใน process pool (โยน PasswordPoolBusy ถ้าคิวเต็ม)"""
+    return await _run("hash", security.hash_password, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """เหมือน core.security.verify_password แต่รันใน process pool (โยน PasswordPoolBusy ถ้าคิวเต็ม)"""
+    return await _run("verify", security.verify_password, password, password_hash)
+
+
+async def verify_and_rehash(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """core.security.verify_and_rehash ใน process pool (ตรวจ + hash ใหม่ในงานเดียว)"""
+    return await _run("verify", security.verify_and_rehash, password, password_hash)
+
+
+def metrics() -> dict:
+    return _metrics.snapshot()
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
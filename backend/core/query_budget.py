@@ -0,0 +1,161 @@
+"""
+query_budget.py - นับ SQL ต่อ request, ตรวจ N+1 และงบจำนวน query ต่อ endpoint
+
+หน้าที่หลัก:
+- instrument_engine(): ผูก event ของ SQLAlchemy (before/after_cursor_execute) นับ statement และเวลา DB
+  ลง QueryStats ของ request ปัจจุบัน (ContextVar - MetricsMiddleware เป็นคนเปิด/ปิดต่อ request)
+- fingerprint(): SQL ที่ยุบ placeholder/IN list แล้ว statement เดียวกันที่ต่างแค่ค่าพารามิเตอร์จึงได้ค่าเดียวกัน
+- report(): ถ้า fingerprint เดียวกันรันซ้ำ >= QUERY_N_PLUS_ONE_THRESHOLD ครั้งใน request เดียว → log เป็น N+1
+  และ log ถ้าจำนวน query เกินงบที่ endpoint ประกาศไว้
+- @query_budget(n): ประกาศงบจำนวน statement สูงสุดของ endpoint
+    QUERY_BUDGET_STRICT=true (ใช้ใน CI/test): statement ที่เกินงบโยน QueryBudgetExceeded ทันที → 500 ให้ test fail
+    ปกติ (production): แค่ log warning
+- assert_max_queries(n): context manager สำหรับ test ที่เรียก helper ตรง ๆ (ไม่ผ่าน HTTP)
+
+การใช้งาน:
+    @router.get("/diaries")
+    @query_budget(4)
+    async def list_diaries(...): ...
+"""
+
+import contextvars
+import logging
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from sqlalchemy import event
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """จำนวน statement ใน request เกินงบที่ endpoint ประกาศไว้ (เฉพาะ QUERY_BUDGET_STRICT)"""
+
+
+class QueryStats:
+    """statement ของ request/บล็อกเดียว (request หนึ่งรัน query ทีละตัว จึงไม่ต้องใช้ lock)"""
+
+    __slots__ = ("count", "seconds", "budget", "statements")
+
+    def __init__(self, budget: int | None = None):
+        self.count = 0
+        self.seconds = 0.0
+        self.budget = budget
+        # fingerprint -> [จำนวนครั้ง, เวลารวม]
+        self.statements: dict[str, list] = {}
+
+    def repeated(self, threshold: int) -> list[tuple[str, int, float]]:
+        """[(fingerprint, จำนวนครั้ง, เวลารวม)] ของ statement ที่รันซ้ำอย่างน้อย threshold ครั้ง เรียงจากมากไปน้อย"""
+        hits = [(fp, n, s) for fp, (n, s) in self.statements.items() if n >= threshold]
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)
+
+
+_current: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar("query_stats", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+# $1 (asyncpg), %(name)s (psycopg2), ? และ literal ตัวเลข พร้อม cast ต่อท้าย (เช่น $1::UUID)
+_PLACEHOLDER = re.compile(r"(?:\$\d+|%\(\w+\)s|\?|\b\d+\b)(?:::[\w\[\]]+)?")
+# IN (?, ?, ?) / VALUES (?, ?), (?, ?) ที่ยาวต่างกันตามจำนวนค่า
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROW_LIST = re.compile(r"\(\?(?:, \?)*\)(?:\s*,\s*\(\?(?:, \?)*\))+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _ROW_LIST.sub("(...)", sql)
+    return _PLACEHOLDER_LIST.sub("...", sql)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats.count += 1
+    stats.seconds += elapsed
+    entry = stats.statements.setdefault(fingerprint(statement), [0, 0.0])
+    entry[0] += 1
+    entry[1] += elapsed
+    if settings.query_budget_strict and stats.budget is not None and stats.count > stats.budget:
+        raise QueryBudgetExceeded(f"{stats.count} statements exceeds the budget of {stats.budget}; last: {fingerprint(statement)[:200]}")
+
+
+def _handle_error(exception_context):
+    # statement ที่ error ไม่เรียก after_cursor_execute - ทิ้งเวลาเริ่มที่ค้างไว้
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_engine(sync_engine) -> None:
+    """ผูก event นับ query (ส่ง async_engine.sync_engine สำหรับ async engine)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def activate(stats: QueryStats) -> contextvars.Token:
+    return _current.set(stats)
+
+
+def deactivate(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def query_budget(max_queries: int):
+    """decorator: ประกาศจำนวน statement สูงสุดที่ endpoint นี้ควรใช้ต่อ request"""
+    def decorate(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    return decorate
+
+
+def budget_for(endpoint) -> int | None:
+    return getattr(endpoint, "__query_budget__", None)
+
+
+def report(stats: QueryStats, method: str, route: str) -> None:
+    """log N+1 และงบที่เกินของ request ที่จบแล้ว"""
+    threshold = settings.query_n_plus_one_threshold
+    if threshold > 0:
+        for fp, count, seconds in stats.repeated(threshold):
+            logger.warning(
+                "Possible N+1 on %s %s: %d x %.1f ms total: %s",
+                method, route, count, seconds * 1000, fp[:300],
+            )
+    if stats.budget is not None and stats.count > stats.budget:
+        logger.warning(
+            "Query budget exceeded on %s %s: %d statements (budget %d, %.1f ms in DB)",
+            method, route, stats.count, stats.budget, stats.seconds * 1000,
+        )
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """
+    สำหรับ test: โยน AssertionError ถ้าโค้ดในบล็อกรัน statement เกิน limit
+
+        with assert_max_queries(2) as stats:
+            mood_stats.refresh_days(db, user_id, days)
+    """
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+    if stats.count > limit:
+        worst = "; ".join(f"{n}x {fp[:120]}" for fp, n, _ in stats.repeated(2)[:3])
+        raise AssertionError(f"expected at most {limit} statements, ran {stats.count}" + (f" (repeated: {worst})" if worst else ""))
@@ -0,0 +1,366 @@
+"""
+rate_limit.py - Rate limiting middleware แบบ sliding window (ไม่แตะฐานข้อมูล)
+
+หน้าที่หลัก:
+- RateLimitMiddleware: ASGI middleware ตรวจ request ที่ตรงกับ policy ก่อนถึง router
+  เกิน limit ตอบ 429 พร้อม Retry-After ทันที (ไม่เสีย bcrypt/DB)
+- Policy ต่อ route (ดู POLICIES): แต่ละ route มีหลายกฎ แต่ละกฎนับตาม key หนึ่งแบบ
+    - "ip"    : IP ของ client (หรือ X-Forwarded-For ถ้า RATE_LIMIT_TRUST_FORWARDED=true)
+    - "email" : field "email" ใน JSON body (login/register - กันไล่เดารหัสของบัญชีเดียวจากหลาย IP)
+    - "user"  : sub ใน access token (ตรวจ signature แล้ว ไม่ query DB)
+- Sliding window counter: เก็บแค่ (หมายเลข window, จำนวนใน window ก่อน, จำนวนใน window ปัจจุบัน) ต่อ key
+  จำนวนโดยประมาณ = ก่อนหน้า × สัดส่วนที่ยังอยู่ในช่วง + ปัจจุบัน
+- Backend
+    - MemoryBackend (default): dict ใน process + กวาด key ที่หมดอายุเป็นระยะ
+      แต่ละ worker นับแยกกัน (limit จริงรวมทุก worker = limit × จำนวน worker)
+    - RedisBackend: ใช้ร่วมกันทุก worker ตั้ง RATE_LIMIT_REDIS_URL (ต้อง pip install redis)
+      ใช้ redis.asyncio ไม่จอง event loop ระหว่างรอ Redis และตัดที่ RATE_LIMIT_REDIS_TIMEOUT_SECONDS
+
+หมายเหตุ:
+- request ที่ถูกปฏิเสธไม่ถูกนับ client ที่รอตาม Retry-After จึงกลับมาใช้ได้ตามเวลาที่บอก
+- backend error/timeout (เช่น Redis ล่ม): ปล่อย request ผ่าน (fail open) แล้ว log ไว้
+- route ที่มีกฎ "email" แต่ body ใหญ่เกิน _MAX_BODY_BYTES ตอบ 413 (ไม่ข้ามกฎ email)
+- ปิดทั้งหมดได้ด้วย RATE_LIMIT_ENABLED=false
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# body ของ route ที่นับตาม email ใหญ่ได้ไม่เกินนี้ (body login/register เล็กมาก) - เกินตอบ 413
+# ไม่ข้ามกฎ email เงียบ ๆ: ไม่อย่างนั้นแค่เติม field ขยะให้ body ใหญ่ก็หลบ limit ต่อบัญชีได้
+_MAX_BODY_BYTES = 16 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    key: str  # "ip" | "email" | "user"
+    limit: int
+    window_seconds: int
+
+
+@dataclass(frozen=True, slots=True)
+class Policy:
+    name: str
+    method: str
+    path: str
+    rules: tuple[Rule, ...]
+
+
+# Policy ต่อ route (path ต้องตรงทั้งหมด)
+POLICIES: tuple[Policy, ...] = (
+    Policy("login", "POST", "/login/token", (
+        Rule("ip", 20, 60),
+        Rule("email", 5, 60),
+        Rule("email", 30, 3600),
+    )),
+    Policy("register", "POST", "/register", (
+        Rule("ip", 10, 3600),
+        Rule("email", 3, 3600),
+    )),
+    Policy("refresh", "POST", "/auth/refresh", (
+        Rule("ip", 60, 60),
+    )),
+    Policy("password", "PATCH", "/profile/password", (
+        Rule("user", 5, 300),
+        Rule("ip", 20, 300),
+    )),
+    Policy("trends_summary", "GET", "/trends/summary", (
+        Rule("user", 30, 60),
+    )),
+    Policy("export", "GET", "/profile/export", (
+        Rule("user", 3, 3600),
+    )),
+    Policy("import", "POST", "/import", (
+        Rule("user", 20, 3600),
+    )),
+)
+
+
+def _retry_after(limit: int, window: int, elapsed: float, previous: int, current: int) -> int:
+    """จำนวนวินาทีจนกว่า request ถัดไปจะผ่าน (ประมาณ)"""
+    room = limit - 1 - current
+    if room >= 0 and previous > 0:
+        # รอให้ส่วนของ window ก่อนหน้าเลื่อนออกไปพอ
+        wait = window * (1 - room / previous) - elapsed
+    else:
+        # window ปัจจุบันเต็มเอง: รอขึ้น window ใหม่ แล้วให้ window นี้ (กลายเป็น previous) เลื่อนออกพอ
+        wait = (window - elapsed) + window * max(0.0, 1 - (limit - 1) / max(current, 1))
+    return max(1, math.ceil(wait))
+
+
+class MemoryBackend:
+    """นับใน process: key -> [window (วินาที), window index, previous count, current count]"""
+
+    def __init__(self, sweep_seconds: float = 60):
+        self._counters: dict[bytes, list[int]] = {}
+        self._lock = threading.Lock()
+        self._sweep_seconds = sweep_seconds
+        self._next_sweep = time.monotonic() + sweep_seconds
+
+    async def hit(self, keys: list[tuple[bytes, Rule]], now: float) -> int:
+        """นับ request ถ้าทุกกฎยังไม่เต็ม คืน 0 ถ้าผ่าน หรือ Retry-After (วินาที) ถ้าเกิน"""
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            entries = []
+            retry = 0
+            for key, rule in keys:
+                window = rule.window_seconds
+                index, elapsed = divmod(now, window)
+                index = int(index)
+                entry = self._counters.get(key)
+                if entry is None or entry[1] < index - 1:
+                    entry = [window, index, 0, 0]
+                elif entry[1] == index - 1:
+                    entry = [window, index, entry[3], 0]
+                if entry[2] * (1 - elapsed / window) + entry[3] + 1 > rule.limit:
+                    retry = max(retry, _retry_after(rule.limit, window, elapsed, entry[2], entry[3]))
+                entries.append((key, entry))
+            if retry:
+                return retry
+            for key, entry in entries:
+                entry[3] += 1
+                self._counters[key] = entry
+            return 0
+
+    def _sweep(self, now: float) -> None:
+        # key ที่ทั้ง window ก่อนหน้าและปัจจุบันผ่านไปแล้วไม่มีผลกับการนับอีก
+        stale = [key for key, entry in self._counters.items() if entry[1] < int(now // entry[0]) - 1]
+        for key in stale:
+            del self._counters[key]
+        self._next_sweep = now + self._sweep_seconds
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    async def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+class RedisBackend:
+    """นับร่วมกันทุก worker ผ่าน Redis (INCR ต่อ window + EXPIRE)"""
+
+    def __init__(self, url: str, timeout: float):
+        import redis.asyncio as redis  # optional dependency: ใช้เฉพาะเมื่อตั้ง RATE_LIMIT_REDIS_URL
+
+        self._redis = redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    async def hit(self, keys: list[tuple[bytes, Rule]], now: float) -> int:
+        pipe = self._redis.pipeline(transaction=False)
+        positions = []
+        for key, rule in keys:
+            index, elapsed = divmod(now, rule.window_seconds)
+            index = int(index)
+            current_key = b"rl:" + key + b":" + str(index).encode()
+            previous_key = b"rl:" + key + b":" + str(index - 1).encode()
+            pipe.incr(current_key)
+            pipe.expire(current_key, rule.window_seconds * 2)
+            pipe.get(previous_key)
+            positions.append((rule, elapsed, current_key))
+        results = await pipe.execute()
+
+        retry = 0
+        for i, (rule, elapsed, _) in enumerate(positions):
+            current = int(results[i * 3]) - 1
+            previous = int(results[i * 3 + 2] or 0)
+            weight = 1 - elapsed / rule.window_seconds
+            if previous * weight + current + 1 > rule.limit:
+                retry = max(retry, _retry_after(rule.limit, rule.window_seconds, elapsed, previous, current))
+        if retry:
+            # ไม่นับ request ที่ถูกปฏิเสธ
+            pipe = self._redis.pipeline(transaction=False)
+            for _, _, current_key in positions:
+                pipe.decr(current_key)
+            await pipe.execute()
+        return retry
+
+    async def clear(self) -> None:
+        async for key in self._redis.scan_iter(match=b"rl:*"):
+            await self._redis.delete(key)
+
+
+def _counter_key(policy: Policy, rule: Rule, value: str) -> bytes:
+    # hash ค่าเพื่อให้ key ยาวคงที่และไม่เก็บ email/IP ดิบไว้
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=12).hexdigest()
+    return f"{policy.name}:{rule.key}:{rule.window_seconds}:{digest}".encode()
+
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_ip(scope) -> str:
+    if settings.rate_limit_trust_forwarded:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _token_subject(scope) -> str | None:
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    from core.security import InvalidToken, decode_token
+
+    try:
+        payload = decode_token(authorization[7:].strip())
+    except InvalidToken:
+        return None
+    if payload.get("type", "access") != "access":
+        return None
+    sub = payload.get("sub")
+    return str(sub) if sub else None
+
+
+def _body_email(body: bytes) -> str | None:
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    email = data.get("email") if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def _replay(messages: list[dict], receive):
+    """receive ที่คืน message ที่อ่านไว้แล้วก่อน แล้วค่อยอ่านจาก client ต่อ"""
+    pending = list(messages)
+
+    async def replay():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+
+    return replay
+
+
+def _create_backend():
+    if settings.rate_limit_redis_url:
+        return RedisBackend(settings.rate_limit_redis_url, settings.rate_limit_redis_timeout_seconds)
+    return MemoryBackend()
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, policies: tuple[Policy, ...] = POLICIES, backend=None):
+        self.app = app
+        self.policies = {(p.method, p.path.rstrip("/") or "/"): p for p in policies}
+        self.backend = backend
+        self._backend_lock = threading.Lock()
+
+    def _get_backend(self):
+        if self.backend is None:
+            with self._backend_lock:
+                if self.backend is None:
+                    self.backend = _create_backend()
+        return self.backend
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        policy = self.policies.get((scope["method"], scope["path"].rstrip("/") or "/"))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        # อ่าน body ไว้ก่อนถ้าต้องใช้ email แล้วส่งต่อให้ router เหมือนเดิม
+        if any(rule.key == "email" for rule in policy.rules):
+            body, receive = await self._buffer_body(receive)
+            if body is None:
+                await self._reject_too_large(send)
+                return
+        else:
+            body = b""
+
+        values = {}
+        keys = []
+        for rule in policy.rules:
+            if rule.key not in values:
+                if rule.key == "ip":
+                    values["ip"] = _client_ip(scope)
+                elif rule.key == "email":
+                    values["email"] = _body_email(body)
+                elif rule.key == "user":
+                    values["user"] = _token_subject(scope)
+            value = values[rule.key]
+            if value:
+                keys.append((_counter_key(policy, rule, value), rule))
+
+        retry_after = 0
+        if keys:
+            try:
+                retry_after = await self._get_backend().hit(keys, time.time())
+            except Exception:
+                # backend ใช้ไม่ได้ (เช่น Redis ล่ม/timeout) ไม่บล็อก request (fail open)
+                logger.exception("Rate limit backend failed")
+
+        if retry_after:
+            await self._reject(send, retry_after)
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _buffer_body(receive):
+        """(body, receive ที่เล่น body ซ้ำ) - body เป็น None เมื่อใหญ่เกิน _MAX_BODY_BYTES (หยุดอ่านทันที)"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # client ตัดการเชื่อมต่อระหว่างส่ง body ให้ router เห็น message เดิม
+                return b"", _replay([message], receive)
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > _MAX_BODY_BYTES:
+                return None, receive
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        return body, _replay([{"type": "http.request", "body": body, "more_body": False}], receive)
+
+    @staticmethod
+    async def _reject(send, retry_after: int) -> None:
+        payload = json.dumps(
+            {"detail": "มีการเรียกใช้งานบ่อยเกินไป กรุณาลองใหม่อีกครั้งภายหลัง"},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    @staticmethod
+    async def _reject_too_large(send) -> None:
+        payload = json.dumps(
+            {"detail": "ข้อมูลที่ส่งมามีขนาดใหญ่เกินไป"}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
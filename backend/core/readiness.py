@@ -0,0 +1,82 @@
+"""
+readiness.py - สถานะพร้อมรับ traffic ของ worker (readiness gate)
+
+หน้าที่หลัก:
+- wait_for_database(): background task ตอน startup ลอง SELECT 1 ซ้ำ (backoff) จนต่อ DB ได้
+  แล้วจึงตั้ง state.ready = True - worker จึง boot ได้แม้ DB สะดุดชั่วคราว แทนที่จะ crash ตอน import
+- ReadinessGate: ASGI middleware ตอบ 503 + Retry-After ให้ request ทั่วไประหว่างที่ยังไม่พร้อม
+  (ยกเว้น liveness/readiness/metrics) load balancer ใช้ GET /ready ตัดสินว่าจะส่ง traffic มาหรือยัง
+
+หมายเหตุ:
+- ready เป็นสถานะหลัง startup เท่านั้น ถ้า DB ล่มภายหลัง request จะ error ตามปกติ (pool_pre_ping/recycle จัดการ reconnect)
+- ไม่ทำ DDL ตอน startup อีกแล้ว สร้างตารางด้วย scripts/create_tables.py แล้ว apply migrations/*.sql
+"""
+
+import asyncio
+import json
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_SECONDS = 2
+# path ที่ผ่าน gate ได้เสมอ (ตรวจสุขภาพ/ดู metrics ได้ระหว่างรอ DB)
+ALWAYS_OPEN_PREFIXES = ("/ping", "/ready", "/metrics")
+
+
+class _State:
+    def __init__(self):
+        self.ready = False
+        self.last_error: str | None = None
+        self.attempts = 0
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "attempts": self.attempts, "last_error": self.last_error}
+
+
+state = _State()
+
+
+async def wait_for_database(engine, initial_delay: float = 0.5, max_delay: float = 10.0) -> None:
+    """ลอง SELECT 1 ผ่าน async engine จนสำเร็จ แล้วตั้ง state.ready"""
+    delay = initial_delay
+    while True:
+        state.attempts += 1
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except Exception as exc:
+            state.last_error = f"{type(exc).__name__}: {exc}"
+            logger.warning("Database not reachable (attempt %d): %s", state.attempts, state.last_error)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+            continue
+        state.last_error = None
+        state.ready = True
+        logger.info("Database reachable after %d attempt(s); worker is ready", state.attempts)
+        return
+
+
+class ReadinessGate:
+    """ASGI middleware: 503 ระหว่างที่ worker ยังไม่พร้อม"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if state.ready or scope["type"] != "http" or scope["path"].startswith(ALWAYS_OPEN_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "ระบบกำลังเริ่มทำงาน กรุณาลองใหม่อีกครั้ง"}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(RETRY_AFTER_SECONDS).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,67 @@
+"""
+responses.py - สร้าง JSON response แบบเร็ว (orjson + pydantic-core)
+
+หน้าที่หลัก:
+- ORJSONResponse: default_response_class ของ app - encode ด้วย orjson แทน json.dumps
+  endpoint ที่คืน dict ขนาดใหญ่ (เช่น /trends/summary) คืน ORJSONResponse(content) ตรง ๆ
+  เพื่อข้าม jsonable_encoder ของ FastAPI ที่ไล่แปลงทุก node ด้วย Python ก่อน encode
+- serialized(): validate ครั้งเดียวด้วย TypeAdapter (cache ต่อ type) แล้ว dump_json ใน pydantic-core
+  แทนทางเดิมที่ model_validate ทีละแถว → FastAPI validate response_model ซ้ำ → แปลงเป็น dict → json.dumps
+  รับ ORM object หรือ Row ของ Core select (อ่านด้วย attribute) ได้เลย
+- etag_for() / etag_matches(): ETag จาก hash ของ body และเทียบกับ If-None-Match (weak comparison)
+
+endpoint ที่คืน Response เองยังใส่ response_model ไว้เพื่อ OpenAPI (FastAPI ไม่ validate ซ้ำเมื่อได้ Response)
+"""
+
+import hashlib
+from decimal import Decimal
+from functools import lru_cache
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+
+def _default(value):
+    # ชนิดที่ orjson ไม่รู้จัก (ผลรวม/ค่าเฉลี่ยจาก SQL เป็น Decimal)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=None)
+def adapter(schema) -> TypeAdapter:
+    """TypeAdapter ต่อ type (สร้าง validator/serializer ครั้งเดียวต่อ process)"""
+    return TypeAdapter(schema)
+
+
+def serialized(schema, value, *, status_code: int = 200, headers: dict | None = None) -> Response:
+    """validate value (ORM object / Core Row / dict) เป็น schema ครั้งเดียวแล้วคืน JSON bytes"""
+    ta = adapter(schema)
+    body = ta.dump_json(ta.validate_python(value, from_attributes=True))
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def etag_for(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match ตรงกับ etag หรือไม่ (เทียบแบบ weak: ไม่สน W/ - body ที่บีบแล้วได้ ETag แบบ weak)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((c[2:] if c.startswith("W/") else c) == bare for c in candidates)
@@ -5,21 +5,42 @@ security.py - ระบบความปลอดภัย (Authentication & Au
 - เข้ารหัสรหัสผ่านด้วย bcrypt (hash_password)
 - ตรวจสอบรหัสผ่านที่ user ป้อนกับ hash ในฐานข้อมูล (verify_password)
 - สร้าง JWT access token สำหรับ login (create_access_token)
+- ตรวจว่า hash เดิมใช้ cost ไม่ตรงกับ settings.bcrypt_rounds หรือไม่ (needs_rehash)
+  เพื่อ hash ใหม่ตอน login สำเร็จ (verify_and_rehash)
 
 การทำงาน:
 1. ตอน register: hash_password() เข้ารหัสรหัสผ่านก่อนบันทึกลงฐานข้อมูล
 2. ตอน login: verify_password() เช็คว่ารหัสผ่านที่ใส่ตรงกับ hash หรือไม่
 3. ถ้าถูกต้อง: create_access_token() สร้าง JWT token ที่มี user_id และ expiration time
 4. Frontend เก็บ token นี้และส่งมาใน Authorization header ทุกครั้งที่เรียก API
+
+jose และ passlib import ตอนใช้ครั้งแรก (ไม่ใช่ตอน import โมดูล) เพื่อให้ worker boot เร็ว
+decode_token แปลง error ของ jose เป็น InvalidToken / TokenExpired ผู้เรียกจึงไม่ต้อง import jose เอง
 """
 
+import uuid
 from datetime import datetime, timedelta
-from jose import jwt, JWTError, ExpiredSignatureError
-from passlib.context import CryptContext
+from functools import lru_cache
 from core.config import settings
 
-# ตั้งค่า bcrypt context สำหรับเข้ารหัสรหัสผ่าน
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+class InvalidToken(Exception):
+    """token ถอดไม่ได้ ลายเซ็นไม่ถูกต้อง หรือ claim ไม่ถูกต้อง"""
+
+
+class TokenExpired(InvalidToken):
+    """token หมดอายุแล้ว (exp)"""
+
+
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    """
+    bcrypt context สำหรับเข้ารหัสรหัสผ่าน (สร้างครั้งแรกที่เรียก)
+    cost (rounds) ตั้งได้จาก BCRYPT_ROUNDS - หาค่าที่เหมาะกับเครื่องด้วย scripts/calibrate_bcrypt.py
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 def hash_password(password: str) -> str:
     """
@@ -31,7 +52,7 @@ def hash_password(password: str) -> str:
     Returns:
         str: รหัสผ่านที่เข้ารหัสแล้ว (hash) เพื่อเก็บในฐานข้อมูล
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
     """
@@ -44,7 +65,34 @@ def verify_password(password: str, password_hash: str) -> bool:
     Returns:
         bool: True ถ้ารหัสผ่านถูกต้อง, False ถ้าไม่ตรง
     """
-    return pwd_context.verify(password, password_hash)
+    return get_pwd_context().verify(password, password_hash)
+
+def hash_rounds(password_hash: str) -> int | None:
+    """อ่าน cost จาก bcrypt hash เช่น "$2b$12$..." -> 12 (None ถ้าไม่ใช่ bcrypt)"""
+    parts = (password_hash or "").split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def needs_rehash(password_hash: str) -> bool:
+    """True ถ้า hash ใช้ cost ต่างจาก settings.bcrypt_rounds หรือเป็น scheme ที่เลิกใช้แล้ว"""
+    if hash_rounds(password_hash) != settings.bcrypt_rounds:
+        return True
+    return get_pwd_context().needs_update(password_hash)
+
+def verify_and_rehash(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """
+    ตรวจรหัสผ่าน และถ้าถูกต้องแต่ hash ใช้ cost เก่า ให้ hash ใหม่ด้วย cost ปัจจุบันไปพร้อมกัน
+
+    Returns:
+        (ถูกต้องหรือไม่, hash ใหม่ที่ต้องบันทึก หรือ None ถ้าไม่ต้องเปลี่ยน)
+    """
+    pwd_context = get_pwd_context()
+    if not pwd_context.verify(password, password_hash):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, pwd_context.hash(password)
+    return True, None
 
 def create_access_token(subject: str) -> str:
     """
@@ -65,10 +113,12 @@ def create_access_token(subject: str) -> str:
     return create_token(subject, token_type="access")
 
 
-def create_token(subject: str, token_type: str = "access") -> str:
+def create_token(subject: str, token_type: str = "access", claims: dict | None = None) -> str:
     """
     Create a JWT token, either 'access' or 'refresh'.
     Tokens include 'sub', 'iat', 'exp', and 'type' claims.
+    Refresh tokens also get a unique 'jti' (used for rotation/revocation, see core/token_revocation.py).
+    Extra claims (e.g. 'ver') can be passed in `claims`.
     """
     now = datetime.utcnow()
     if token_type == "access":
@@ -80,21 +130,28 @@ def create_token(subject: str, token_type: str = "access") -> str:
         expire = now + timedelta(minutes=settings.access_token_expire_minutes)
 
     payload = {"sub": subject, "iat": now, "exp": expire, "type": token_type}
+    if token_type == "refresh":
+        payload["jti"] = uuid.uuid4().hex
+    if claims:
+        payload.update(claims)
+    from jose import jwt
+
     return jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
 
 
 def decode_token(token: str) -> dict:
     """
-    Decode and validate a JWT token. Raises HTTP-like exceptions upstream.
-    Returns the payload dict when valid.
+    Decode and validate a JWT token.
+    Returns the payload dict when valid; raises TokenExpired / InvalidToken otherwise.
     """
+    from jose import jwt, JWTError, ExpiredSignatureError
+
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        return payload
-    except ExpiredSignatureError:
-        raise
-    except JWTError:
-        raise
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except ExpiredSignatureError as exc:
+        raise TokenExpired(str(exc)) from exc
+    except JWTError as exc:
+        raise InvalidToken(str(exc)) from exc
 
 
 def validate_password_strength(password: str) -> None:
@@ -0,0 +1,118 @@
+"""
+thumbnails.py - สร้างรูปย่อ (WebP) ของรูป diary ใน background worker
+
+หน้าที่หลัก:
+- หมุนรูปตาม EXIF orientation แล้วลบ EXIF ออกจากไฟล์ต้นฉบับ (เช่นตำแหน่ง GPS)
+- สร้างรูปย่อ 2 ขนาดเป็น WebP:
+    - thumb: สำหรับไทม์ไลน์ (settings.image_thumbnail_px)
+    - display: สำหรับเปิดดูเต็มจอ (settings.image_display_px)
+- อัปเดต size/width/height/has_variants ของ row ใน diary_images เมื่อเสร็จ
+
+การทำงาน:
+- งานถูกส่งเข้า ThreadPoolExecutor ขนาดจำกัด (settings.image_workers)
+  request ที่อัปโหลดจึงไม่ต้องรอ decode/resize รูป
+- รูปย่อเก็บที่ media/diary_images/<diary_id>/_variants/<stem>.<variant>.webp
+"""
+
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "_variants"
+VARIANTS = ("thumb", "display")
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.image_workers),
+            thread_name_prefix="image-worker",
+        )
+    return _executor
+
+
+def variant_path(original: Path, variant: str) -> Path:
+    return original.parent / VARIANTS_DIR / f"{original.stem}.{variant}.webp"
+
+
+def remove_variants(original: Path) -> None:
+    for variant in VARIANTS:
+        variant_path(original, variant).unlink(missing_ok=True)
+
+
+def _strip_and_resize(path: Path) -> tuple[int, int]:
+    """ลบ EXIF ของต้นฉบับ (เขียนทับแบบ atomic) และสร้างรูปย่อ คืน (width, height) หลังหมุนแล้ว"""
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as source:
+        fmt = source.format
+        image = ImageOps.exif_transpose(source)
+        image.info.pop("exif", None)
+
+        save_kwargs = {}
+        if fmt in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = 90
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        tmp = path.with_name(path.name + ".tmp")
+        image.save(tmp, format=fmt, **save_kwargs)
+        os.replace(tmp, path)
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        variants_dir = path.parent / VARIANTS_DIR
+        variants_dir.mkdir(exist_ok=True)
+        for variant, px in (("display", settings.image_display_px), ("thumb", settings.image_thumbnail_px)):
+            resized = image.copy()
+            resized.thumbnail((px, px))
+            resized.save(variant_path(path, variant), format="WEBP", quality=80, method=4)
+
+        return image.size
+
+
+def process_diary_image(image_id, path: Path) -> None:
+    """งานของ worker: ประมวลผลรูปหนึ่งรูปแล้วอัปเดตฐานข้อมูล"""
+    from db.session import SessionLocal
+    from models.diary_image import DiaryImage
+
+    try:
+        width, height = _strip_and_resize(path)
+    except FileNotFoundError:
+        # รูปถูกลบไปก่อน worker จะทำงาน
+        return
+    except Exception:
+        logger.exception("Failed to process diary image %s", path)
+        return
+
+    db = SessionLocal()
+    try:
+        db.query(DiaryImage).filter(DiaryImage.id == image_id).update(
+            {
+                "size": path.stat().st_size,
+                "width": width,
+                "height": height,
+                "has_variants": True,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to update diary image %s", image_id)
+    finally:
+        db.close()
+
+
+def submit(image_id, path: Path) -> Future:
+    """ส่งงานสร้างรูปย่อเข้า worker pool (ไม่ block request)"""
+    return _get_executor().submit(process_diary_image, image_id, path)
@@ -0,0 +1,240 @@
+"""
+token_revocation.py - Refresh token rotation + revocation
+
+หน้าที่หลัก:
+- use_refresh_token(db, claims): ใช้ refresh token หนึ่งครั้ง (rotation) ก่อนออก token ใหม่
+    1. ตรวจใน memory: Bloom filter ของ jti ที่ถูก revoke (ถ้าอาจมี ค่อยดู exact set)
+       และ token_version ล่าสุดของ user ที่ process นี้รู้ -> token ที่ถูก revoke แล้วถูกปฏิเสธโดยไม่แตะ DB
+    2. INSERT jti ลง revoked_tokens แบบมีเงื่อนไข (user ยังอยู่ และ token_version ตรงกับ claim "ver")
+       ON CONFLICT DO NOTHING - คำสั่งเดียวทั้งตรวจและ revoke token เดิม ไม่มี SELECT แยก
+       ถ้าไม่ได้ insert แปลว่า token ถูกใช้ไปแล้ว / ถูก revoke ทั้งหมด / บัญชีถูกลบ
+- revoke_token(db, claims): revoke refresh token เดียว (logout)
+- revoke_all(db, user_id): เพิ่ม users.token_version (UPDATE เดียว) refresh token ทุกอันที่ออกไปแล้วใช้ไม่ได้
+- RevocationCache: Bloom filter + exact set ของ jti ที่ถูก revoke และยังไม่หมดอายุ
+  sync จาก revoked_tokens แบบ incremental (ตาม created_at) และลบแถวที่หมดอายุแล้วออกจาก DB ไปพร้อมกัน
+- sync_periodically(): background task ใน lifespan เรียก sync ทุก settings.token_revocation_sync_seconds
+  ด้วย session ของตัวเอง - request /auth/refresh ไม่ต้อง DELETE/commit เพิ่ม และไม่ commit งานของ request
+
+หมายเหตุ:
+- ข้อมูลใน memory เป็นทางลัดสำหรับปฏิเสธเท่านั้น ผลสุดท้ายตัดสินที่ INSERT ใน DB เสมอ
+  worker อื่นที่ยัง sync ไม่ถึงจึงไม่รับ token ที่ถูก revoke แล้ว
+- access token ไม่ถูก revoke (อายุสั้นตาม settings.access_token_expire_minutes)
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import DateTime, String, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from models.revoked_token import RevokedToken
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# sync ซ้อนช่วงเวลาก่อนหน้าเล็กน้อย กันแถวที่ commit ช้ากว่า created_at ของตัวเองหลุดไป
+_SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class RefreshTokenRevoked(Exception):
+    """refresh token ถูกใช้ไปแล้ว ถูก revoke หรือไม่มี claim ที่จำเป็น"""
+
+
+class BloomFilter:
+    """Bloom filter ขนาดคงที่ (ไม่มี false negative, false positive ประมาณ error_rate เมื่อไม่เกิน capacity)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationCache:
+    def __init__(self, capacity: int, sync_seconds: float):
+        self.capacity = max(1, capacity)
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._exact: dict[str, datetime] = {}
+        self._bloom = BloomFilter(self.capacity)
+        self._versions: dict[UUID, int] = {}
+        self._synced_at: datetime | None = None
+
+    def is_revoked(self, jti: str, user_id: UUID, version: int) -> bool:
+        with self._lock:
+            if version < self._versions.get(user_id, version):
+                return True
+            # กรณีปกติ Bloom filter ตอบ "ไม่มี" แน่นอนโดยไม่ต้องดู exact set
+            return jti in self._bloom and jti in self._exact
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        with self._lock:
+            self._add(jti, expires_at)
+
+    def note_version(self, user_id: UUID, version: int) -> None:
+        with self._lock:
+            if version > self._versions.get(user_id, -1):
+                if len(self._versions) >= self.capacity:
+                    # เป็นแค่ทางลัด ล้างได้เมื่อเต็ม (DB ยังตรวจ token_version อยู่เสมอ)
+                    self._versions.clear()
+                self._versions[user_id] = version
+
+    def sync(self, db: Session) -> None:
+        """ลบแถวที่หมดอายุแล้วและดึง jti ที่ถูก revoke ใหม่จาก DB - commit เอง ต้องใช้ session ที่ไม่มีงานของ request"""
+        with self._lock:
+            since = self._synced_at - _SYNC_OVERLAP if self._synced_at else None
+
+        now = datetime.utcnow()
+        db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+        db.commit()
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > now)
+        if since is not None:
+            query = query.filter(RevokedToken.created_at >= since)
+        rows = query.all()
+
+        with self._lock:
+            for jti, expires_at in rows:
+                self._add(jti, expires_at)
+            expired = [jti for jti, expires_at in self._exact.items() if expires_at <= now]
+            for jti in expired:
+                del self._exact[jti]
+            if expired:
+                self._rebuild_bloom()
+            self._synced_at = now
+
+    def clear(self) -> None:
+        with self._lock:
+            self._exact.clear()
+            self._versions.clear()
+            self._bloom = BloomFilter(self.capacity)
+            self._synced_at = None
+
+    def _add(self, jti: str, expires_at: datetime) -> None:
+        if jti in self._exact:
+            return
+        self._exact[jti] = expires_at
+        if len(self._exact) > self._bloom.capacity:
+            self._rebuild_bloom()
+        else:
+            self._bloom.add(jti)
+
+    def _rebuild_bloom(self) -> None:
+        # ลบออกจาก Bloom filter ไม่ได้ สร้างใหม่จาก exact set (และขยายขนาดถ้าจำนวนเกิน capacity)
+        capacity = self.capacity
+        while capacity < len(self._exact):
+            capacity *= 2
+        self._bloom = BloomFilter(capacity)
+        for jti in self._exact:
+            self._bloom.add(jti)
+
+
+revocation_cache = RevocationCache(
+    capacity=settings.token_revocation_capacity,
+    sync_seconds=settings.token_revocation_sync_seconds,
+)
+
+
+async def sync_periodically(session_factory) -> None:
+    """sync revocation_cache ทันทีแล้วทุก sync_seconds ด้วย session ใหม่ทุกรอบ (background task ใน lifespan)"""
+    while True:
+        try:
+            async with session_factory() as db:
+                await db.run_sync(revocation_cache.sync)
+        except Exception:
+            # DB ยังไม่พร้อม/ล่มชั่วคราว: ลองใหม่รอบหน้า (DB ยังตัดสินที่ INSERT เสมอ)
+            logger.warning("Failed to sync revoked tokens", exc_info=True)
+        await asyncio.sleep(max(1.0, revocation_cache.sync_seconds))
+
+
+def _parse_claims(claims: dict) -> tuple[str, UUID, int, datetime]:
+    try:
+        jti = str(claims["jti"])
+        user_id = UUID(str(claims["sub"]))
+        version = int(claims.get("ver", 0))
+        expires_at = datetime.utcfromtimestamp(int(claims["exp"]))
+    except (KeyError, TypeError, ValueError):
+        raise RefreshTokenRevoked()
+    if not jti or len(jti) > 64:
+        raise RefreshTokenRevoked()
+    return jti, user_id, version, expires_at
+
+
+def use_refresh_token(db: Session, claims: dict) -> tuple[UUID, int]:
+    """
+    revoke refresh token ที่ส่งมา (rotation) - ไม่ commit
+
+    Returns:
+        (user_id, token_version) สำหรับออก refresh token ใหม่
+
+    Raises:
+        RefreshTokenRevoked: token ถูกใช้ไปแล้ว ถูก revoke หรือบัญชีถูกลบ
+    """
+    jti, user_id, version, expires_at = _parse_claims(claims)
+    if revocation_cache.is_revoked(jti, user_id, version):
+        raise RefreshTokenRevoked()
+
+    source = select(
+        literal(jti, String),
+        User.id,
+        literal(expires_at, DateTime),
+        literal(datetime.utcnow(), DateTime),
+    ).where(User.id == user_id, User.token_version == version)
+    stmt = pg_insert(RevokedToken.__table__).from_select(
+        ["jti", "user_id", "expires_at", "created_at"], source
+    ).on_conflict_do_nothing(index_elements=["jti"])
+    inserted = db.execute(stmt).rowcount == 1
+
+    # ไม่ว่าผลจะเป็นอย่างไร token นี้ใช้ไม่ได้อีกแล้ว
+    revocation_cache.add(jti, expires_at)
+    if not inserted:
+        raise RefreshTokenRevoked()
+    revocation_cache.note_version(user_id, version)
+    return user_id, version
+
+
+def revoke_token(db: Session, claims: dict) -> None:
+    """revoke refresh token เดียว (เช่น logout) - ไม่ commit, token ที่ claim ไม่ครบถือว่าใช้ไม่ได้อยู่แล้ว"""
+    try:
+        jti, user_id, _, expires_at = _parse_claims(claims)
+    except RefreshTokenRevoked:
+        return
+    db.execute(
+        pg_insert(RevokedToken.__table__)
+        .values(jti=jti, user_id=user_id, expires_at=expires_at, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["jti"])
+    )
+    revocation_cache.add(jti, expires_at)
+
+
+def revoke_all(db: Session, user_id: UUID) -> None:
+    """revoke refresh token ทุกอันของ user ด้วย UPDATE เดียว (เพิ่ม users.token_version) - ไม่ commit"""
+    version = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if version is not None:
+        revocation_cache.note_version(user_id, version)
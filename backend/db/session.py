@@ -4,33 +4,62 @@ session.py - การเชื่อมต่อฐานข้อมูล (Da
 หน้าที่หลัก:
 - สร้าง SQLAlchemy engine เพื่อเชื่อมต่อกับ PostgreSQL
 - สร้าง SessionLocal สำหรับจัดการ database transactions
+- สร้าง async_engine + AsyncSessionLocal (asyncpg) สำหรับ router แบบ async def
 - สร้าง Base class สำหรับ define models
 - มี get_db() dependency สำหรับใช้ใน FastAPI routers
+- import โมดูลนี้ไม่ต่อ DB และไม่แตะ filesystem (engine ต่อจริงตอนใช้ครั้งแรก)
+  ตารางสร้างด้วย scripts/create_tables.py, โฟลเดอร์ media สร้างตอน startup ใน main.lifespan
 
 การทำงาน:
 - engine: เชื่อมต่อ database ด้วย connection string จาก settings.database_url
+  (pool ตั้งค่าได้ผ่าน DB_POOL_* / DB_PGBOUNCER และดู metrics ได้ที่ GET /metrics/db-pool)
 - SessionLocal: factory สำหรับสร้าง database session ใหม่ทุกครั้งที่มี request
 - Base: parent class ที่ models ทั้งหมดจะ inherit จาก
 - get_db(): generator ที่ FastAPI ใช้เพื่อ inject database session เข้าไปใน router functions
+- get_async_db(): เหมือน get_db แต่คืน AsyncSession (router ส่วนใหญ่ใช้ตัวนี้)
+  request ที่รอ DB จึงไม่ต้องจอง thread ใน threadpool ของ Starlette
+
+sync (SessionLocal/get_db) ยังใช้ต่อใน:
+- งานที่รันใน thread อยู่แล้ว: stream export/iCalendar, bulk import, worker สร้างรูปย่อ, scripts/
+- helper ที่ใช้ร่วมกับงานข้างบน (เช่น core/mood_stats.py) router แบบ async เรียกผ่าน
+  await db.run_sync(helper, ...) ซึ่งรันโค้ด sync บน connection ของ AsyncSession (ไม่ใช้ thread)
 """
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from core.config import settings
-import os
-
-# สร้าง folder avatars ถ้ายังไม่มี (สำหรับเก็บรูปโปรไฟล์)
-os.makedirs(settings.avatars_dir, exist_ok=True)
+from core import query_budget
+from core.db_pool import engine_options
 
 # สร้าง engine เพื่อเชื่อมต่อกับ PostgreSQL
-# pool_pre_ping=True: เช็คว่า connection ยังใช้งานได้ก่อนใช้งานจริง
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+# ขนาด pool, timeout, recycle, pre-ping, statement_timeout และโหมด pgbouncer มาจาก settings (ดู core/db_pool.py)
+engine = create_engine(settings.database_url, **engine_options(is_async=False))
+query_budget.instrument_engine(engine)
 
 # สร้าง SessionLocal factory สำหรับสร้าง database session
 # autocommit=False: ต้อง commit transaction เอง
 # autoflush=False: ไม่ flush โดยอัตโนมัติ
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_database_url() -> str:
+    """ASYNC_DATABASE_URL ถ้าตั้งไว้ ไม่งั้นใช้ DATABASE_URL เดิมแต่เปลี่ยน driver เป็น asyncpg"""
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+# Async engine (asyncpg) สำหรับ router แบบ async def
+async_engine = create_async_engine(_async_database_url(), **engine_options(is_async=True))
+query_budget.instrument_engine(async_engine.sync_engine)
+
+# expire_on_commit=False: object ยังอ่าน attribute ได้หลัง commit โดยไม่ต้อง lazy load
+# (lazy load นอก greenlet ของ SQLAlchemy ใช้ไม่ได้กับ AsyncSession)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 # Base class สำหรับ SQLAlchemy models (User, Diary, Activity, etc.)
 Base = declarative_base()
 
@@ -55,3 +84,16 @@ def get_db():
         yield db  # ส่ง session ไปให้ router function ใช้
     finally:
         db.close()  # ปิด session หลังใช้งานเสร็จ
+
+
+async def get_async_db():
+    """
+    Dependency แบบ async: yield AsyncSession แล้วปิดหลัง request เสร็จ
+
+    การใช้งานใน router:
+        @router.get("/...")
+        async def some_endpoint(db: AsyncSession = Depends(get_async_db)):
+            rows = (await db.execute(select(Model).where(...))).scalars().all()
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
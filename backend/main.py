@@ -3,16 +3,24 @@ main.py - จุดเริ่มต้นของ Backend API (FastAPI Applic
 
 หน้าที่หลัก:
 - สร้าง FastAPI app instance และตั้งค่า CORS
-- สร้างตาราง database ทั้งหมดจาก models
+- เก็บ metrics แบบ Prometheus ของทุก request (GET /metrics, ดู core/metrics.py)
+- บีบอัด response ตาม Accept-Encoding (core/compression.py)
+- lifespan: สร้างโฟลเดอร์ media, รอ DB ใน background (readiness gate), ปิด pool ตอน shutdown
+  (ไม่ทำ DDL ตอน import แล้ว - สร้างตารางด้วย scripts/create_tables.py + migrations/*.sql)
 - เชื่อมต่อ routers ทั้งหมด (login, register, profile, diary, activities, routines)
 - Mount folder media สำหรับเก็บไฟล์รูปภาพ
-- จัดการ error handler สำหรับ validation errors (422)
+- จัดการ error handler สำหรับ validation errors (422) - log แบบ structured ผ่าน core/logs.py (ไม่ print บน event loop)
 """
 
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from db.session import Base, engine
+from db.session import AsyncSessionLocal, async_engine, engine
 from routers.login import router as login_router
 from routers.register import router as register_router
 from routers.profile import router as profile_router
@@ -20,23 +28,74 @@ from routers.home import router as home_router
 from routers.diary import router as diary_router
 from routers.activities import router as activities_router
 from core.config import settings
+from core.media import MediaFiles
+from core.rate_limit import RateLimitMiddleware
+from core.responses import ORJSONResponse
+from core import cache, compression, db_pool, logs, metrics, password_pool, readiness, token_revocation
 from routers.routine_activities import router as routine_activities_router
 from routers.trends import router as trends_router
 from routers.token import router as token_router
+from routers.imports import router as imports_router
+from routers.export import router as export_router
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# pool ที่แสดงใน /metrics
+METRIC_POOLS = {"async": async_engine.pool, "sync": engine.pool}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	"""
+	Startup: ตั้ง logging (คิว + thread เขียน log), สร้างโฟลเดอร์ media แล้วเริ่มรอ DB และ sync refresh token ที่ถูก revoke ใน background - worker รับ /ping ได้ทันที
+	ส่วน request อื่นได้ 503 จนกว่า DB จะตอบ (ดู core/readiness.py)
+	Shutdown: ปิด process pool ของ bcrypt, ปิด connection ของ Redis cache, คืน connection ของทั้งสอง engine แล้วเขียน log ที่ค้างในคิวให้หมด
+	"""
+	logs.configure()
+	os.makedirs(settings.avatars_dir, exist_ok=True)
+	db_check = asyncio.create_task(readiness.wait_for_database(async_engine))
+	metrics_flush = asyncio.create_task(metrics.flush_periodically(METRIC_POOLS)) if settings.metrics_multiproc_dir else None
+	revocation_sync = asyncio.create_task(token_revocation.sync_periodically(AsyncSessionLocal))
+	try:
+		yield
+	finally:
+		db_check.cancel()
+		revocation_sync.cancel()
+		if metrics_flush is not None:
+			metrics_flush.cancel()
+			await metrics.flush(METRIC_POOLS)
+		password_pool.shutdown()
+		await cache.cache.close()
+		await async_engine.dispose()
+		engine.dispose()
+		logs.shutdown()
 
-import models.user
 
 # สร้าง FastAPI application instance
-app = FastAPI(title="Planary API")
+# default_response_class: encode JSON ด้วย orjson (ดู core/responses.py)
+app = FastAPI(title="Planary API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Mount folder media (/media/avatars/, /media/diary_images/) เพื่อให้เข้าถึงไฟล์รูปภาพผ่าน URL
+# เช่น http://localhost:8000/media/avatars/<sha256>.jpg
+# MediaFiles ตั้ง Cache-Control immutable/ETag ให้ไฟล์ชื่อ unique และรองรับ Range (ดู core/media.py)
+# check_dir=False: โฟลเดอร์ถูกสร้างใน lifespan (หลัง import)
+app.mount(
+	"/media",
+	MediaFiles(directory=settings.media_dir, accel_redirect=settings.media_accel_redirect, check_dir=False),
+	name="media",
+)
 
-# สร้างตาราง database ทั้งหมดตาม models ที่ import มา (ถ้ายังไม่มี)
-Base.metadata.create_all(bind=engine)
+# จำกัดจำนวน request ต่อ IP/email/user ของ login, register และ endpoint ที่หนัก (ดู POLICIES ใน core/rate_limit.py)
+# เพิ่มก่อน CORS เพื่อให้ response 429 ยังมี CORS headers
+app.add_middleware(RateLimitMiddleware)
 
-# Mount folder media (/media/avatars/) เพื่อให้เข้าถึงไฟล์รูปภาพผ่าน URL
-# เช่น http://localhost:8000/media/avatars/filename.jpg
-app.mount("/media", StaticFiles(directory=settings.media_dir), name="media")
+# ส่งเวลารอ connection จาก pool ของแต่ละ request กลับใน header Server-Timing (db-wait)
+app.add_middleware(db_pool.PoolWaitMiddleware)
+
+# ตอบ 503 ระหว่างที่ worker ยังต่อ DB ไม่ได้ตอน startup (ยกเว้น /ping, /ready, /metrics)
+app.add_middleware(readiness.ReadinessGate)
 
 # ตั้งค่า CORS เพื่อให้ frontend (mobile app) สามารถเรียก API ได้
 # สำหรับ development ใช้ allow_origins=["*"] เพื่อรับ request จากทุก origin
@@ -48,12 +107,45 @@ app.add_middleware(
 	allow_headers=["*"],  # อนุญาตทุก headers
 )
 
+# บีบอัด JSON/NDJSON/text ตาม Accept-Encoding (br/zstd/gzip) รวมถึง StreamingResponse (ดู core/compression.py)
+app.add_middleware(compression.CompressionMiddleware)
+
+# วัด latency/สถานะ/จำนวน query ต่อ route (นับ 429/503 ที่ middleware ข้างในตอบด้วย)
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Endpoint ทดสอบว่า server ทำงานหรือไม่
+# request id สำหรับผูก log ของ request เดียวกัน (ชั้นนอกสุด - log จากทุก middleware มี request id)
+app.add_middleware(logs.RequestIdMiddleware)
+
+
+# Endpoint ทดสอบว่า server ทำงานหรือไม่ (liveness - ไม่แตะ DB)
 @app.get("/ping")
 def ping():
 	return {"ping": "pong"}
 
+# Readiness: 200 เมื่อ startup เสร็จและต่อ DB ได้แล้ว, 503 ระหว่างรอ (ให้ load balancer ใช้ตัวนี้)
+@app.get("/ready")
+def ready():
+	snapshot = readiness.state.snapshot()
+	return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
+# Prometheus scrape endpoint (per-route latency, in-flight, status, DB queries/time, pool, threadpool)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+	return PlainTextResponse(await metrics.render(METRIC_POOLS), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Metrics ของ process pool สำหรับ bcrypt (จำนวนงานในคิว, latency, จำนวนที่ถูกปฏิเสธ)
+@app.get("/metrics/password-pool")
+def password_pool_metrics():
+	return password_pool.metrics()
+
+# Metrics ของ connection pool (checked out, overflow, เวลารอ, จำนวนครั้งที่รอจน timeout) แยก engine sync/async
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+	return {
+		"async": db_pool.snapshot(async_engine.pool),
+		"sync": db_pool.snapshot(engine.pool),
+	}
+
 # เชื่อมต่อ routers ทั้งหมดเข้ากับ app
 # แต่ละ router จัดการ endpoints ที่เกี่ยวข้อง
 app.include_router(register_router)  # POST /register - สมัครสมาชิก
@@ -64,33 +156,24 @@ app.include_router(diary_router)  # GET/POST/PUT/DELETE /diary - จัดกา
 app.include_router(activities_router)  # GET/POST/PUT/DELETE /activities - จัดการกิจกรรม
 app.include_router(routine_activities_router)  # GET/POST/PUT/DELETE /routine-activities - จัดการกิจกรรมประจำ
 app.include_router(trends_router)  # GET /trends/* - สำหรับหน้า Dashboard/Trends   
-app.include_router(token_router)  # POST /auth/refresh - แลก access token ใหม่ด้วย refresh token
+app.include_router(token_router)  # POST /auth/refresh, /auth/logout - หมุน refresh token / revoke token
+app.include_router(imports_router)  # POST /import - นำเข้ากิจกรรม/ไดอารี่จำนวนมาก (NDJSON/CSV)
+app.include_router(export_router)  # GET /profile/export - ดาวน์โหลดข้อมูลทั้งบัญชีเป็น ZIP
 
 
 # Custom error handler สำหรับ validation errors (422 Unprocessable Entity)
-# ใช้ในการ debug เมื่อ request body ไม่ตรงกับ schema ที่กำหนด
+# log ผ่านคิว (core/logs.py) - ข้อความซ้ำจาก client ที่ส่งผิดรัว ๆ ถูกจำกัด/สุ่มเก็บ และ body ถูกตัดตาม LOG_BODY_PREVIEW_BYTES
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc: RequestValidationError):
-	# Print รายละเอียด validation error ออกมาใน console เพื่อช่วย debug
 	# ไม่ await request.json() เพราะอาจทำให้เกิด CancelledError ตอน shutdown
 	body_preview = '<body not read>'
 	try:
 		# พยายามอ่าน raw body จาก request.scope ถ้ามี
 		if hasattr(request, 'scope') and 'body' in request.scope:
-			body_preview = request.scope.get('body')
+			body_preview = logs.preview(request.scope.get('body'))
 	except Exception:
 		body_preview = '<unable to read body>'
-	
-	# แสดงข้อมูล error ใน console
-	print('\n=== Request validation error ===')
-	try:
-		print('Request:', request.method, request.url)  # เช่น POST /diary
-	except Exception:
-		print('Request: <unavailable>')
-	print('Errors:', exc.errors())  # รายละเอียด field ไหนผิด
-	print('Body preview:', body_preview)  # ข้อมูลที่ส่งมา
-	print('================================\n')
-	
+
 	# ทำความสะอาด error details เพื่อให้ JSON serializable (เช่น ถ้ามี Exception objects)
 	cleaned = []
 	for e in exc.errors():
@@ -102,7 +185,6 @@ async def validation_exception_handler(request, exc: RequestValidationError):
 			for k, v in ctx.items():
 				# convert exception objects or non-json values to strings
 				try:
-					import json
 					json.dumps(v)
 					clean_ctx[k] = v
 				except Exception:
@@ -118,5 +200,16 @@ async def validation_exception_handler(request, exc: RequestValidationError):
 			err['ctx'] = str(ctx)
 		cleaned.append(err)
 
+	# รายละเอียด field ไหนผิด + body ที่ส่งมา (ตัดแล้ว) - input ของแต่ละ error ก็ตัดเหมือนกัน
+	logger.warning(
+		"Request validation failed",
+		extra={
+			"method": request.method,
+			"path": request.url.path,
+			"errors": [{**err, "input": logs.preview(err["input"])} if "input" in err else err for err in cleaned],
+			"body_preview": body_preview,
+		},
+	)
+
 	# ส่ง response กลับไปพร้อม error details ที่ถูกทำให้ JSON-safe
 	return JSONResponse(status_code=422, content={"detail": cleaned})
@@ -0,0 +1,16 @@
+-- Migration: เพิ่มตาราง diary_images เก็บ metadata ของรูปแนบ diary
+-- แทนการไล่อ่าน folder media/diary_images/<diary_id>/ ทุกครั้งที่ list
+-- หลังรัน migration ให้รัน scripts/reconcile_diary_images.py เพื่อนำเข้าไฟล์เดิม
+
+CREATE TABLE IF NOT EXISTS diary_images (
+    id UUID PRIMARY KEY,
+    diary_id UUID NOT NULL REFERENCES diaries(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER NULL,
+    height INTEGER NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT uq_diary_images_diary_name UNIQUE (diary_id, name)
+);
+
+CREATE INDEX IF NOT EXISTS ix_diary_images_diary_id ON diary_images (diary_id);
@@ -0,0 +1,15 @@
+-- Migration: รองรับ keyset pagination ของ diary และ counter cache ของจำนวน diary
+-- 1) index สำหรับ ORDER BY date DESC, time DESC, id DESC ต่อ user
+-- 2) users.diary_count แทน COUNT(*) ทุกครั้งที่โหลดหน้า
+
+CREATE INDEX IF NOT EXISTS ix_diaries_user_date_time_id
+    ON diaries (user_id, date, time, id);
+
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS diary_count INTEGER NOT NULL DEFAULT 0;
+
+-- เติมค่าเริ่มต้นจากข้อมูลที่มีอยู่
+UPDATE users u
+SET diary_count = sub.cnt
+FROM (SELECT user_id, COUNT(*) AS cnt FROM diaries GROUP BY user_id) sub
+WHERE sub.user_id = u.id;
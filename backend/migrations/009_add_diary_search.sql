@@ -0,0 +1,21 @@
+-- Migration: ค้นหา diary ด้วย full-text search + trigram
+-- search_vector: tsvector (config 'simple') สำหรับคำที่คั่นด้วยช่องว่าง
+-- search_text + pg_trgm: สำหรับภาษาไทยที่ไม่มีช่องว่างระหว่างคำ (ค้นแบบ substring ด้วย ILIKE)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE diaries
+ADD COLUMN IF NOT EXISTS search_text TEXT
+    GENERATED ALWAYS AS (coalesce(title, '') || ' ' || coalesce(detail, '') || ' ' || coalesce(tags, '')) STORED;
+
+ALTER TABLE diaries
+ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(detail, '') || ' ' || coalesce(tags, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_diaries_search_vector
+    ON diaries USING gin (search_vector);
+
+CREATE INDEX IF NOT EXISTS ix_diaries_search_text_trgm
+    ON diaries USING gin (search_text gin_trgm_ops);
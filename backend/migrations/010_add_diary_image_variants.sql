@@ -0,0 +1,3 @@
+-- Migration: สถานะการสร้างรูปย่อ (thumb/display WebP) ของรูป diary
+ALTER TABLE diary_images
+ADD COLUMN IF NOT EXISTS has_variants BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,43 @@
+-- Migration: แยก activities ที่แนบใน diary (JSONB) ออกมาเป็นตาราง diary_activity_feedback
+-- หนึ่งแถวต่อกิจกรรม เพื่อ query สถิติฝั่ง SQL ด้วย index (Diary.activities ยังเก็บไว้สำหรับ response)
+
+CREATE TABLE IF NOT EXISTS diary_activity_feedback (
+    id UUID PRIMARY KEY,
+    diary_id UUID NOT NULL REFERENCES diaries(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    activity_id UUID NULL REFERENCES activities(id) ON DELETE SET NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    category VARCHAR(100) NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    rating INTEGER NULL,
+    activity_mood VARCHAR(50) NULL,
+    status VARCHAR(50) NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_diary_activity_feedback_diary_id ON diary_activity_feedback (diary_id);
+CREATE INDEX IF NOT EXISTS ix_diary_activity_feedback_activity_id ON diary_activity_feedback (activity_id);
+CREATE INDEX IF NOT EXISTS ix_diary_activity_feedback_user_category ON diary_activity_feedback (user_id, category);
+
+-- Backfill จาก diaries.activities (ข้าม diary ที่มี row อยู่แล้ว จึงรันซ้ำได้)
+-- activity_id ใส่เฉพาะเมื่อ id ใน JSON ตรงกับ activity ของ user เดียวกันที่ยังมีอยู่
+INSERT INTO diary_activity_feedback (
+    id, diary_id, user_id, activity_id, position, category, title, rating, activity_mood, status
+)
+SELECT
+    gen_random_uuid(),
+    d.id,
+    d.user_id,
+    a.id,
+    (item.ordinality - 1)::int,
+    left(coalesce(item.value->>'category', ''), 100),
+    left(coalesce(item.value->>'title', ''), 200),
+    CASE WHEN item.value->>'rating' ~ '^-?[0-9]+$' THEN (item.value->>'rating')::int END,
+    left(nullif(item.value->>'activityMood', ''), 50),
+    left(nullif(item.value->>'status', ''), 50)
+FROM diaries d
+CROSS JOIN LATERAL jsonb_array_elements(d.activities) WITH ORDINALITY AS item(value, ordinality)
+LEFT JOIN activities a
+    ON a.id::text = item.value->>'id' AND a.user_id = d.user_id
+WHERE jsonb_typeof(d.activities) = 'array'
+  AND jsonb_typeof(item.value) = 'object'
+  AND NOT EXISTS (SELECT 1 FROM diary_activity_feedback f WHERE f.diary_id = d.id);
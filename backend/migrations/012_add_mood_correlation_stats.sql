@@ -0,0 +1,22 @@
+-- Migration: สถิติ mood vs activity แบบ incremental (GET /trends/mood-correlation)
+-- ไม่ต้อง backfill: ครั้งแรกที่ user เรียก endpoint ระบบจะคำนวณจากประวัติทั้งหมดให้เอง
+-- หลังจากนั้นอัปเดตทีละวันทุกครั้งที่เขียน diary/activity (core/mood_stats.py)
+
+CREATE TABLE IF NOT EXISTS mood_correlation_stats (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(10) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    days INTEGER NOT NULL DEFAULT 0,
+    mood_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mood_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, kind, key)
+);
+
+CREATE TABLE IF NOT EXISTS mood_day_stats (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    mood DOUBLE PRECISION NULL,
+    band VARCHAR(10) NULL,
+    categories JSONB NULL,
+    PRIMARY KEY (user_id, date)
+);
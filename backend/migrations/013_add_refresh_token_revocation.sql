@@ -0,0 +1,17 @@
+-- Migration: refresh token rotation + revocation (POST /auth/refresh, POST /auth/logout)
+-- users.token_version: refresh token ที่ claim "ver" ไม่ตรงกับค่านี้ใช้ไม่ได้ (เพิ่มค่า = revoke ทั้งหมดของ user)
+-- revoked_tokens: jti ของ refresh token ที่ถูกใช้ไปแล้วหรือ logout (ลบได้เมื่อเลย expires_at)
+-- หมายเหตุ: refresh token ที่ออกก่อน migration นี้ไม่มี jti จะใช้ไม่ได้ ผู้ใช้ต้อง login ใหม่หนึ่งครั้ง
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    user_id UUID NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS ix_revoked_tokens_user_id ON revoked_tokens (user_id);
+CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at);
+CREATE INDEX IF NOT EXISTS ix_revoked_tokens_created_at ON revoked_tokens (created_at);
@@ -8,17 +8,32 @@ diary.py - Model สำหรับตาราง diaries ในฐานข้
     - positive_score, negative_score, mood_score (overall)
     - mood_tags: emoji tags ที่เลือก
 - เก็บ list ของกิจกรรมที่ทำในวันนั้น (activities)
+- มี generated columns สำหรับค้นหา (search_text, search_vector) ให้ PostgreSQL คำนวณเอง
 """
 
 import uuid
-from sqlalchemy import Column, String, Integer, Date, Time, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, Computed, String, Integer, Date, Time, DateTime, ForeignKey, Index, Text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from db.session import Base
 
+# ข้อความที่ใช้ค้นหา: title + detail + tags (ใช้ || แทน concat_ws เพราะต้องเป็น immutable)
+SEARCH_TEXT_SQL = "coalesce(title, '') || ' ' || coalesce(detail, '') || ' ' || coalesce(tags, '')"
+# ใช้ config 'simple' (ไม่ stem ตามภาษา) เพราะข้อมูลมีทั้งไทยและอังกฤษ
+SEARCH_CONFIG = "simple"
 
 class Diary(Base):
     __tablename__ = "diaries"
+    __table_args__ = (
+        # สำหรับ keyset pagination: WHERE user_id = ? ORDER BY date DESC, time DESC, id DESC
+        # (PostgreSQL scan index ย้อนกลับได้ จึงไม่ต้องสร้างแบบ DESC)
+        Index("ix_diaries_user_date_time_id", "user_id", "date", "time", "id"),
+        # full-text search (คำที่คั่นด้วยช่องว่าง เช่น ภาษาอังกฤษ)
+        # ส่วน trigram index ของ search_text (สำหรับภาษาไทยที่ไม่มีช่องว่าง) สร้างใน migration 009
+        # เพราะต้องใช้ extension pg_trgm
+        Index("ix_diaries_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -65,3 +80,10 @@ class Diary(Base):
         nullable=False,
     )
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Generated columns สำหรับค้นหา (ไม่โหลดมาโดย default เพื่อไม่ให้รายการปกติหนักขึ้น)
+    search_text = deferred(Column(Text, Computed(SEARCH_TEXT_SQL, persisted=True)))
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, {SEARCH_TEXT_SQL})", persisted=True),
+    ))
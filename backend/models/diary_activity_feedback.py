@@ -0,0 +1,58 @@
+"""
+diary_activity_feedback.py - Model สำหรับตาราง diary_activity_feedback ในฐานข้อมูล
+
+หน้าที่:
+- เก็บ feedback ของกิจกรรมที่แนบกับ diary (category, title, rating, activityMood, status)
+  แบบหนึ่งแถวต่อหนึ่งกิจกรรม แทนการ parse JSON ใน Diary.activities ทุกครั้ง
+- ใช้ทำ aggregate ฝั่ง SQL ได้ด้วย index เช่น "หมวดไหนมักอยู่ในวันที่อารมณ์ดี"
+- Diary.activities (JSONB) ยังเก็บไว้เหมือนเดิมเพื่อใช้ส่ง response รูปแบบเดิม
+  router เขียนทั้งสองที่พร้อมกัน (ดู _sync_activity_feedback ใน routers/diary.py)
+
+ความสัมพันธ์:
+- DiaryActivityFeedback belongs to Diary (many-to-one, ลบ diary แล้วลบ row ตาม)
+- DiaryActivityFeedback belongs to User (เก็บซ้ำไว้เพื่อ filter ต่อ user ได้โดยไม่ต้อง join)
+- activity_id ชี้ไปที่ Activity ถ้ายังมีอยู่ (ลบ activity แล้วเป็น null แต่ feedback ยังอยู่)
+"""
+
+import uuid
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from db.session import Base
+
+
+class DiaryActivityFeedback(Base):
+    __tablename__ = "diary_activity_feedback"
+    __table_args__ = (
+        # aggregate ต่อ user ตาม category (เช่น mood correlation)
+        Index("ix_diary_activity_feedback_user_category", "user_id", "category"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    diary_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("diaries.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    activity_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("activities.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+
+    # ลำดับใน Diary.activities (ใช้เรียงกลับเป็น JSON ได้ตรงตามเดิม)
+    position = Column(Integer, nullable=False, default=0)
+
+    # ค่าที่ copy มาจาก ActivityFeedback ตอนเขียน diary
+    category = Column(String(100), nullable=False)
+    title = Column(String(200), nullable=False)
+    rating = Column(Integer, nullable=True)
+    activity_mood = Column(String(50), nullable=True)
+    status = Column(String(50), nullable=True)
@@ -0,0 +1,53 @@
+"""
+diary_image.py - Model สำหรับตาราง diary_images ในฐานข้อมูล
+
+หน้าที่:
+- เก็บ metadata ของรูปที่แนบกับ diary (ชื่อไฟล์, ขนาดไฟล์, ความกว้าง/สูง, เวลาอัปโหลด)
+- บอกว่ารูปย่อ (WebP) ถูกสร้างแล้วหรือยัง (has_variants)
+- ไฟล์จริงยังอยู่ที่ media/diary_images/<diary_id>/<name>
+- ใช้นับจำนวนรูปด้วย query เดียว แทนการไล่อ่าน folder ทีละ diary
+
+ความสัมพันธ์:
+- DiaryImage belongs to Diary (many-to-one, ลบ diary แล้วลบ row ตาม)
+"""
+
+import uuid
+from sqlalchemy import Boolean, Column, String, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from db.session import Base
+
+
+class DiaryImage(Base):
+    __tablename__ = "diary_images"
+    __table_args__ = (
+        # ชื่อไฟล์ไม่ซ้ำภายใน diary เดียวกัน
+        UniqueConstraint("diary_id", "name", name="uq_diary_images_diary_name"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # diary เจ้าของรูป (index ไว้สำหรับ count/join)
+    diary_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("diaries.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    # ชื่อไฟล์ใน folder ของ diary เช่น "958b51280d4a4e158444d4afab7caa1e.jpg"
+    name = Column(String(255), nullable=False)
+
+    # ขนาดไฟล์ (bytes) และขนาดรูป (pixel) - width/height เป็น null ถ้าอ่าน header ไม่ได้
+    size = Column(Integer, nullable=False)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+
+    # worker สร้างรูปย่อ (thumb/display WebP) และลบ EXIF แล้วหรือยัง
+    has_variants = Column(Boolean, nullable=False, default=False, server_default="false")
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
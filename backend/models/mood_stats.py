@@ -0,0 +1,42 @@
+"""
+mood_stats.py - Models สำหรับสถิติ mood vs activity (GET /trends/mood-correlation)
+
+หน้าที่:
+- MoodCorrelationStats: sufficient statistics (จำนวนวัน, ผลรวม mood, ผลรวม mood^2)
+  ต่อ (user, kind, key) ใช้คำนวณค่าเฉลี่ย/ส่วนเบี่ยงเบนได้ทันทีโดยไม่ต้องอ่านประวัติทั้งหมด
+    - kind="all", key=""          : ทุกวันที่มี mood
+    - kind="category", key=หมวด   : วันที่มีกิจกรรมหมวดนั้น
+    - kind="band", key="0-25" ... : วันที่ completion rate อยู่ในช่วงนั้น ("none" = ไม่มีกิจกรรม)
+- MoodDayStats: ค่าที่แต่ละวันถูกนับเข้าไปแล้ว (mood, band, categories)
+  ใช้หักค่าเดิมออกก่อนบวกค่าใหม่เมื่อ diary/activity ของวันนั้นเปลี่ยน
+
+ดูการอัปเดตใน core/mood_stats.py
+"""
+
+from sqlalchemy import Column, String, Integer, Float, Date, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from db.session import Base
+
+
+class MoodCorrelationStats(Base):
+    __tablename__ = "mood_correlation_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String(10), primary_key=True)
+    key = Column(String(100), primary_key=True)
+
+    days = Column(Integer, nullable=False, default=0, server_default="0")
+    mood_sum = Column(Float, nullable=False, default=0, server_default="0")
+    mood_sq_sum = Column(Float, nullable=False, default=0, server_default="0")
+
+
+class MoodDayStats(Base):
+    __tablename__ = "mood_day_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+
+    # ค่าเฉลี่ย mood_score ของวันนั้น (null = วันนั้นไม่ถูกนับ)
+    mood = Column(Float, nullable=True)
+    band = Column(String(10), nullable=True)
+    categories = Column(JSONB, nullable=True)
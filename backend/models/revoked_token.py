@@ -0,0 +1,32 @@
+"""
+revoked_token.py - Model สำหรับตาราง revoked_tokens ในฐานข้อมูล
+
+หน้าที่:
+- เก็บ jti ของ refresh token ที่ใช้ไปแล้ว (rotation) หรือถูก logout
+  refresh token ที่มี jti อยู่ในตารางนี้ใช้ไม่ได้อีก
+- jti เป็น primary key: INSERT ... ON CONFLICT DO NOTHING จึงเป็นทั้งการ "ใช้" token และการตรวจว่าเคยใช้แล้วหรือยัง
+  ในคำสั่งเดียว (สอง request ที่ใช้ token เดียวกันพร้อมกันจะสำเร็จได้แค่ request เดียว)
+- expires_at = เวลาหมดอายุของ token เดิม เลยเวลานี้แล้วลบแถวทิ้งได้ (token หมดอายุเองอยู่แล้ว)
+- การ revoke ทั้งหมดของ user ไม่เขียนลงตารางนี้ แต่เพิ่ม User.token_version แทน (ดู core/token_revocation.py)
+
+ความสัมพันธ์:
+- ไม่มี foreign key ไปที่ users (ลบบัญชีแล้ว refresh token ของ user นั้นใช้ไม่ได้อยู่แล้ว)
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+from db.session import Base
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+
+    # เวลาหมดอายุของ refresh token (ใช้ลบแถวเก่า)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    # เวลาที่ revoke (ใช้ sync แบบ incremental เข้า cache ในแต่ละ process)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
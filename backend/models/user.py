@@ -42,3 +42,11 @@ class User(Base):
     # Avatar URL: path ของรูปโปรไฟล์ เช่น "media/avatars/uuid.jpg"
     # สามารถเป็น null ได้ (ถ้ายังไม่อัปโหลดรูป)
     avatar_url = Column(String(512), nullable=True)
+
+    # จำนวน diary ของ user (counter cache) ใช้แทน COUNT(*) ตอนแสดง total ในหน้ารายการ
+    # อัปเดตใน create/delete diary และ bulk import
+    diary_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # รุ่นของ refresh token: ใส่ใน claim "ver" ตอนออก token
+    # เพิ่มค่านี้ = revoke refresh token ทุกอันของ user ในคำสั่งเดียว (เช่นตอนเปลี่ยนรหัสผ่าน)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
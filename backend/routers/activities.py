@@ -7,6 +7,7 @@ activities.py - API Endpoints สำหรับจัดการกิจก
 - GET /activities/{id} - ดึงกิจกรรมตัวเดียว
 - PUT /activities/{id} - แก้ไขกิจกรรม
 - DELETE /activities/{id} - ลบกิจกรรม
+- GET /activities/calendar.ics - ส่งออกกิจกรรม + routine เป็น iCalendar feed (stream)
 
 คุณสมบัติพิเศษ - Auto-Instantiate Routines:
 เมื่อเรียก GET /activities?qdate=... ระบบจะ:
@@ -20,20 +21,37 @@ activities.py - API Endpoints สำหรับจัดการกิจก
 - Activity.routine_id ชี้ไปที่ RoutineActivity.id
 - แก้ไข/ลบ Activity จะไม่กระทบ RoutineActivity (แม่แบบ)
 - วันพรุ่งนี้ระบบจะสร้าง Activity ใหม่จากแม่แบบอีกครั้ง
+
+list ส่ง JSON ที่ serialize ครั้งเดียวด้วย core/responses.serialized (ไม่ validate response_model ซ้ำ)
+
+endpoint เป็น async def (AsyncSession) ยกเว้นตัว generator ของ calendar.ics
+ที่ยังใช้ SessionLocal (sync) + server-side cursor เพราะ StreamingResponse รัน iterator แบบ sync ใน threadpool
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.activity import Activity
 from models.routine_activity import RoutineActivity # Import แม่แบบกิจกรรมประจำ
-from models.user import User
-from db.session import get_db
+from core.auth_cache import Principal
+from db.session import get_async_db, SessionLocal
 from routers.profile import current_user # Dependency สำหรับตรวจสอบ user ที่ login
+from routers.routine_activities import load_routine_templates, lock_live_routines # แม่แบบของ user (ผ่าน core/cache.py)
 from schemas.activities import ActivityCreate, ActivityUpdate, ActivityOut, ActivityList
+from core import ical, logs, mood_stats
+from core.query_budget import query_budget
+from core.responses import etag_matches, serialized
 import datetime
+import hashlib
+import logging
 from uuid import UUID
 
 router = APIRouter(prefix="/activities", tags=["Activities"])
+logger = logging.getLogger(__name__)
+
+# คอลัมน์ที่ ActivityOut ใช้ สำหรับ list แบบอ่านอย่างเดียว (Core select)
+ACTIVITY_OUT_COLUMNS = [getattr(Activity, name) for name in ActivityOut.model_fields]
 
 DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
 
@@ -72,11 +90,12 @@ def get_week_end(date_value: datetime.date) -> datetime.date:
     return date_value + datetime.timedelta(days=(6 - date_value.weekday()))
 
 @router.get("/month/{year}/{month}", response_model=dict)
-def get_month_activities(
+@query_budget(16)
+async def get_month_activities(
     year: int,
     month: int,
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     ดึงรายการวันที่มีกิจกรรมในเดือนที่กำหนด พร้อมประเภท
@@ -98,14 +117,25 @@ def get_month_activities(
     else:
         end_date = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
     
-    # ดึง RoutineActivities ทั้งหมดของ user
-    all_routines = db.query(RoutineActivity).filter(
-        RoutineActivity.user_id == me.id
-    ).all()
+    # ดึง RoutineActivities ทั้งหมดของ user (cache ต่อ user)
+    all_routines = await load_routine_templates(db, me.id)
     
     today = datetime.date.today()
+    week_end = get_week_end(today)
+
+    # (routine_id, date) ที่ instantiate แล้วในช่วงที่ต้องสร้าง - query เดียวแทนการเช็คทีละ routine ทีละวัน
+    window_start, window_end = max(start_date, today), min(end_date, week_end)
+    existing_pairs = set()
+    if all_routines and window_start <= window_end:
+        existing_pairs = set((await db.execute(select(Activity.routine_id, Activity.date).where(
+            Activity.user_id == me.id,
+            Activity.routine_id.is_not(None),
+            Activity.date >= window_start,
+            Activity.date <= window_end
+        ))).all())
 
     # วนลูปแต่ละวันในเดือน และ instantiate routines ที่ยังไม่มี
+    new_activities = []
     current_date = start_date
     while current_date <= end_date:
         if current_date < today or current_date > week_end:
@@ -119,14 +149,8 @@ def get_month_activities(
         
         # ตรวจสอบว่า routine ไหนยังไม่ถูก instantiate
         for routine in day_routines:
-            existing = db.query(Activity).filter(
-                Activity.user_id == me.id,
-                Activity.date == current_date,
-                Activity.routine_id == routine.id
-            ).first()
-            
             # ถ้าไม่มี ให้สร้างใหม่
-            if not existing:
+            if (routine.id, current_date) not in existing_pairs:
                 copied_subtasks = None
                 if routine.subtasks:
                     import uuid
@@ -158,19 +182,24 @@ def get_month_activities(
                     remind_type="simple",
                     remind_sound=True if routine.remind_sound is None else bool(routine.remind_sound),
                 )
-                db.add(new_activity)
+                new_activities.append(new_activity)
         
         current_date += datetime.timedelta(days=1)
     
-    # Commit ทั้งหมดที่สร้างใหม่
-    db.commit()
+    # ข้ามแม่แบบที่ถูกลบไปแล้ว (แม่แบบอาจมาจาก cache) แล้ว commit ทั้งหมดที่สร้างใหม่
+    live = await lock_live_routines(db, me.id, {a.routine_id for a in new_activities})
+    new_activities = [a for a in new_activities if a.routine_id in live]
+    if new_activities:
+        db.add_all(new_activities)
+        await db.run_sync(mood_stats.refresh_days, me.id, sorted({a.date for a in new_activities}))
+        await db.commit()
     
     # ดึงกิจกรรมทั้งหมดในเดือนหลังจาก instantiate
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.user_id == me.id,
         Activity.date >= start_date,
         Activity.date <= end_date
-    ).all()
+    ))).scalars().all()
     
     # แยกวันตามประเภท: routine (มี routine_id) และ regular (ไม่มี routine_id)
     routine_dates = set()
@@ -189,10 +218,11 @@ def get_month_activities(
     }
 
 @router.get("", response_model=ActivityList)
-def list_activities(
+@query_budget(16)
+async def list_activities(
     qdate: str = Query(..., description="Date in YYYY-MM-DD format"), # ✅ บังคับให้ส่ง qdate มา
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     ดึงกิจกรรมทั้งหมดในวันที่กำหนด
@@ -211,24 +241,21 @@ def list_activities(
     day_key = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"][target_date.weekday()]
 
     if target_date < today:
-        existing_activities = db.query(Activity).filter(
+        # วันที่ผ่านมาแล้วอ่านอย่างเดียว: Core row เฉพาะคอลัมน์ของ ActivityOut (ไม่สร้าง ORM object)
+        rows = (await db.execute(select(*ACTIVITY_OUT_COLUMNS).where(
             Activity.user_id == me.id,
             Activity.date == target_date
-        ).all()
-        existing_activities.sort(key=lambda x: x.time if x.time else datetime.time.max)
-        return ActivityList(items=existing_activities)
+        ).order_by(Activity.time.asc().nulls_last()))).all()
+        return serialized(ActivityList, {"items": rows})
 
-    # 2. ดึง "แม่แบบ" ทั้งหมดของวันนั้น
-    routine_templates = db.query(RoutineActivity).filter(
-        RoutineActivity.user_id == me.id,
-        RoutineActivity.day_of_week == day_key
-    ).all()
+    # 2. ดึง "แม่แบบ" ทั้งหมดของวันนั้น (cache ต่อ user)
+    routine_templates = [r for r in await load_routine_templates(db, me.id) if r.day_of_week == day_key]
 
     # 3. ดึง "กิจกรรมจริง" ที่มีอยู่แล้วของวันนั้น
-    existing_activities = db.query(Activity).filter(
+    existing_activities = list((await db.execute(select(Activity).where(
         Activity.user_id == me.id,
         Activity.date == target_date
-    ).all()
+    ))).scalars().all())
 
     # 4. หาว่าแม่แบบไหนยังไม่ถูกสร้างเป็นกิจกรรมจริง
     existing_routine_ids = {str(act.routine_id) for act in existing_activities if act.routine_id}
@@ -271,25 +298,28 @@ def list_activities(
             )
             new_activities_to_create.append(new_activity)
 
-    # 5. บันทึกกิจกรรมใหม่ลง DB (ถ้ามี)
+    # 5. บันทึกกิจกรรมใหม่ลง DB (ถ้ามี) - ข้ามแม่แบบที่ถูกลบไปแล้ว (แม่แบบอาจมาจาก cache)
+    live = await lock_live_routines(db, me.id, {a.routine_id for a in new_activities_to_create})
+    new_activities_to_create = [a for a in new_activities_to_create if a.routine_id in live]
     if new_activities_to_create:
         db.add_all(new_activities_to_create)
-        db.commit()
+        await db.run_sync(mood_stats.refresh_days, me.id, [target_date])
+        await db.commit()
         # ดึงข้อมูลทั้งหมดอีกครั้งเพื่อรวมกิจกรรมที่เพิ่งสร้าง
-        all_activities_for_day = db.query(Activity).filter(
+        all_activities_for_day = (await db.execute(select(Activity).where(
             Activity.user_id == me.id,
             Activity.date == target_date
-        ).order_by(Activity.time).all()
-        return ActivityList(items=all_activities_for_day)
+        ).order_by(Activity.time))).scalars().all()
+        return serialized(ActivityList, {"items": all_activities_for_day})
 
     # 6. ถ้าไม่มีอะไรใหม่ ก็ส่งของเดิมกลับไป
     existing_activities.sort(key=lambda x: x.time if x.time else datetime.time.max)
-    return ActivityList(items=existing_activities)
+    return serialized(ActivityList, {"items": existing_activities})
 
 # --- Endpoints อื่นๆ ---
 
 @router.post("", response_model=ActivityOut, status_code=201)
-def create_activity(payload: ActivityCreate, db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def create_activity(payload: ActivityCreate, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
     """
     สร้างกิจกรรมเฉพาะกิจ (ที่ไม่ใช่ Routine)
     """
@@ -299,15 +329,16 @@ def create_activity(payload: ActivityCreate, db: Session = Depends(get_db), me:
         data["status"] = _normalize_status(data["status"])
     row = Activity(user_id=me.id, **data)
     db.add(row)
-    db.commit()
-    db.refresh(row)
+    await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit()
+    await db.refresh(row)
     return row
 
 
 @router.get("/debug/all-today", response_model=list)
-def debug_all_activities_today(
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+async def debug_all_activities_today(
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     Debug endpoint: ดึงกิจกรรมทั้งหมดของวันนี้ (ไม่มี filter เวลา)
@@ -317,12 +348,12 @@ def debug_all_activities_today(
     now = datetime.now()
     today = now.date()
     
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.user_id == me.id,
         Activity.date == today,
         Activity.all_day == False,
         Activity.time.isnot(None)
-    ).all()
+    ))).scalars().all()
     
     result = []
     for act in activities:
@@ -351,37 +382,215 @@ def debug_all_activities_today(
 
 
 
+# -------------------------------
+# iCalendar feed (ต้องประกาศก่อน /{activity_id} เพื่อไม่ให้ path ชนกัน)
+# -------------------------------
+
+# จำนวนแถวที่ดึงต่อรอบจาก server-side cursor และจำนวน VEVENT ต่อ chunk ที่ส่งออก
+ICS_BATCH_SIZE = 500
+ICS_CHUNK_EVENTS = 100
+
+def _routine_snapshot(routine: RoutineActivity) -> dict:
+    """เก็บค่าที่ต้องใช้ของ routine เป็น dict (ใช้ต่อใน generator หลัง session ของ request ปิดแล้ว)"""
+    return {
+        "id": routine.id,
+        "day_of_week": routine.day_of_week,
+        "title": routine.title,
+        "category": routine.category,
+        "time": routine.time,
+        "notes": routine.notes,
+        "reminder_minutes": _parse_reminder_minutes(routine.reminder_minutes),
+    }
+
+def _routine_first_date(day_of_week: str, start: datetime.date) -> datetime.date:
+    """วันแรกที่ตรงกับ day_of_week ตั้งแต่ start เป็นต้นไป"""
+    target = DAY_KEYS.index(day_of_week)
+    return start + datetime.timedelta(days=(target - start.weekday()) % 7)
+
+def _routine_event(routine: dict, start: datetime.date, end: datetime.date | None) -> str:
+    first = _routine_first_date(routine["day_of_week"], start)
+    rrule = f"FREQ=WEEKLY;BYDAY={ical.BYDAY[routine['day_of_week']]}"
+    if end is not None:
+        if routine["time"] is None:
+            rrule += f";UNTIL={ical.format_date(end)}"
+        else:
+            rrule += f";UNTIL={ical.format_local_datetime(end, routine['time'])}"
+    alarm = routine["reminder_minutes"] if routine["time"] else None
+    return ical.build_event(
+        f"routine-{routine['id']}@planary",
+        first,
+        routine["time"],
+        routine["title"],
+        description=routine["notes"],
+        category=routine["category"],
+        status="CONFIRMED",
+        rrule=rrule,
+        alarm_minutes=alarm,
+    )
+
+def _activity_event(act: Activity, routines: dict, start: datetime.date) -> str:
+    """
+    แปลง Activity เป็น VEVENT
+    - ถ้ามาจาก routine (และตรงกับ RRULE) จะส่งเป็น override ของ instance นั้น (RECURRENCE-ID)
+      เพื่อไม่ให้ปฏิทินแสดงซ้ำกับ routine
+    - ถ้าไม่ใช่ ส่งเป็น event เดี่ยว
+    """
+    at = None if act.all_day else act.time
+    uid = f"activity-{act.id}@planary"
+    recurrence_of = None
+    routine = routines.get(act.routine_id) if act.routine_id else None
+    if routine and DAY_KEYS[act.date.weekday()] == routine["day_of_week"] and act.date >= start:
+        uid = f"routine-{routine['id']}@planary"
+        recurrence_of = (act.date, routine["time"])
+    return ical.build_event(
+        uid,
+        act.date,
+        at,
+        act.title,
+        stamp=act.updated_at or act.created_at,
+        description=act.notes,
+        category=act.category,
+        status="CANCELLED" if act.status == "cancelled" else "CONFIRMED",
+        recurrence_of=recurrence_of,
+        alarm_minutes=act.remind_offset_min if (act.remind and at is not None) else None,
+        extra=[f"X-PLANARY-STATUS:{ical.escape_text(act.status or 'normal')}"],
+    )
+
+def _stream_calendar(user_id, start: datetime.date | None, end: datetime.date | None, routines: list[dict]):
+    """
+    Generator สำหรับ StreamingResponse
+    ใช้ session ของตัวเอง (request session อาจถูกปิดก่อน stream จบ)
+    และใช้ yield_per เพื่อให้ psycopg2 ใช้ server-side cursor ไม่โหลดทั้งประวัติเข้า memory
+    """
+    db = SessionLocal()
+    try:
+        yield ical.calendar_header("Planary")
+        routine_start = start or datetime.date.today()
+        routine_map = {r["id"]: r for r in routines}
+        for routine in routines:
+            yield _routine_event(routine, routine_start, end)
+
+        query = db.query(Activity).filter(Activity.user_id == user_id)
+        if start is not None:
+            query = query.filter(Activity.date >= start)
+        if end is not None:
+            query = query.filter(Activity.date <= end)
+        query = query.order_by(Activity.date, Activity.time, Activity.id).yield_per(ICS_BATCH_SIZE)
+
+        chunk = []
+        for act in query:
+            chunk.append(_activity_event(act, routine_map, routine_start))
+            if len(chunk) >= ICS_CHUNK_EVENTS:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+        yield ical.calendar_footer()
+    finally:
+        db.close()
+
+async def _calendar_etag(db: AsyncSession, user_id, start, end, routines: list[dict]) -> str:
+    """
+    ETag ราคาถูก: ใช้ aggregate (count + max timestamp) แทนการอ่านทุกแถว
+    count เปลี่ยนเมื่อมีการลบ/เพิ่ม, max timestamp เปลี่ยนเมื่อมีการแก้ไข
+    """
+    query = select(
+        func.count(Activity.id),
+        func.max(func.coalesce(Activity.updated_at, Activity.created_at)),
+    ).where(Activity.user_id == user_id)
+    if start is not None:
+        query = query.where(Activity.date >= start)
+    if end is not None:
+        query = query.where(Activity.date <= end)
+    count, last_modified = (await db.execute(query)).one()
+
+    digest = hashlib.sha1()
+    # routine ใช้วันนี้เป็นจุดเริ่มเมื่อไม่ส่ง start มา จึงต้องรวมไว้ใน ETag ด้วย
+    routine_start = start or datetime.date.today()
+    digest.update(f"{user_id}|{routine_start}|{end}|{count}|{last_modified}".encode("utf-8"))
+    for r in routines:
+        digest.update(repr(sorted(r.items(), key=lambda kv: kv[0])).encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+@router.get("/calendar.ics")
+async def get_calendar_feed(
+    request: Request,
+    start_date: datetime.date | None = Query(None, description="วันเริ่ม (YYYY-MM-DD) ไม่ส่ง = ทั้งหมด"),
+    end_date: datetime.date | None = Query(None, description="วันสิ้นสุด (YYYY-MM-DD) ไม่ส่ง = ทั้งหมด"),
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
+):
+    """
+    ส่งออกกิจกรรมเป็น iCalendar feed (text/calendar)
+
+    - Activity ในช่วงวันที่ → VEVENT (stream ทีละ chunk จาก server-side cursor)
+    - RoutineActivity → VEVENT แบบ RRULE:FREQ=WEEKLY;BYDAY=..
+    - รองรับ If-None-Match: ถ้าข้อมูลไม่เปลี่ยนจะตอบ 304 โดยไม่สร้าง feed ใหม่
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date ต้องไม่มากกว่า end_date")
+
+    routines = [
+        _routine_snapshot(r)
+        for r in (await db.execute(
+            select(RoutineActivity).where(RoutineActivity.user_id == me.id).order_by(RoutineActivity.id)
+        )).scalars().all()
+        if r.day_of_week in DAY_KEYS
+    ]
+
+    etag = await _calendar_etag(db, me.id, start_date, end_date, routines)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = 'inline; filename="planary.ics"'
+    return StreamingResponse(
+        _stream_calendar(me.id, start_date, end_date, routines),
+        media_type="text/calendar; charset=utf-8",
+        headers=headers,
+    )
+
+
+
 @router.get("/{activity_id}", response_model=ActivityOut)
-def get_activity(activity_id: UUID, db: Session = Depends(get_db), me: User = Depends(current_user)):
+@query_budget(2)
+async def get_activity(activity_id: UUID, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
     """
     ดึงข้อมูลกิจกรรมเดี่ยว
     """
-    row = db.query(Activity).filter(Activity.id == activity_id, Activity.user_id == me.id).first()
-    if not row:
-        raise HTTPException(404, "ไม่พบกิจกรรม")
-    if row.routine_id and (not row.notes or not row.subtasks):
-        routine = db.query(RoutineActivity).filter(
-            RoutineActivity.id == row.routine_id,
+    # แม่แบบ (ถ้ามี) มาใน query เดียวกันด้วย outer join ไม่ต้องยิงรอบสอง
+    result = (await db.execute(
+        select(Activity, RoutineActivity)
+        .outerjoin(RoutineActivity, and_(
+            RoutineActivity.id == Activity.routine_id,
             RoutineActivity.user_id == me.id
-        ).first()
-        if routine:
-            if not row.notes:
-                row.notes = routine.notes
-            if not row.subtasks:
-                row.subtasks = routine.subtasks
+        ))
+        .where(Activity.id == activity_id, Activity.user_id == me.id)
+    )).first()
+    if not result:
+        raise HTTPException(404, "ไม่พบกิจกรรม")
+    row, routine = result
+    if routine:
+        if not row.notes:
+            row.notes = routine.notes
+        if not row.subtasks:
+            row.subtasks = routine.subtasks
     return row
 
 @router.put("/{activity_id}", response_model=ActivityOut)
-def update_activity(
+async def update_activity(
     activity_id: UUID,
     payload: dict = Body(...),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     อัปเดตกิจกรรมเดี่ยว (เช่น เปลี่ยนสถานะ, แก้ไขโน้ต)
     """
-    row = db.query(Activity).filter(Activity.id == activity_id, Activity.user_id == me.id).first()
+    row = await db.scalar(select(Activity).where(Activity.id == activity_id, Activity.user_id == me.id))
     if not row:
         raise HTTPException(404, "ไม่พบกิจกรรม")
     
@@ -389,15 +598,15 @@ def update_activity(
     if isinstance(payload, dict) and 'date' in payload:
         payload.pop('date')
 
-    # Log payload for debugging
-    print(f"[DEBUG] PUT /activities/{activity_id} payload:", payload)
+    # Log payload for debugging (ตัดตาม LOG_BODY_PREVIEW_BYTES)
+    logger.debug("Activity update payload", extra={"activity_id": str(activity_id), "payload": logs.preview(payload)})
 
     # Validate remaining fields with ActivityUpdate schema
     try:
         validated = ActivityUpdate.model_validate(payload)
     except Exception as e:
         # Re-raise as HTTP 422 with validation details
-        print(f"[ERROR] Validation failed: {e}")
+        logger.info("Activity update rejected", extra={"activity_id": str(activity_id), "error": logs.preview(e)})
         raise HTTPException(status_code=422, detail=str(e))
 
     update_data = validated.model_dump(exclude_unset=True)
@@ -411,26 +620,30 @@ def update_activity(
     
     for k, v in update_data.items():
         setattr(row, k, v)
-        
-    db.commit()
-    db.refresh(row)
+
+    # status/category มีผลกับสถิติ mood vs activity ของวันนั้น
+    if "status" in update_data or "category" in update_data:
+        await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit()
+    await db.refresh(row)
     return row
 
 @router.delete("/{activity_id}", status_code=204)
-def delete_activity(
+async def delete_activity(
     activity_id: UUID, 
-    db: Session = Depends(get_db), 
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    me: Principal = Depends(current_user)
 ):
     """
     ลบกิจกรรมเดี่ยว
     (ถ้าลบกิจกรรมที่มาจาก Routine ก็จะหายไปแค่วันนี้ วันพรุ่งนี้ระบบจะสร้างให้ใหม่)
     """
-    row = db.query(Activity).filter(Activity.id == activity_id, Activity.user_id == me.id).first()
+    row = await db.scalar(select(Activity).where(Activity.id == activity_id, Activity.user_id == me.id))
     if not row:
         raise HTTPException(404, "ไม่พบกิจกรรม")
-    db.delete(row)
-    db.commit()
+    await db.delete(row)
+    await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit()
     return
 
 
@@ -2,11 +2,21 @@
 diary.py - API Endpoints สำหรับจัดการไดอารี่ (Diary)
 
 หน้าที่หลัก:
-- GET /diary - ดึงรายการไดอารี่ทั้งหมด (มี filter ตาม date range)
+- GET /diary - ดึงรายการไดอารี่ทั้งหมด (มี filter ตาม date range, แบ่งหน้าด้วย limit + cursor ได้)
 - POST /diary - สร้างไดอารี่ใหม่
+- GET /diary/search?q= - ค้นหาไดอารี่ (full-text + trigram สำหรับภาษาไทย) เรียงตามความเกี่ยวข้อง
 - GET /diary/{id} - ดึงไดอารี่ตัวเดียว
 - PUT /diary/{id} - แก้ไขไดอารี่
 - DELETE /diary/{id} - ลบไดอารี่
+- GET/POST/DELETE /diary/{id}/images - จัดการรูปแนบ (metadata เก็บในตาราง diary_images)
+
+activities ที่แนบกับ diary:
+- response ยังใช้ Diary.activities (JSONB) รูปแบบเดิม
+- เขียนซ้ำลงตาราง diary_activity_feedback (หนึ่งแถวต่อกิจกรรม) ทุกครั้งที่ create/update
+  เพื่อใช้ query สถิติฝั่ง SQL ด้วย index
+
+endpoint เป็น async def (AsyncSession) ส่วน helper ที่ใช้ร่วมกับ bulk import (sync Session)
+เช่น _insert_activity_feedback, _adjust_diary_count เรียกผ่าน await db.run_sync(...)
 
 คุณสมบัติพิเศษ:
 - รองรับ 2D Mood System (mood_score + mood_tags)
@@ -15,47 +25,262 @@ diary.py - API Endpoints สำหรับจัดการไดอารี
 - ใช้ default mood "😌" ถ้าไม่ส่ง mood มา (เพื่อป้องกัน NOT NULL error)
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Float, case, cast, func, insert, literal_column, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db.session import get_db
-from models.diary import Diary
+from db.session import get_async_db
+from models.activity import Activity
+from models.diary import Diary, SEARCH_CONFIG
+from models.diary_activity_feedback import DiaryActivityFeedback
+from models.diary_image import DiaryImage
 from models.user import User
-from schemas.diary import DiaryCreate, DiaryUpdate, DiaryResponse
+from core.auth_cache import Principal
+from schemas.diary import DiaryCreate, DiaryUpdate, DiaryResponse, DiarySearchHit, DiarySearchResponse
 from routers.profile import current_user
 import datetime
+import html
+import re
 from pathlib import Path
 import uuid
 from typing import List
 from core.config import settings
+from core.images import read_image_size
+from core import mood_stats, thumbnails
+from core.pagination import encode_cursor, decode_cursor
+from core.query_budget import query_budget
+from core.responses import serialized
 
 # Legacy mood emojis ที่รองรับ (เก็บไว้เพื่อ backward compatibility)
 # Include emojis from YesterdayDiaryModal: 😄 (score >= 4), 😐 (score === 3), 😞 (score < 3)
 ALLOWED_MOODS = {"🙂", "😄", "😢", "😠", "😌", "🤩", "😐", "😞"}
+# ค่า mood_score แบบเก่า (ตรงกับ normalize_score ใน routers/trends.py)
+LEGACY_MOOD_SCORES = {"good": 4, "bad": 2}
 
 router = APIRouter(prefix="/diary", tags=["diary"])
 
+# ลำดับของรายการ diary (ต้องตรงกับ keyset cursor และ index ix_diaries_user_date_time_id)
+DIARY_ORDER = (Diary.date.desc(), Diary.time.desc(), Diary.id.desc())
+
+# คอลัมน์ของ diaries ที่ DiaryResponse ใช้ (image_count มาจาก aggregate)
+DIARY_RESPONSE_COLUMNS = [getattr(Diary, name) for name in DiaryResponse.model_fields if name != "image_count"]
+
+def _diary_cursor(row: Diary) -> str:
+    return encode_cursor(row.date.isoformat(), row.time.isoformat(), row.id)
+
+def _apply_diary_cursor(query, cursor: str | None):
+    """กรองเฉพาะแถวที่อยู่ "หลัง" cursor ตามลำดับ (date, time, id) DESC"""
+    if not cursor:
+        return query
+    try:
+        d, t, i = decode_cursor(cursor, 3)
+        key = (datetime.date.fromisoformat(d), datetime.time.fromisoformat(t), uuid.UUID(i))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+    return query.filter(tuple_(Diary.date, Diary.time, Diary.id) < tuple_(*key))
+
+async def _diary_total(db: AsyncSession, user_id) -> int:
+    """อ่าน users.diary_count (ไม่ใช้ค่าใน Principal เพราะ cache อาจเก่ากว่า)"""
+    return await db.scalar(select(User.diary_count).where(User.id == user_id)) or 0
+
+def _parse_date(value: str | None, field: str) -> datetime.date | None:
+    # asyncpg ไม่แปลง string เป็น date ให้ ต้องแปลงเองก่อนใช้ใน query
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} ต้องอยู่ในรูปแบบ YYYY-MM-DD")
+
+def _adjust_diary_count(db: Session, user_id, delta: int) -> None:
+    """อัปเดต users.diary_count แบบ atomic (อยู่ใน transaction เดียวกับการเพิ่ม/ลบ diary)"""
+    if delta:
+        db.execute(
+            update(User).where(User.id == user_id).values(diary_count=User.diary_count + delta)
+        )
+
 @router.get("", response_model=list[DiaryResponse])
-def list_diaries(
+@query_budget(4)
+async def list_diaries(
     start_date: str = None,
     end_date: str = None,
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    limit: int | None = Query(None, ge=1, le=200, description="ไม่ส่ง = ดึงทั้งหมด (แบบเดิม)"),
+    cursor: str | None = Query(None, description="ค่า X-Next-Cursor จากหน้าก่อนหน้า"),
+    include_total: bool = Query(False, description="ส่งจำนวนทั้งหมดใน header X-Total-Count"),
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
+):
+    """
+    ดึงรายการไดอารี่ เรียงจากใหม่ไปเก่า
+
+    - ไม่ส่ง limit: คืนทั้งหมดเหมือนเดิม (รองรับแอปเวอร์ชันเก่า)
+    - ส่ง limit (+ cursor): แบ่งหน้าแบบ keyset, cursor ของหน้าถัดไปอยู่ใน header X-Next-Cursor
+    """
+    start = _parse_date(start_date, "start_date")
+    end = _parse_date(end_date, "end_date")
+    filters = [Diary.user_id == me.id]
+    if start:
+        filters.append(Diary.date >= start)
+    if end:
+        filters.append(Diary.date <= end)
+
+    headers = {}
+    if include_total:
+        if start or end:
+            total = await db.scalar(select(func.count(Diary.id)).where(*filters)) or 0
+        else:
+            total = await _diary_total(db, me.id)
+        headers["X-Total-Count"] = str(total)
+
+    # อ่านเฉพาะคอลัมน์ของ DiaryResponse (Core row ไม่สร้าง ORM object)
+    # นับรูปด้วย aggregate join ครั้งเดียว (group by primary key ของ diaries)
+    image_count = func.count(DiaryImage.id).label("image_count")
+    query = (
+        select(*DIARY_RESPONSE_COLUMNS, image_count)
+        .outerjoin(DiaryImage, DiaryImage.diary_id == Diary.id)
+        .where(*filters)
+    )
+    query = _apply_diary_cursor(query, cursor).group_by(Diary.id).order_by(*DIARY_ORDER)
+    if limit is not None:
+        # ดึงเกิน 1 แถวเพื่อรู้ว่ามีหน้าถัดไปหรือไม่
+        query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _diary_cursor(rows[-1])
+
+    # validate + encode ครั้งเดียว (headers ต้องใส่ใน Response ที่คืนเอง)
+    return serialized(list[DiaryResponse], rows, headers=headers)
+
+# -------------------------------
+# Search (ต้องประกาศก่อน /{diary_id} เพื่อไม่ให้ path ชนกัน)
+# -------------------------------
+
+# คะแนนเพิ่มเมื่อพบคำค้นแบบ substring (trigram) - ทำให้ผลภาษาไทยมี rank > 0
+SUBSTRING_MATCH_BONUS = 0.1
+HIGHLIGHT_CONTEXT = 40
+
+def _search_terms(q: str) -> List[str]:
+    """แยกคำค้นสำหรับ highlight (ตัด operator ของ websearch เช่น "..", -คำ, or)"""
+    terms = []
+    for token in q.replace('"', " ").split():
+        if token.startswith("-") or token.lower() == "or":
+            continue
+        terms.append(token)
+    return terms or [q.strip()]
+
+def _like_pattern(q: str) -> str:
+    escaped = q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _highlight(text: str | None, terms: List[str]) -> str | None:
+    """
+    ตัดข้อความรอบคำที่พบครั้งแรกและครอบทุกคำที่พบด้วย <mark>
+    ข้อความของ user ถูก escape (HTML) ก่อน <mark> ที่อยู่ในผลลัพธ์จึงมาจาก highlight เท่านั้น
+    """
+    if not text:
+        return None
+    pattern = re.compile("|".join(re.escape(t) for t in terms if t), re.IGNORECASE)
+    first = pattern.search(text)
+    if not first:
+        return None
+    start = max(0, first.start() - HIGHLIGHT_CONTEXT)
+    end = min(len(text), first.end() + HIGHLIGHT_CONTEXT)
+    window = text[start:end]
+    parts = []
+    last = 0
+    for m in pattern.finditer(window):
+        parts.append(html.escape(window[last:m.start()]))
+        parts.append(f"<mark>{html.escape(m.group(0))}</mark>")
+        last = m.end()
+    parts.append(html.escape(window[last:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+@router.get("/search", response_model=DiarySearchResponse)
+async def search_diaries(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor จากหน้าก่อนหน้า"),
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
-    query = db.query(Diary).filter(Diary.user_id == me.id)
-    if start_date:
-        query = query.filter(Diary.date >= start_date)
-    if end_date:
-        query = query.filter(Diary.date <= end_date)
-    rows = query.order_by(Diary.date.desc(), Diary.time.desc()).all()
-    for row in rows:
+    """
+    ค้นหาไดอารี่จาก title, detail และ tags
+
+    - คำที่คั่นด้วยช่องว่าง: ใช้ tsvector (GIN index) จัดอันดับด้วย ts_rank_cd
+    - ภาษาไทย (ไม่มีช่องว่าง): ค้นแบบ substring ด้วย ILIKE ซึ่งใช้ trigram index (pg_trgm)
+    - เรียงตาม rank แล้วตามวันที่ใหม่ไปเก่า แบ่งหน้าแบบ keyset ด้วย cursor
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="กรุณาระบุคำค้นหา")
+
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+    fts_match = Diary.search_vector.bool_op("@@")(tsquery)
+    substring_match = Diary.search_text.ilike(_like_pattern(q), escape="\\")
+    rank = (
+        cast(func.ts_rank_cd(Diary.search_vector, tsquery), Float)
+        + case((substring_match, SUBSTRING_MATCH_BONUS), else_=0.0)
+    ).label("rank")
+
+    query = select(Diary, rank).where(Diary.user_id == me.id, fts_match | substring_match)
+    if cursor:
         try:
-            row.image_count = len(_list_image_files(_diary_image_dir(row.id)))
-        except Exception:
-            row.image_count = 0
-    return rows
+            r, d, i = decode_cursor(cursor, 3)
+            key = (float(r), datetime.date.fromisoformat(d), uuid.UUID(i))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+        query = query.filter(tuple_(rank, Diary.date, Diary.id) < tuple_(*key))
 
-@router.post("", response_model=DiaryResponse, status_code=201)
-def create_diary(payload: DiaryCreate, db: Session = Depends(get_db), me: User = Depends(current_user)):
+    results = (await db.execute(
+        query.order_by(rank.desc(), Diary.date.desc(), Diary.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_row, last_rank = results[-1]
+        next_cursor = encode_cursor(repr(float(last_rank)), last_row.date.isoformat(), last_row.id)
+
+    terms = _search_terms(q)
+    items = []
+    for row, row_rank in results:
+        hit = DiarySearchHit.model_validate(row)
+        hit.rank = round(float(row_rank), 4)
+        highlights = {}
+        for field in ("title", "detail", "tags"):
+            snippet = _highlight(getattr(row, field), terms)
+            if snippet:
+                highlights[field] = snippet
+        hit.highlights = highlights
+        items.append(hit)
+    return DiarySearchResponse(items=items, next_cursor=next_cursor)
+
+def _parse_mood_score(value) -> int | None:
+    """
+    แปลง mood_score ที่รับมาเป็น int สำหรับเก็บ (Diary.mood_score เป็น Integer - asyncpg ไม่แปลง string ให้)
+    รับ 1..5 (int หรือ string ตัวเลข) หรือค่าเก่า 'good'|'bad' (LEGACY_MOOD_SCORES) - ค่าอื่นโยน 400
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        if value in LEGACY_MOOD_SCORES:
+            return LEGACY_MOOD_SCORES[value]
+        try:
+            value = int(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
+    if not (1 <= value <= 5):
+        raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
+    return value
+
+def _build_diary_values(payload: DiaryCreate) -> dict:
+    """
+    ตรวจสอบและแปลงข้อมูลจาก DiaryCreate เป็นค่าที่พร้อมบันทึกลง Diary
+    ใช้ร่วมกันระหว่าง POST /diary และ bulk import (โยน HTTPException 400 ถ้าข้อมูลไม่ถูกต้อง)
+    """
     # mood อาจเป็น null (draft mode)
     if payload.mood and payload.mood not in ALLOWED_MOODS:
         raise HTTPException(status_code=400, detail=f"mood '{payload.mood}' ไม่ถูกต้อง ต้องเป็น {ALLOWED_MOODS}")
@@ -67,26 +292,7 @@ def create_diary(payload: DiaryCreate, db: Session = Depends(get_db), me: User =
     
     # mood_score validation
     # Accept legacy 'good'|'bad' or numeric rating 1..5
-    if payload.mood_score is not None:
-        # numeric case
-        if isinstance(payload.mood_score, int):
-            if not (1 <= payload.mood_score <= 5):
-                raise HTTPException(status_code=400, detail="mood_score numeric ต้องอยู่ระหว่าง 1 และ 5")
-            stored_mood_score = str(payload.mood_score)
-        else:
-            # string case: accept 'good'|'bad' or numeric string
-            if payload.mood_score not in ['good', 'bad']:
-                # try numeric string
-                try:
-                    v = int(payload.mood_score)
-                    if not (1 <= v <= 5):
-                        raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
-                    stored_mood_score = str(v)
-                except Exception:
-                    raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
-        
-    else:
-        stored_mood_score = None
+    stored_mood_score = _parse_mood_score(payload.mood_score)
     
     # Use default time if not provided
     diary_time = payload.time if payload.time else datetime.time(0, 0, 0)
@@ -94,8 +300,7 @@ def create_diary(payload: DiaryCreate, db: Session = Depends(get_db), me: User =
     # Use default mood if not provided (DB constraint requires non-null)
     diary_mood = payload.mood if payload.mood else "😌"
     
-    row = Diary(
-        user_id=me.id,
+    return dict(
         date=payload.date, time=diary_time,
         title=payload.title, detail=payload.detail,
         mood=diary_mood, tags=payload.tags,
@@ -105,28 +310,82 @@ def create_diary(payload: DiaryCreate, db: Session = Depends(get_db), me: User =
         mood_tags=payload.mood_tags,
         activities=activities_data
     )
-    db.add(row); db.commit(); db.refresh(row)
-    # If mood_score is numeric string, convert to int for response convenience
+
+def _parse_uuid(value) -> uuid.UUID | None:
     try:
-        if row.mood_score is not None and isinstance(row.mood_score, str) and row.mood_score.isdigit():
-            row.mood_score = int(row.mood_score)
-    except Exception:
-        pass
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+def _clip(value, length: int) -> str | None:
+    return value[:length] if value else None
+
+def _insert_activity_feedback(db: Session, user_id, diaries: List[tuple]) -> None:
+    """
+    เขียนแถว diary_activity_feedback จาก [(diary_id, activities_data), ...]
+    activity_id จะถูกใส่เฉพาะเมื่อเป็น activity ของ user คนนี้ที่ยังมีอยู่ (query เดียวต่อชุด)
+    """
+    refs = {
+        _parse_uuid(item.get("id"))
+        for _, activities_data in diaries
+        for item in activities_data or []
+    }
+    refs.discard(None)
+    owned = set()
+    if refs:
+        owned = {
+            activity_id
+            for (activity_id,) in db.query(Activity.id).filter(Activity.user_id == user_id, Activity.id.in_(refs))
+        }
+
+    rows = []
+    for diary_id, activities_data in diaries:
+        for position, item in enumerate(activities_data or []):
+            ref = _parse_uuid(item.get("id"))
+            rows.append({
+                "id": uuid.uuid4(),
+                "diary_id": diary_id,
+                "user_id": user_id,
+                "activity_id": ref if ref in owned else None,
+                "position": position,
+                "category": _clip(item.get("category"), 100) or "",
+                "title": _clip(item.get("title"), 200) or "",
+                "rating": item.get("rating"),
+                "activity_mood": _clip(item.get("activityMood"), 50),
+                "status": _clip(item.get("status"), 50),
+            })
+    if rows:
+        db.execute(insert(DiaryActivityFeedback.__table__), rows)
+
+def _sync_activity_feedback(db: Session, diary_id, user_id, activities_data) -> None:
+    """แทนที่ feedback ของ diary นี้ด้วย activities_data (ให้ตรงกับ Diary.activities เสมอ)"""
+    db.query(DiaryActivityFeedback).filter(DiaryActivityFeedback.diary_id == diary_id).delete(
+        synchronize_session=False
+    )
+    _insert_activity_feedback(db, user_id, [(diary_id, activities_data)])
+
+@router.post("", response_model=DiaryResponse, status_code=201)
+async def create_diary(payload: DiaryCreate, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
+    row = Diary(user_id=me.id, **_build_diary_values(payload))
+    db.add(row)
+    if row.activities:
+        await db.flush()  # ต้องมี row.id ก่อนเขียน feedback
+        await db.run_sync(_insert_activity_feedback, me.id, [(row.id, row.activities)])
+    await db.run_sync(_adjust_diary_count, me.id, 1)
+    await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit(); await db.refresh(row)
     return row
 
 @router.get("/{diary_id}", response_model=DiaryResponse)
-def get_diary(diary_id: str, db: Session = Depends(get_db), me: User = Depends(current_user)):
-    row = db.query(Diary).filter(Diary.id == diary_id, Diary.user_id == me.id).first()
+async def get_diary(diary_id: str, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
+    row = await db.scalar(select(Diary).where(Diary.id == diary_id, Diary.user_id == me.id))
     if not row:
         raise HTTPException(status_code=404, detail="ไม่พบรายการ")
-    try:
-        row.image_count = len(_list_image_files(_diary_image_dir(row.id)))
-    except Exception:
-        row.image_count = 0
+    row.image_count = await _count_images(db, row.id)
     return row
 
 @router.put("/{diary_id}", response_model=DiaryResponse)
-def update_diary(diary_id: str, payload: DiaryUpdate, db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def update_diary(diary_id: str, payload: DiaryUpdate, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
     # Support partial updates: only apply fields that were sent by the client
     update_data = payload.model_dump(exclude_unset=True)
 
@@ -134,9 +393,10 @@ def update_diary(diary_id: str, payload: DiaryUpdate, db: Session = Depends(get_
     if update_data.get('mood') and update_data.get('mood') not in ALLOWED_MOODS:
         raise HTTPException(status_code=400, detail=f"mood '{update_data.get('mood')}' ไม่ถูกต้อง")
 
-    row = db.query(Diary).filter(Diary.id == diary_id, Diary.user_id == me.id).first()
+    row = await db.scalar(select(Diary).where(Diary.id == diary_id, Diary.user_id == me.id))
     if not row:
         raise HTTPException(status_code=404, detail="ไม่พบรายการ")
+    old_date = row.date
 
     # แปลง activities เป็น list of dict ถ้ามีข้อมูล
     activities_data = None
@@ -144,23 +404,7 @@ def update_diary(diary_id: str, payload: DiaryUpdate, db: Session = Depends(get_
         activities_data = [a.model_dump() if hasattr(a, 'model_dump') else a for a in update_data.get('activities')]
 
     # mood_score validation (only when provided)
-    stored_mood_score = None
-    if 'mood_score' in update_data:
-        ms = update_data.get('mood_score')
-        if ms is not None:
-            if isinstance(ms, int):
-                if not (1 <= ms <= 5):
-                    raise HTTPException(status_code=400, detail="mood_score numeric ต้องอยู่ระหว่าง 1 และ 5")
-                stored_mood_score = str(ms)
-            else:
-                if ms not in ['good', 'bad']:
-                    try:
-                        v = int(ms)
-                        if not (1 <= v <= 5):
-                            raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
-                        stored_mood_score = str(v)
-                    except Exception:
-                        raise HTTPException(status_code=400, detail="mood_score ต้องเป็น 'good'|'bad' หรือ 1..5")
+    stored_mood_score = _parse_mood_score(update_data.get('mood_score'))
 
     # Apply only provided fields
     if 'date' in update_data:
@@ -185,39 +429,56 @@ def update_diary(diary_id: str, payload: DiaryUpdate, db: Session = Depends(get_
         row.mood_tags = update_data.get('mood_tags')
     if activities_data is not None:
         row.activities = activities_data
-    db.add(row); db.commit(); db.refresh(row)
-    try:
-        if row.mood_score is not None and isinstance(row.mood_score, str) and row.mood_score.isdigit():
-            row.mood_score = int(row.mood_score)
-    except Exception:
-        pass
+        await db.run_sync(_sync_activity_feedback, row.id, me.id, activities_data)
+    db.add(row)
+    await db.run_sync(mood_stats.refresh_days, me.id, [old_date, row.date])
+    await db.commit(); await db.refresh(row)
     return row
 
 @router.delete("/{diary_id}", status_code=204)
-def delete_diary(diary_id: str, db: Session = Depends(get_db), me: User = Depends(current_user)):
-    row = db.query(Diary).filter(Diary.id == diary_id, Diary.user_id == me.id).first()
+async def delete_diary(diary_id: str, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
+    row = await db.scalar(select(Diary).where(Diary.id == diary_id, Diary.user_id == me.id))
     if not row:
         raise HTTPException(status_code=404, detail="ไม่พบรายการ")
-    db.delete(row)
-    db.commit()
+    await db.delete(row)
+    await db.run_sync(_adjust_diary_count, me.id, -1)
+    await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit()
     return None
 
 # -------------------------------
-# Image management for diaries (filesystem only, no DB migration)
+# Image management for diaries
+# ไฟล์อยู่ใน media/diary_images/<diary_id>/ ส่วน metadata อยู่ในตาราง diary_images
+# (ไฟล์เก่าที่ยังไม่มี row ให้รัน scripts/reconcile_diary_images.py)
+# รูปย่อ WebP (thumb/display) สร้างโดย worker ใน core/thumbnails.py หลังอัปโหลด
 # -------------------------------
 
 ALLOWED_IMAGE_EXTS = {"jpg", "jpeg", "png", "webp"}
+MAX_IMAGES_PER_DIARY = 3
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 def _diary_image_dir(diary_id: str) -> Path:
     return Path(settings.media_dir) / "diary_images" / str(diary_id)
 
-def _ensure_owner(diary_id: str, db: Session, me: User) -> Diary:
-    row = db.query(Diary).filter(Diary.id == diary_id, Diary.user_id == me.id).first()
+def _remove_image_file(target: Path) -> None:
+    target.unlink(missing_ok=True)
+    thumbnails.remove_variants(target)
+
+async def _ensure_owner(diary_id: str, db: AsyncSession, me: Principal, lock: bool = False) -> Diary:
+    query = select(Diary).where(Diary.id == diary_id, Diary.user_id == me.id)
+    if lock:
+        # ล็อก row ของ diary จนจบ transaction เพื่อให้การเช็คจำนวนรูปไม่ชนกัน
+        query = query.with_for_update()
+    row = await db.scalar(query)
     if not row:
         raise HTTPException(status_code=404, detail="ไม่พบรายการ")
     return row
 
+async def _count_images(db: AsyncSession, diary_id) -> int:
+    return await db.scalar(select(func.count(DiaryImage.id)).where(DiaryImage.diary_id == diary_id)) or 0
+
 def _list_image_files(folder: Path) -> List[str]:
+    """รายชื่อไฟล์รูปใน folder (ใช้ตอน reconcile กับ filesystem)"""
     if not folder.exists():
         return []
     files = []
@@ -231,74 +492,154 @@ def _list_image_files(folder: Path) -> List[str]:
 def _image_url(diary_id: str, filename: str) -> str:
     return f"/media/diary_images/{diary_id}/{filename}"
 
+def _variant_url(diary_id: str, filename: str, variant: str) -> str:
+    stem = Path(filename).stem
+    return f"/media/diary_images/{diary_id}/{thumbnails.VARIANTS_DIR}/{stem}.{variant}.webp"
+
+def _image_out(diary_id: str, image: DiaryImage) -> dict:
+    original = _image_url(diary_id, image.name)
+    # ถ้ารูปย่อยังไม่เสร็จ ให้ใช้ต้นฉบับแทนไปก่อน
+    return {
+        "name": image.name,
+        "url": original,
+        "thumbnail_url": _variant_url(diary_id, image.name, "thumb") if image.has_variants else original,
+        "display_url": _variant_url(diary_id, image.name, "display") if image.has_variants else original,
+        "size": image.size,
+        "width": image.width,
+        "height": image.height,
+        "created_at": image.created_at,
+    }
+
+def _build_image_row(diary_id, target: Path) -> DiaryImage:
+    dims = read_image_size(target)
+    return DiaryImage(
+        # กำหนด id เองเพื่อใช้ต่อหลัง commit ได้โดยไม่ต้อง query ซ้ำ
+        id=uuid.uuid4(),
+        diary_id=diary_id,
+        name=target.name,
+        size=target.stat().st_size,
+        width=dims[0] if dims else None,
+        height=dims[1] if dims else None,
+    )
+
+def _save_upload(upload: UploadFile, target: Path) -> None:
+    """
+    คัดลอกไฟล์ที่อัปโหลดลง disk ทีละ chunk (ไม่โหลดทั้งไฟล์เข้า memory)
+    ถ้าเกิน settings.diary_image_max_bytes จะลบไฟล์ที่เขียนไปแล้วและตอบ 413
+    """
+    written = 0
+    upload.file.seek(0)
+    try:
+        with open(target, "wb") as out:
+            while True:
+                chunk = upload.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > settings.diary_image_max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"ไฟล์ {upload.filename} ใหญ่เกิน {settings.diary_image_max_bytes // (1024 * 1024)} MB",
+                    )
+                out.write(chunk)
+    except HTTPException:
+        target.unlink(missing_ok=True)
+        raise
+    except Exception as exc:  # pragma: no cover - file system error
+        target.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=f"บันทึกรูปล้มเหลว: {exc}")
+
 @router.get("/{diary_id}/images")
-def list_diary_images(diary_id: str, db: Session = Depends(get_db), me: User = Depends(current_user)):
-    _ensure_owner(diary_id, db, me)
-    folder = _diary_image_dir(diary_id)
-    files = _list_image_files(folder)
+async def list_diary_images(diary_id: str, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
+    await _ensure_owner(diary_id, db, me)
+    images = (await db.execute(
+        select(DiaryImage).where(DiaryImage.diary_id == diary_id).order_by(DiaryImage.name)
+    )).scalars().all()
     return {
-        "count": len(files),
-        "images": [{"name": f, "url": _image_url(diary_id, f)} for f in files],
+        "count": len(images),
+        "images": [_image_out(diary_id, img) for img in images],
     }
 
 @router.post("/{diary_id}/images", status_code=201)
 async def upload_diary_images(
     diary_id: str,
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
-    _ensure_owner(diary_id, db, me)
-    folder = _diary_image_dir(diary_id)
-    existing = _list_image_files(folder)
+    diary = await _ensure_owner(diary_id, db, me, lock=True)
+    existing_count = await _count_images(db, diary.id)
 
-    if len(existing) >= 3:
+    if existing_count >= MAX_IMAGES_PER_DIARY:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="บันทึกนี้มีรูปครบ 3 รูปแล้ว")
     if not files:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="กรุณาเลือกไฟล์รูปอย่างน้อย 1 รูป")
 
-    remaining_slots = 3 - len(existing)
-    folder.mkdir(parents=True, exist_ok=True)
+    remaining_slots = MAX_IMAGES_PER_DIARY - existing_count
+    folder = _diary_image_dir(diary_id)
+    await run_in_threadpool(folder.mkdir, parents=True, exist_ok=True)
+
+    written: List[Path] = []
+    added: List[tuple] = []
+    try:
+        for upload in files[:remaining_slots]:
+            if not upload.content_type or not upload.content_type.startswith("image/"):
+                raise HTTPException(status_code=400, detail=f"ไฟล์ {upload.filename} ไม่ใช่รูปภาพ")
+
+            ext = Path(upload.filename or "").suffix.lower().lstrip(".") or "jpg"
+            if ext not in ALLOWED_IMAGE_EXTS:
+                ext = "jpg"
 
-    added: List[str] = []
-    for upload in files[:remaining_slots]:
-        if not upload.content_type or not upload.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail=f"ไฟล์ {upload.filename} ไม่ใช่รูปภาพ")
+            filename = f"{uuid.uuid4().hex}.{ext}"
+            target = folder / filename
+            # เขียนไฟล์และอ่านขนาดรูปใน thread ไม่ block event loop
+            await run_in_threadpool(_save_upload, upload, target)
+            written.append(target)
 
-        ext = Path(upload.filename or "").suffix.lower().lstrip(".") or "jpg"
-        if ext not in ALLOWED_IMAGE_EXTS:
-            ext = "jpg"
+            image = await run_in_threadpool(_build_image_row, diary.id, target)
+            db.add(image)
+            added.append((image.id, image.name))
 
-        filename = f"{uuid.uuid4().hex}.{ext}"
-        target = folder / filename
-        try:
-            content = await upload.read()
-            target.write_bytes(content)
-        except Exception as exc:  # pragma: no cover - file system error
-            raise HTTPException(status_code=500, detail=f"บันทึกรูปล้มเหลว: {exc}")
+        # commit ปลดล็อก row ของ diary
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        for path in written:
+            path.unlink(missing_ok=True)
+        raise
 
-        added.append(filename)
+    # สร้างรูปย่อ + ลบ EXIF ใน background
+    for image_id, name in added:
+        thumbnails.submit(image_id, folder / name)
 
-    new_existing = existing + added
     return {
-        "added": [{"name": n, "url": _image_url(diary_id, n)} for n in added],
-        "remaining_slots": max(0, 3 - len(new_existing)),
+        "added": [{"name": name, "url": _image_url(diary_id, name)} for _, name in added],
+        "remaining_slots": max(0, remaining_slots - len(added)),
     }
 
 @router.delete("/{diary_id}/images/{filename}", status_code=204)
-def delete_diary_image(
+async def delete_diary_image(
     diary_id: str,
     filename: str,
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
-    _ensure_owner(diary_id, db, me)
+    await _ensure_owner(diary_id, db, me)
     folder = _diary_image_dir(diary_id)
-    target = folder / filename
-    if not target.exists():
+    target = folder / Path(filename).name
+    image = await db.scalar(select(DiaryImage).where(
+        DiaryImage.diary_id == diary_id,
+        DiaryImage.name == filename
+    ))
+    if not image and not target.exists():
         raise HTTPException(status_code=404, detail="ไม่พบไฟล์นี้ในบันทึก")
+    if image:
+        await db.delete(image)
+        await db.commit()
     try:
-        target.unlink()
+        await run_in_threadpool(_remove_image_file, target)
     except Exception as exc:  # pragma: no cover - file system error
         raise HTTPException(status_code=500, detail=f"ลบไฟล์ไม่สำเร็จ: {exc}")
     return None
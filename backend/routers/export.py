@@ -0,0 +1,205 @@
+"""
+export.py - API Endpoint สำหรับส่งออกข้อมูลทั้งบัญชี (Account Export)
+
+หน้าที่หลัก:
+- GET /profile/export - ดาวน์โหลดข้อมูลทั้งหมดของ user เป็นไฟล์ ZIP
+
+โครงสร้างไฟล์ใน ZIP:
+- profile.json
+- diaries.ndjson, activities.ndjson, routine_activities.ndjson (หนึ่ง JSON object ต่อบรรทัด)
+- diary_images/<diary_id>/<name> (รูปต้นฉบับ)
+
+การทำงาน:
+1. สร้าง ZIP ทีละส่วนระหว่างส่ง (StreamingResponse) ไม่ต้องสร้างไฟล์ทั้งก้อนก่อน
+2. อ่านแถวจาก DB ด้วย yield_per (server-side cursor) แล้วเขียน NDJSON ทีละแถว
+3. อ่านรูปทีละ chunk แล้วส่งออกทันที
+   memory จึงคงที่ไม่ว่าบัญชีจะมีข้อมูลมากแค่ไหน
+4. จำกัดจำนวน export ที่ทำพร้อมกัน (settings.export_max_concurrent)
+   ถ้าเต็มตอบ 503 + Retry-After เพื่อไม่ให้แย่ง worker/DB connection จาก request ปกติ
+"""
+
+import datetime
+import json
+import threading
+import zipfile
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from starlette.background import BackgroundTask
+
+from core.config import settings
+from db.session import SessionLocal
+from models.activity import Activity
+from models.diary import Diary
+from models.diary_image import DiaryImage
+from models.routine_activity import RoutineActivity
+from core.auth_cache import Principal
+from routers.diary import _diary_image_dir
+from routers.profile import current_user
+from schemas.profile import ProfileMe
+
+router = APIRouter(prefix="/profile", tags=["profile"])
+
+EXPORT_BATCH_SIZE = 500
+# ขนาด chunk ตอนอ่านรูปและขนาด buffer ก่อนส่งออกไปหา client
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_RETRY_AFTER_SECONDS = 30
+
+# column ที่ไม่ส่งออก: user_id ซ้ำทุกแถว, search_* เป็น generated column ของ DB
+EXCLUDED_COLUMNS = {"user_id", "search_text", "search_vector"}
+
+EXPORT_TABLES = (
+    ("diaries.ndjson", Diary, (Diary.date, Diary.time, Diary.id)),
+    ("activities.ndjson", Activity, (Activity.date, Activity.time, Activity.id)),
+    ("routine_activities.ndjson", RoutineActivity, (RoutineActivity.day_of_week, RoutineActivity.id)),
+)
+
+_export_slots = threading.BoundedSemaphore(max(1, settings.export_max_concurrent))
+
+
+class _ExportSlot:
+    """ช่อง export ที่จองไว้ คืนได้ครั้งเดียว (ทั้งตอน stream จบและจาก background task)"""
+
+    def __init__(self):
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        _export_slots.release()
+
+
+class _ZipStream:
+    """
+    file-like object ที่ zipfile เขียนลงไป แล้วให้ generator ดึงข้อมูลออกไปส่งทีละก้อน
+    ไม่มี seek() zipfile จึงเขียน data descriptor หลังแต่ละไฟล์แทนการย้อนกลับไปแก้ header
+    """
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._size = 0
+        self._position = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._parts.append(bytes(data))
+            self._size += len(data)
+            self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return data
+
+
+def _column_keys(model) -> list[str]:
+    return [c.key for c in model.__table__.columns if c.key not in EXCLUDED_COLUMNS]
+
+
+def _entry(name: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=datetime.datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def _stream_export(user_id, profile: dict, slot: _ExportSlot):
+    """
+    Generator สำหรับ StreamingResponse
+    ใช้ session ของตัวเอง (request session ถูกปิดก่อน stream จบ)
+    """
+    db = SessionLocal()
+    out = _ZipStream()
+    try:
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(_entry("profile.json"), json.dumps(profile, ensure_ascii=False, indent=2, default=str))
+            yield out.drain()
+
+            for filename, model, order_by in EXPORT_TABLES:
+                keys = _column_keys(model)
+                columns = [model.__table__.c[key] for key in keys]
+                stmt = (
+                    select(*columns)
+                    .where(model.__table__.c.user_id == user_id)
+                    .order_by(*order_by)
+                    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+                )
+                with zf.open(_entry(filename), "w", force_zip64=True) as entry:
+                    for row in db.execute(stmt):
+                        line = json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=str)
+                        entry.write(line.encode("utf-8") + b"\n")
+                        if out.pending() >= EXPORT_CHUNK_SIZE:
+                            yield out.drain()
+                yield out.drain()
+
+            images = (
+                select(DiaryImage.diary_id, DiaryImage.name)
+                .join(Diary, Diary.id == DiaryImage.diary_id)
+                .where(Diary.user_id == user_id)
+                .order_by(DiaryImage.diary_id, DiaryImage.name)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            for diary_id, name in db.execute(images):
+                path: Path = _diary_image_dir(diary_id) / name
+                try:
+                    source = open(path, "rb")
+                except FileNotFoundError:
+                    # row ค้างแต่ไฟล์หาย (ดู scripts/reconcile_diary_images.py)
+                    continue
+                info = _entry(f"diary_images/{diary_id}/{name}")
+                # รูปถูกบีบอัดมาแล้ว ไม่ต้อง deflate ซ้ำ
+                info.compress_type = zipfile.ZIP_STORED
+                with source, zf.open(info, "w", force_zip64=True) as entry:
+                    while True:
+                        chunk = source.read(EXPORT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        yield out.drain()
+                yield out.drain()
+        # central directory ถูกเขียนตอนปิด ZipFile
+        yield out.drain()
+    finally:
+        db.close()
+        slot.release()
+
+
+@router.get("/export")
+def export_account(me: Principal = Depends(current_user)):
+    """
+    ส่งออกข้อมูลทั้งหมดของ user เป็น ZIP (stream)
+
+    Raises:
+        503: มี export ทำงานพร้อมกันเต็มจำนวนแล้ว (ลองใหม่ตาม Retry-After)
+    """
+    if not _export_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังส่งออกข้อมูลให้ผู้ใช้อื่นอยู่ กรุณาลองใหม่ภายหลัง",
+            headers={"Retry-After": str(EXPORT_RETRY_AFTER_SECONDS)},
+        )
+    slot = _ExportSlot()
+    profile = ProfileMe.model_validate(me).model_dump(mode="json")
+    filename = f"planary-export-{datetime.date.today():%Y%m%d}.zip"
+    return StreamingResponse(
+        _stream_export(me.id, profile, slot),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        # กันกรณี stream ไม่เคยเริ่ม (generator ไม่ได้รัน finally)
+        background=BackgroundTask(slot.release),
+    )
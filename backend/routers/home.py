@@ -2,46 +2,73 @@
 home.py - API Endpoints สำหรับหน้าหลัก (Home)
 
 หน้าที่หลัก:
-- GET /home/diaries - ดึงรายการไดอารี่แบบมี pagination (limit + offset)
+- GET /home/diaries - ดึงรายการไดอารี่แบบมี pagination (limit + offset หรือ limit + cursor)
 - DELETE /home/diaries/{id} - ลบไดอารี่ (duplicate กับ /diary/{id} แต่เก็บไว้เพื่อ backward compatibility)
 
 การใช้งาน:
 - Frontend เรียก GET /home/diaries?limit=20&offset=0 เพื่อแสดงรายการไดอารี่ล่าสุด
 - รองรับ pagination เพื่อไม่ให้โหลดข้อมูลทั้งหมดพร้อมกัน (ประหยัด bandwidth)
 - ส่ง total count กลับไปด้วยเพื่อให้ frontend รู้ว่ามีทั้งหมดกี่รายการ
+  (อ่านจาก users.diary_count ไม่ต้อง COUNT(*) ทุกหน้า, ปิดได้ด้วย include_total=false)
+- แอปเวอร์ชันใหม่ควรใช้ cursor (ส่ง next_cursor ของหน้าก่อนหน้ากลับมา) แทน offset
+- list อ่านเฉพาะคอลัมน์ของ DiaryItem ด้วย Core select (ไม่สร้าง ORM object) แล้ว serialize ครั้งเดียว (core/responses.py)
 
 หมายเหตุ:
 - อาจรวม endpoint นี้เข้ากับ /diary ได้ในอนาคต
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from db.session import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.diary import Diary
 from schemas.home import DiaryListResponse, DiaryItem
 from routers.profile import current_user
-from models.user import User
+from core import mood_stats
+from core.query_budget import query_budget
+from core.responses import serialized
+from routers.diary import DIARY_ORDER, _apply_diary_cursor, _diary_cursor, _adjust_diary_count, _diary_total
+from core.auth_cache import Principal
 
 router = APIRouter(prefix="/home", tags=["home"])
 
+# คอลัมน์ที่ DiaryItem ใช้ (select แค่นี้ ไม่ต้อง hydrate Diary ทั้งแถว)
+DIARY_ITEM_COLUMNS = [getattr(Diary, name) for name in DiaryItem.model_fields]
+
 @router.get("/diaries", response_model=DiaryListResponse)
-def list_diaries(
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user),
+@query_budget(4)
+async def list_diaries(
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="next_cursor จากหน้าก่อนหน้า (ใช้แทน offset)"),
+    include_total: bool = Query(True),
 ):
-    q = db.query(Diary).filter(Diary.user_id == me.id).order_by(Diary.date.desc(), Diary.time.desc())
-    total = q.count()
-    rows = q.offset(offset).limit(limit).all()
-    items = [DiaryItem.model_validate(r) for r in rows]
-    return DiaryListResponse(items=items, total=total)
+    q = select(*DIARY_ITEM_COLUMNS).where(Diary.user_id == me.id)
+    if cursor:
+        q = _apply_diary_cursor(q, cursor)
+    q = q.order_by(*DIARY_ORDER)
+    if not cursor and offset:
+        # legacy: แอปเวอร์ชันเก่ายังส่ง offset มา
+        q = q.offset(offset)
+    rows = (await db.execute(q.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _diary_cursor(rows[-1])
+
+    total = await _diary_total(db, me.id) if include_total else None
+    return serialized(DiaryListResponse, {"items": rows, "total": total, "next_cursor": next_cursor})
 
 @router.delete("/diaries/{diary_id}", status_code=204)
-def delete_diary(diary_id: str, db: Session = Depends(get_db), me: User = Depends(current_user)):
-    row = db.query(Diary).filter(Diary.id == diary_id, Diary.user_id == me.id).first()
+async def delete_diary(diary_id: str, db: AsyncSession = Depends(get_async_db), me: Principal = Depends(current_user)):
+    row = await db.scalar(select(Diary).where(Diary.id == diary_id, Diary.user_id == me.id))
     if not row:
         raise HTTPException(status_code=404, detail="ไม่พบรายการ")
-    db.delete(row)
-    db.commit()
+    await db.delete(row)
+    await db.run_sync(_adjust_diary_count, me.id, -1)
+    await db.run_sync(mood_stats.refresh_days, me.id, [row.date])
+    await db.commit()
     return
@@ -0,0 +1,258 @@
+"""
+imports.py - API Endpoint สำหรับนำเข้าข้อมูลจำนวนมาก (Bulk Import)
+
+หน้าที่หลัก:
+- POST /import?kind=activities|diaries - นำเข้ากิจกรรมหรือไดอารี่จากไฟล์ NDJSON หรือ CSV
+
+การทำงาน:
+1. อ่านไฟล์ทีละบรรทัด (streaming) ไม่โหลดทั้งไฟล์เข้า memory
+2. validate แต่ละแถวด้วย ActivityCreate / DiaryCreate (กฎเดียวกับ POST /activities, POST /diary)
+3. แถวที่ผิดจะถูกข้ามและรายงานกลับพร้อมเลขบรรทัด
+4. แถวที่ถูกต้องจะถูก insert เป็นก้อน (chunk) ด้วย multi-row INSERT และ commit ทีละ chunk
+5. ถ้า chunk ใด insert ไม่สำเร็จ จะหยุดและบอก resume_from_chunk
+   ให้ส่งไฟล์เดิมมาใหม่พร้อม start_chunk=<ค่านั้น> เพื่อทำต่อโดยไม่ซ้ำของเดิม
+
+รูปแบบไฟล์:
+- NDJSON: หนึ่ง JSON object ต่อบรรทัด
+- CSV: แถวแรกเป็น header ตรงกับชื่อ field ของ schema
+  field ที่เป็น list/object (subtasks, mood_tags, activities) ใส่เป็น JSON string ได้
+
+ฟังก์ชัน run_import() ใช้ร่วมกับ CLI ใน scripts/import_data.py
+"""
+
+import csv
+import io
+import json
+import uuid
+from typing import IO, Iterator, Literal
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from core import mood_stats
+from db.session import get_db
+from models.activity import Activity
+from models.diary import Diary
+from core.auth_cache import Principal
+from routers.activities import _normalize_status
+from routers.diary import _adjust_diary_count, _build_diary_values, _insert_activity_feedback
+from routers.profile import current_user
+from schemas.activities import ActivityCreate
+from schemas.diary import DiaryCreate
+
+router = APIRouter(prefix="/import", tags=["import"])
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 5000
+# จำกัดจำนวน error ที่ส่งกลับ (error_count ยังนับครบทุกแถว)
+MAX_REPORTED_ERRORS = 1000
+
+# field ที่ใน CSV อาจส่งมาเป็น JSON string
+JSON_FIELDS = {"subtasks", "mood_tags", "activities"}
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or (content_type or "").startswith("text/csv"):
+        return "csv"
+    return "ndjson"
+
+
+def _coerce_csv_row(row: dict) -> dict:
+    """ช่องว่างใน CSV = ไม่ได้ส่ง field นั้น, field ที่เป็น JSON ให้ parse ก่อน validate"""
+    data = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        key = key.strip()
+        value = value.strip()
+        if value == "":
+            continue
+        if key in JSON_FIELDS and value[:1] in ("[", "{"):
+            value = json.loads(value)
+        data[key] = value
+    return data
+
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    อ่าน record ทีละตัวจาก text stream
+
+    Yields:
+        (line_no, data, parse_error) - ถ้า parse ไม่ได้ data จะเป็น None และมีข้อความ error
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            try:
+                yield reader.line_num, _coerce_csv_row(row), None
+            except ValueError as exc:
+                yield reader.line_num, None, f"JSON ไม่ถูกต้อง: {exc}"
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield line_no, None, f"JSON ไม่ถูกต้อง: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield line_no, None, "แต่ละบรรทัดต้องเป็น JSON object"
+            continue
+        yield line_no, data, None
+
+
+def _activity_values(data: dict) -> dict:
+    payload = ActivityCreate.model_validate(data)
+    values = payload.model_dump()
+    values["status"] = _normalize_status(values.get("status"))
+    return values
+
+
+def _diary_values(data: dict) -> dict:
+    payload = DiaryCreate.model_validate(data)
+    try:
+        values = _build_diary_values(payload)
+    except HTTPException as exc:
+        raise ValueError(exc.detail)
+    # กำหนด id เองเพื่อใช้เขียน diary_activity_feedback ใน chunk เดียวกัน
+    values["id"] = uuid.uuid4()
+    return values
+
+
+IMPORTERS = {
+    "activities": (Activity, _activity_values),
+    "diaries": (Diary, _diary_values),
+}
+
+
+def _format_errors(exc: Exception) -> list[dict]:
+    if isinstance(exc, ValidationError):
+        return [
+            {"loc": ".".join(str(p) for p in err.get("loc", ())), "msg": err.get("msg")}
+            for err in exc.errors()
+        ]
+    return [{"loc": "", "msg": str(exc)}]
+
+
+def run_import(
+    db: Session,
+    user_id,
+    kind: str,
+    stream: IO[str],
+    fmt: str,
+    start_chunk: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict:
+    """
+    นำเข้าข้อมูลทีละ chunk (ใช้ได้ทั้งจาก endpoint และ CLI)
+
+    chunk นับจากลำดับ record ในไฟล์ (ไม่ขึ้นกับว่า record ผ่าน validate หรือไม่)
+    จึงส่งไฟล์เดิมพร้อม start_chunk เพื่อทำต่อจากจุดที่ค้างได้เสมอ
+    """
+    model, build_values = IMPORTERS[kind]
+    table = model.__table__
+
+    result = {
+        "kind": kind,
+        "format": fmt,
+        "chunk_size": chunk_size,
+        "start_chunk": start_chunk,
+        "chunks_committed": 0,
+        "inserted": 0,
+        "error_count": 0,
+        "errors": [],
+        "failed_chunk": None,
+        "resume_from_chunk": None,
+    }
+
+    def record_error(line_no: int, chunk_no: int, errors: list[dict]):
+        result["error_count"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"line": line_no, "chunk": chunk_no, "errors": errors})
+
+    def flush(chunk_no: int, rows: list[dict]) -> bool:
+        try:
+            if rows:
+                # executemany ของ insert() จะถูกรวมเป็น multi-row INSERT (insertmanyvalues)
+                db.execute(insert(table), rows)
+                if model is Diary:
+                    _insert_activity_feedback(db, user_id, [(row["id"], row.get("activities")) for row in rows])
+                    _adjust_diary_count(db, user_id, len(rows))
+                mood_stats.refresh_days(db, user_id, {row["date"] for row in rows})
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            result["failed_chunk"] = chunk_no
+            result["resume_from_chunk"] = chunk_no
+            record_error(0, chunk_no, [{"loc": "", "msg": f"บันทึก chunk ไม่สำเร็จ: {exc.__class__.__name__}"}])
+            return False
+        result["chunks_committed"] += 1
+        result["inserted"] += len(rows)
+        return True
+
+    rows: list[dict] = []
+    current_chunk = start_chunk
+    seen = False
+    for index, (line_no, data, parse_error) in enumerate(iter_records(stream, fmt)):
+        chunk_no = index // chunk_size
+        if chunk_no < start_chunk:
+            continue
+        if chunk_no != current_chunk:
+            if not flush(current_chunk, rows):
+                return result
+            rows = []
+            current_chunk = chunk_no
+        seen = True
+
+        if parse_error is not None:
+            record_error(line_no, chunk_no, [{"loc": "", "msg": parse_error}])
+            continue
+        try:
+            values = build_values(data)
+        except (ValidationError, ValueError) as exc:
+            record_error(line_no, chunk_no, _format_errors(exc))
+            continue
+        values["user_id"] = user_id
+        rows.append(values)
+
+    if seen:
+        flush(current_chunk, rows)
+    return result
+
+
+@router.post("")
+def import_data(
+    kind: Literal["activities", "diaries"] = Query(..., description="ประเภทข้อมูลที่นำเข้า"),
+    format: Literal["ndjson", "csv"] | None = Query(None, description="ไม่ส่ง = เดาจากชื่อไฟล์/content type"),
+    start_chunk: int = Query(0, ge=0, description="เริ่มจาก chunk นี้ (ใช้ resume)"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=MAX_CHUNK_SIZE),
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    me: Principal = Depends(current_user),
+):
+    """
+    นำเข้ากิจกรรม/ไดอารี่จำนวนมากจากไฟล์ NDJSON หรือ CSV
+
+    Returns:
+        {
+            "inserted": 1200, "chunks_committed": 3, "error_count": 2,
+            "errors": [{"line": 15, "chunk": 0, "errors": [{"loc": "date", "msg": "..."}]}],
+            "failed_chunk": null, "resume_from_chunk": null, ...
+        }
+    """
+    fmt = format or detect_format(file.filename, file.content_type)
+    # UploadFile เก็บไฟล์ใหญ่ไว้บน disk (SpooledTemporaryFile) จึงอ่านทีละบรรทัดได้โดย memory คงที่
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return run_import(db, me.id, kind, stream, fmt, start_chunk=start_chunk, chunk_size=chunk_size)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="ไฟล์ต้องเข้ารหัสเป็น UTF-8")
+    finally:
+        stream.detach()
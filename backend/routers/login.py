@@ -7,7 +7,9 @@ login.py - API Endpoint สำหรับเข้าสู่ระบบ (Log
 การทำงาน:
 1. รับ email และ password จาก request body
 2. หา user ในฐานข้อมูลด้วย email
-3. ตรวจสอบรหัสผ่านด้วย bcrypt (verify_password)
+3. ตรวจสอบรหัสผ่านด้วย bcrypt ใน process pool (core/password_pool.py)
+   คืน DB connection ก่อนรอ bcrypt และตอบ 503 ทันทีถ้าคิวเต็ม
+   ถ้ารหัสถูกแต่ hash ใช้ cost ไม่ตรงกับ BCRYPT_ROUNDS จะ hash ใหม่และบันทึกแทนของเดิม
 4. ถ้าถูกต้อง: สร้าง JWT token ที่มี user_id และเวลาหมดอายุ
 5. ส่ง token กลับไป
 6. Frontend เก็บ token นี้และส่งมาใน Authorization header ทุกครั้งที่เรียก API
@@ -19,17 +21,19 @@ Token format:
 
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from db.session import get_db
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.user import User
-from core.security import verify_password, create_token
+from core import password_pool
+from core.security import create_token
 from schemas.login import LoginRequest, TokenPairResponse
 
 router = APIRouter(prefix="/login", tags=["login"])
 logger = logging.getLogger(__name__)
 
 @router.post("/token", response_model=TokenPairResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """
     เข้าสู่ระบบด้วย email และ password
     
@@ -43,12 +47,28 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
     Raises:
         401: ถ้า email ไม่พบหรือรหัสผ่านไม่ถูกต้อง
     """
-    # หา user ด้วย email
-    user = db.query(User).filter(User.email == payload.email).first()
+    # หา user ด้วย email (อ่านเฉพาะ column ที่ใช้)
+    user = (await db.execute(
+        select(User.id, User.password_hash, User.token_version).where(User.email == payload.email)
+    )).first()
+    user_id = user.id if user else None
+    password_hash = user.password_hash if user else None
+    token_version = user.token_version if user else 0
+    # คืน connection ให้ pool ระหว่างรอ bcrypt
+    await db.close()
 
-    # ตรวจสอบว่า user มีอยู่และรหัสผ่านถูกต้อง
+    # ตรวจสอบว่า user มีอยู่และรหัสผ่านถูกต้อง (พร้อม hash ใหม่ถ้า cost เปลี่ยน)
     try:
-        password_ok = verify_password(payload.password, user.password_hash) if user else False
+        if user:
+            password_ok, new_hash = await password_pool.verify_and_rehash(payload.password, password_hash)
+        else:
+            password_ok, new_hash = False, None
+    except password_pool.PasswordPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังตรวจสอบรหัสผ่านจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+            headers={"Retry-After": str(password_pool.RETRY_AFTER_SECONDS)},
+        )
     except ValueError:
         # bcrypt limit: 72 bytes
         raise HTTPException(status_code=400, detail="รหัสผ่านยาวเกินไป (สูงสุด 72 อักขระ)")
@@ -63,10 +83,24 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
             detail="อีเมลหรือรหัสผ่านไม่ถูกต้อง"
         )
     
+    # อัปเกรด hash เป็น cost ปัจจุบัน (เฉพาะเมื่อ hash ในฐานข้อมูลยังเป็นค่าเดิม กันทับรหัสที่เพิ่งเปลี่ยน)
+    if new_hash:
+        try:
+            await db.execute(
+                update(User)
+                .where(User.id == user_id, User.password_hash == password_hash)
+                .values(password_hash=new_hash)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("Password rehash failed")
+
     # สร้าง JWT access + refresh token
     try:
-        access = create_token(str(user.id), token_type="access")
-        refresh = create_token(str(user.id), token_type="refresh")
+        access = create_token(str(user_id), token_type="access")
+        refresh = create_token(str(user_id), token_type="refresh", claims={"ver": token_version})
     except Exception:
         logger.exception("Token creation failed")
         raise HTTPException(status_code=500, detail="ไม่สามารถออกโทเคนได้")
@@ -8,83 +8,112 @@ profile.py - API Endpoints สำหรับจัดการโปรไฟ
 - POST /profile/avatar - อัปโหลดรูปโปรไฟล์
 
 ฟังก์ชันสำคัญ:
-- current_user(): Dependency สำหรับตรวจสอบ JWT token และดึง User object
+- current_user(): Dependency สำหรับตรวจสอบ JWT token และดึงข้อมูล user ที่ login
   - ถอดรหัส token จาก Authorization header
   - decode JWT เพื่อดึง user_id
-  - query User จากฐานข้อมูล
-  - ใช้ใน router อื่นๆ เป็น Depends(current_user) เพื่อรับ User object
+  - คืน Principal (อ่านอย่างเดียว) จาก cache ใน process ถ้ามี ไม่ต้อง query ทุก request
+  - ใช้ใน router อื่นๆ เป็น Depends(current_user)
+- current_user_record(): เหมือน current_user แต่คืน User object ที่ผูกกับ session
+  ใช้กับ endpoint ที่แก้ไขข้อมูล user (update, password, avatar, ลบบัญชี)
 
 การ upload avatar:
 - รับไฟล์รูป multipart/form-data
-- สร้างชื่อไฟล์ใหม่ด้วย UUID เพื่อไม่ให้ชื่อซ้ำกัน
-- บันทึกไฟล์ลง media/avatars/
-- บันทึก avatar_url ลงฐานข้อมูล
+- เขียนลง disk ทีละ chunk พร้อมคำนวณ SHA-256 ตั้งชื่อไฟล์ตาม hash (ไฟล์เดียวกันเก็บครั้งเดียว)
+- สร้างรูปย่อ 64/128/512 px (WebP) ไว้ล่วงหน้า
+- บันทึก avatar_url ลงฐานข้อมูล แล้วลบรูปเก่าถ้าไม่มี user อื่นใช้ร่วมอยู่
+- การ commit URL และการเช็ค+ลบไฟล์ทำภายใต้ advisory lock ต่อ URL เดียวกัน
+  (user อื่นที่อัปโหลดรูปเดียวกันพร้อมกันไม่เสียไฟล์ไประหว่างเช็คกับลบ)
 """
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from jose import jwt, JWTError
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-import os, uuid as uuidlib
-from db.session import get_db
+import os
+from db.session import get_async_db
 from core.config import settings
+from core.avatars import store_avatar, remove_avatar, avatar_files_exist, AvatarTooLarge, InvalidAvatar
+from core.auth_cache import Principal, token_fingerprint
+from core.cache import cached
+from core.security import InvalidToken, decode_token
 from models.user import User
 from schemas.profile import ProfileMe, ProfileUpdateRequest, PasswordChangeRequest
-from core.security import verify_password, hash_password
+from core import password_pool, token_revocation
 
 router = APIRouter(prefix="/profile", tags=["profile"])
 
 # HTTPBearer: ตรวจสอบว่า Authorization header มี Bearer token หรือไม่
 bearer = HTTPBearer(auto_error=True)
 
-def current_user(
+def _token_user_id(token: str) -> UUID:
+    """Decode JWT แล้วคืน user_id (sub claim) - token ไม่ถูกต้อง/หมดอายุ: 401"""
+    try:
+        payload = decode_token(token)
+        return UUID(payload.get("sub"))
+    except (InvalidToken, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token ไม่ถูกต้อง")
+
+@cached(
+    "principal",
+    key=lambda db, uid, fingerprint: fingerprint,
+    scope=lambda db, uid, fingerprint: uid,
+    ttl=settings.auth_cache_ttl_seconds,
+)
+async def _load_principal(db: AsyncSession, uid: UUID, fingerprint: str) -> Principal:
+    user = await db.get(User, uid)  # Query user จากฐานข้อมูล
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token ไม่ถูกต้อง")
+    return Principal.from_user(user)
+
+async def current_user(
     cred: HTTPAuthorizationCredentials = Depends(bearer),
-    db: Session = Depends(get_db),
-) -> User:
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
     """
-    Dependency function สำหรับตรวจสอบ JWT token และดึง User object
+    Dependency function สำหรับตรวจสอบ JWT token และดึงข้อมูล user ที่ login
     
     การทำงาน:
     1. ดึง Bearer token จาก Authorization header
-    2. Decode JWT เพื่อดึง user_id (sub claim)
-    3. Query User จากฐานข้อมูลด้วย user_id
-    4. ถ้า token ไม่ถูกต้องหรือหา user ไม่เจอ: โยน 401 Unauthorized
+    2. Decode JWT เพื่อดึง user_id (sub claim) - ตรวจ signature/exp ทุกครั้ง
+    3. หา Principal ใน cache (core/cache.py: key = fingerprint ของ token, scope = user_id)
+    4. ถ้าไม่มี: Query User จากฐานข้อมูลแล้วเก็บลง cache (request พร้อมกันของ token เดียวกัน query ครั้งเดียว)
+    5. ถ้า token ไม่ถูกต้องหรือหา user ไม่เจอ: โยน 401 Unauthorized
     
     การใช้งาน:
         @router.get("/something")
-        def some_endpoint(me: User = Depends(current_user)):
-            # me จะเป็น User object ของคนที่ login
+        async def some_endpoint(me: Principal = Depends(current_user)):
+            # me.id, me.username, ... (อ่านอย่างเดียว)
             pass
     
     Returns:
-        User: User object ของคนที่ login
+        Principal: ข้อมูล user ที่ login (ถ้าต้องแก้ไข user ให้ใช้ current_user_record)
     
     Raises:
         401: ถ้า token ไม่ถูกต้อง, หมดอายุ, หรือหา user ไม่เจอ
     """
     token = cred.credentials  # ดึง token string จาก Bearer header
-    try:
-        # Decode JWT เพื่อดึง payload
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        uid = payload.get("sub")  # "sub" claim เก็บ user_id
-        user = db.get(User, UUID(uid))  # Query user จากฐานข้อมูล
-    except (JWTError, ValueError):
-        # Token ไม่ถูกต้อง, หมดอายุ, หรือ decode ไม่ได้
-        user = None
-    
+    uid = _token_user_id(token)
+    return await _load_principal(db, uid, token_fingerprint(token))
+
+async def current_user_record(
+    cred: HTTPAuthorizationCredentials = Depends(bearer),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    """เหมือน current_user แต่คืน User ที่ผูกกับ session (ไม่ผ่าน cache) สำหรับ endpoint ที่แก้ไข user"""
+    user = await db.get(User, _token_user_id(cred.credentials))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token ไม่ถูกต้อง")
-    
     return user
 
 @router.get("/me", response_model=ProfileMe)
-def get_me(me: User = Depends(current_user)):
+async def get_me(me: Principal = Depends(current_user)):
     """ดึงข้อมูลโปรไฟล์ของ user ที่ login"""
     return me
 
 @router.put("/update", response_model=ProfileMe)
-def update_profile(payload: ProfileUpdateRequest, db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def update_profile(payload: ProfileUpdateRequest, db: AsyncSession = Depends(get_async_db), me: User = Depends(current_user_record)):
     """
     แก้ไขข้อมูลโปรไฟล์ (username, gender, age)
     หมายเหตุ: email แก้ไม่ได้ (เพราะเป็น unique identifier)
@@ -93,29 +122,48 @@ def update_profile(payload: ProfileUpdateRequest, db: Session = Depends(get_db),
     me.gender = payload.gender
     me.age = payload.age
     db.add(me)
-    db.commit()
-    db.refresh(me)
+    await db.commit()
+    await db.refresh(me)
+    await _load_principal.invalidate(me.id)
     return me
 
 @router.patch("/password")
-def change_password(payload: PasswordChangeRequest, db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def change_password(payload: PasswordChangeRequest, db: AsyncSession = Depends(get_async_db), me: User = Depends(current_user_record)):
     """
     เปลี่ยนรหัสผ่าน
     ต้องส่ง old_password และ new_password
     ระบบจะตรวจสอบรหัสผ่านเดิมก่อนจึงอนุญาตให้เปลี่ยน
     """
-    # ตรวจสอบรหัสผ่านเดิม
-    if not verify_password(payload.old_password, me.password_hash):
-        raise HTTPException(status_code=400, detail="รหัสผ่านเดิมไม่ถูกต้อง")
-    
-    # เข้ารหัสและบันทึกรหัสผ่านใหม่
-    me.password_hash = hash_password(payload.new_password)
-    db.add(me)
-    db.commit()
+    user_id = me.id
+    current_hash = me.password_hash
+    # คืน connection ให้ pool ระหว่างรอ bcrypt (bcrypt รันใน process pool แยก)
+    await db.close()
+
+    try:
+        # ตรวจสอบรหัสผ่านเดิม
+        if not await password_pool.verify_password(payload.old_password, current_hash):
+            raise HTTPException(status_code=400, detail="รหัสผ่านเดิมไม่ถูกต้อง")
+        # เข้ารหัสรหัสผ่านใหม่
+        new_hash = await password_pool.hash_password(payload.new_password)
+    except password_pool.PasswordPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังตรวจสอบรหัสผ่านจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+            headers={"Retry-After": str(password_pool.RETRY_AFTER_SECONDS)},
+        )
+
+    # บันทึกรหัสผ่านใหม่ และ revoke refresh token ทุกอันที่ออกด้วยรหัสเดิม
+    await db.execute(
+        update(User).where(User.id == user_id).values(password_hash=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    await db.run_sync(token_revocation.revoke_all, user_id)
+    await db.commit()
+    await _load_principal.invalidate(user_id)
     return {"detail": "เปลี่ยนรหัสผ่านสำเร็จ"}
 
 @router.post("/avatar", response_model=ProfileMe)
-def upload_avatar(file: UploadFile = File(...), db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def upload_avatar(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db), me: User = Depends(current_user_record)):
     """
     อัปโหลดรูปโปรไฟล์
     รับไฟล์รูป multipart/form-data
@@ -127,31 +175,67 @@ def upload_avatar(file: UploadFile = File(...), db: Session = Depends(get_db), m
     if ext not in [".png", ".jpg", ".jpeg", ".webp"]:
         raise HTTPException(status_code=400, detail="รองรับเฉพาะไฟล์ภาพ .png .jpg .jpeg .webp")
     
-    # สร้างชื่อไฟล์ใหม่ด้วย UUID เพื่อไม่ให้ชื่อซ้ำกัน
-    fname = f"{uuidlib.uuid4()}{ext}"
-    fpath = os.path.join(settings.avatars_dir, fname)
+    if ext == ".jpeg":
+        ext = ".jpg"
     
-    # บันทึกไฟล์ลง disk
-    with open(fpath, "wb") as f:
-        f.write(file.file.read())
+    # บันทึกไฟล์ลง disk แบบ stream ชื่อไฟล์ = SHA-256 ของเนื้อหา (เขียนไฟล์/ย่อรูปใน thread ไม่ block event loop)
+    try:
+        avatar_url = await run_in_threadpool(store_avatar, file.file, ext)
+    except AvatarTooLarge:
+        raise HTTPException(status_code=413, detail=f"ไฟล์ใหญ่เกิน {settings.avatar_max_bytes // (1024 * 1024)} MB")
+    except InvalidAvatar:
+        raise HTTPException(status_code=400, detail="ไฟล์รูปไม่ถูกต้องหรือเสียหาย")
     
+    # lock URL ไว้จน commit: _cleanup_avatar ของ request อื่นอาจลบไฟล์เดียวกัน (ที่เพิ่ง dedup) ไปก่อนได้ lock
+    # ถ้าไฟล์หายไปแล้วเขียนใหม่จาก upload เดิม (เนื้อหาเดิม URL เดิม)
+    await _lock_avatar(db, avatar_url)
+    if not await run_in_threadpool(avatar_files_exist, avatar_url):
+        file.file.seek(0)
+        avatar_url = await run_in_threadpool(store_avatar, file.file, ext)
+
     # อัปเดต avatar_url ในฐานข้อมูล (เป็น relative path)
-    me.avatar_url = f"/media/avatars/{fname}"
+    old_avatar_url = me.avatar_url
+    me.avatar_url = avatar_url
     db.add(me)
-    db.commit()
-    db.refresh(me)
+    await db.commit()
+    await db.refresh(me)
+    await _load_principal.invalidate(me.id)
+    if old_avatar_url != avatar_url:
+        await _cleanup_avatar(db, old_avatar_url)
     return me
+
+async def _lock_avatar(db: AsyncSession, avatar_url: str) -> None:
+    """advisory lock ต่อ URL ของ avatar ใน transaction ปัจจุบัน (ปล่อยเมื่อ commit/rollback)"""
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(avatar_url))))
+
+async def _cleanup_avatar(db: AsyncSession, avatar_url: str | None) -> None:
+    """ลบไฟล์ avatar ที่ไม่มี user คนไหนใช้แล้ว (content-addressed อาจใช้ร่วมกันหลาย user)"""
+    if not avatar_url:
+        return
+    # เช็คและลบภายใต้ lock เดียวกับที่ upload_avatar ถือตอน commit URL
+    await _lock_avatar(db, avatar_url)
+    try:
+        if not await db.scalar(select(User.id).where(User.avatar_url == avatar_url).limit(1)):
+            await run_in_threadpool(remove_avatar, avatar_url)
+    finally:
+        await db.commit()  # ปล่อย lock
 @router.delete("/account")
-def delete_account(db: Session = Depends(get_db), me: User = Depends(current_user)):
+async def delete_account(db: AsyncSession = Depends(get_async_db), me: User = Depends(current_user_record)):
     """
     ลบบัญชีผู้ใช้ถาวร
     บันทึก: การกระทำนี้ไม่สามารถย้อนกลับได้
     """
     try:
         # ลบผู้ใช้จากฐานข้อมูล
-        db.delete(me)
-        db.commit()
+        avatar_url = me.avatar_url
+        user_id = me.id
+        # refresh token ใช้ไม่ได้เมื่อไม่มี user อยู่แล้ว revoke_all ทำให้ process นี้ปฏิเสธได้ทันทีโดยไม่แตะ DB
+        await db.run_sync(token_revocation.revoke_all, user_id)
+        await db.delete(me)
+        await db.commit()
+        await _load_principal.invalidate(user_id)
+        await _cleanup_avatar(db, avatar_url)
         return {"detail": "ลบบัญชีเสร็จสิ้น"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -8,23 +8,25 @@ register.py - API Endpoint สำหรับสมัครสมาชิก (
 1. รับ email, username, gender, age, password, confirm_password
 2. ตรวจสอบว่า password และ confirm_password ตรงกัน
 3. ตรวจสอบว่า email ยังไม่ถูกใช้งาน
-4. เข้ารหัสรหัสผ่านด้วย bcrypt
+4. เข้ารหัสรหัสผ่านด้วย bcrypt ใน process pool (คืน DB connection ระหว่างรอ, คิวเต็มตอบ 503)
 5. บันทึกลงฐานข้อมูล
 6. สร้าง UUID ให้อัตโนมัติ
 7. ส่งข้อมูล user กลับไป
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.session import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.user import User
-from core.security import hash_password
+from core import password_pool
 from schemas.register import RegisterRequest, RegisterResponse
 
 router = APIRouter(prefix="/register", tags=["register"])
 
 @router.post("", response_model=RegisterResponse, status_code=201)
-def register(payload: RegisterRequest, db: Session = Depends(get_db)):
+async def register(payload: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
     """
     สมัครสมาชิกใหม่
     
@@ -38,24 +40,41 @@ def register(payload: RegisterRequest, db: Session = Depends(get_db)):
     Raises:
         400: ถ้ารหัสผ่านและยืนยันไม่ตรงกัน
         409: ถ้า email ถูกใช้งานแล้ว
+        503: ถ้าคิว bcrypt เต็ม (ลองใหม่ตาม Retry-After)
     """
     # ตรวจสอบว่ารหัสผ่านและยืนยันรหัสผ่านตรงกัน
     if payload.password != payload.confirm_password:
         raise HTTPException(status_code=400, detail="รหัสผ่านและยืนยันรหัสผ่านไม่ตรงกัน")
     
     # ตรวจสอบว่า email ยังไม่ถูกใช้งาน (ต้อง unique)
-    if db.query(User).filter(User.email == payload.email).first():
+    if await db.scalar(select(User.id).where(User.email == payload.email)):
         raise HTTPException(status_code=409, detail="อีเมลนี้ถูกใช้แล้ว")
 
+    # คืน connection ให้ pool ระหว่างรอ bcrypt (session จะเปิด connection ใหม่ตอน commit)
+    await db.close()
+    try:
+        password_hash = await password_pool.hash_password(payload.password)  # เข้ารหัสรหัสผ่านด้วย bcrypt
+    except password_pool.PasswordPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังตรวจสอบรหัสผ่านจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+            headers={"Retry-After": str(password_pool.RETRY_AFTER_SECONDS)},
+        )
+
     # สร้าง User ใหม่
     user = User(
         email=payload.email,
         username=payload.username,
         gender=payload.gender,
         age=payload.age,
-        password_hash=hash_password(payload.password),  # เข้ารหัสรหัสผ่านด้วย bcrypt
+        password_hash=password_hash,
     )
     db.add(user)  # เพิ่มเข้า session
-    db.commit()  # บันทึกลงฐานข้อมูล
-    db.refresh(user)  # ดึงข้อมูลใหม่จาก DB (เพื่อให้ได้ id ที่ DB สร้างให้)
+    try:
+        await db.commit()  # บันทึกลงฐานข้อมูล
+    except IntegrityError:
+        # มีคนสมัครด้วย email เดียวกันระหว่างรอ bcrypt
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="อีเมลนี้ถูกใช้แล้ว")
+    await db.refresh(user)  # ดึงข้อมูลใหม่จาก DB (เพื่อให้ได้ id ที่ DB สร้างให้)
     return user
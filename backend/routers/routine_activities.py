@@ -20,11 +20,15 @@ Routine Activity คืออะไร:
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.routine_activity import RoutineActivity
 from models.activity import Activity
-from models.user import User
-from db.session import get_db
+from core.auth_cache import Principal
+from db.session import get_async_db
+from core import mood_stats
+from core.cache import cached
+from core.query_budget import query_budget
 from routers.profile import current_user # Dependency สำหรับตรวจสอบ user ที่ login
 from schemas.routine_activity import RoutineActivityCreate, RoutineActivityResponse, RoutineActivityUpdate
 from datetime import datetime, date, timedelta
@@ -34,6 +38,9 @@ router = APIRouter(prefix="/routine-activities", tags=["Routines"])
 
 DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
 
+# cache แม่แบบเป็น Core row (อ่านอย่างเดียว pickle ได้) แทน ORM object ที่ผูกกับ session ของ request
+ROUTINE_COLUMNS = list(RoutineActivity.__table__.columns)
+
 def _parse_reminder_minutes(value) -> int | None:
     try:
         if value is None:
@@ -49,7 +56,34 @@ def get_date_for_day_in_week(today: date, day_key: str) -> date:
     target_weekday = DAY_KEYS.index(day_key)
     return today + timedelta(days=(target_weekday - today.weekday()))
 
-def build_activity_from_routine(me: User, routine: RoutineActivity, target_date: date) -> Activity:
+@cached("routines", key=lambda db, user_id: "all", scope=lambda db, user_id: user_id, shared_only=True)
+async def load_routine_templates(db: AsyncSession, user_id: UUID) -> list:
+    """
+    แม่แบบทั้งหมดของ user เรียงตามเวลา
+    cache ต่อ user เฉพาะเมื่อตั้ง CACHE_REDIS_URL (invalidate เมื่อสร้าง/แก้/ลบแม่แบบ มีผลทุก worker)
+    ยังอาจได้แม่แบบที่เพิ่งถูกลบได้ไม่เกิน CACHE_VERSION_TTL_SECONDS ก่อนสร้าง Activity ให้ผ่าน lock_live_routines
+    """
+    rows = await db.execute(
+        select(*ROUTINE_COLUMNS).where(RoutineActivity.user_id == user_id).order_by(RoutineActivity.time)
+    )
+    return rows.all()
+
+async def lock_live_routines(db: AsyncSession, user_id: UUID, routine_ids) -> set:
+    """
+    id ของแม่แบบที่ยังอยู่จริง (จาก routine_ids) พร้อมล็อกแถว (FOR UPDATE) จนจบ transaction
+    เรียกก่อน insert Activity จากแม่แบบ: แม่แบบที่ถูกลบไปแล้วถูกข้าม (ไม่ชน FK ของ activities.routine_id)
+    และ delete_routine ที่มาพร้อมกันต้องรอจน insert commit แล้วจึงปลด routine_id ของกิจกรรมเหล่านั้น
+    """
+    routine_ids = set(routine_ids)
+    if not routine_ids:
+        return set()
+    rows = await db.scalars(select(RoutineActivity.id).where(
+        RoutineActivity.id.in_(routine_ids),
+        RoutineActivity.user_id == user_id,
+    ).with_for_update())
+    return set(rows.all())
+
+def build_activity_from_routine(me: Principal, routine: RoutineActivity, target_date: date) -> Activity:
     copied_subtasks = None
     if routine.subtasks:
         import uuid
@@ -83,24 +117,25 @@ def build_activity_from_routine(me: User, routine: RoutineActivity, target_date:
     )
 
 @router.get("", response_model=list[RoutineActivityResponse])
-def list_routines(
+async def list_routines(
     day_of_week: str | None = None, 
-    db: Session = Depends(get_db), 
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    me: Principal = Depends(current_user)
 ):
     """
     ดึงข้อมูลแม่แบบกิจกรรมประจำวันทั้งหมด
     สามารถกรองด้วยวันในสัปดาห์ (e.g., "mon", "tue")
     """
-    q = db.query(RoutineActivity).filter(RoutineActivity.user_id == me.id)
+    routines = await load_routine_templates(db, me.id)
     if day_of_week:
-        q = q.filter(RoutineActivity.day_of_week == day_of_week)
-    return q.order_by(RoutineActivity.time).all()
+        routines = [r for r in routines if r.day_of_week == day_of_week]
+    return routines
 
 @router.post("/batch-week", status_code=201)
-def batch_week(
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+@query_budget(14)
+async def batch_week(
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     สร้างกิจกรรมจากแม่แบบสำหรับ 7 วันถัดไป
@@ -111,7 +146,17 @@ def batch_week(
     start_date = today + timedelta(days=1) if today.weekday() == 6 else today
     end_date = start_date + timedelta(days=6)
 
-    routines = db.query(RoutineActivity).filter(RoutineActivity.user_id == me.id).all()
+    routines = await load_routine_templates(db, me.id)
+
+    # กิจกรรมจากแม่แบบที่มีอยู่แล้วในช่วงนี้ อ่านครั้งเดียวแทนการ query ทีละแม่แบบ
+    existing = set((await db.execute(
+        select(Activity.routine_id, Activity.date).where(
+            Activity.user_id == me.id,
+            Activity.routine_id.is_not(None),
+            Activity.date >= start_date,
+            Activity.date <= end_date,
+        )
+    )).all())
     new_rows = []
 
     for routine in routines:
@@ -122,26 +167,24 @@ def batch_week(
         if not (start_date <= target_date <= end_date):
             continue
 
-        existing = db.query(Activity).filter(
-            Activity.user_id == me.id,
-            Activity.routine_id == routine.id,
-            Activity.date == target_date
-        ).first()
-
-        if not existing:
+        if (routine.id, target_date) not in existing:
             new_rows.append(build_activity_from_routine(me, routine, target_date))
 
+    live = await lock_live_routines(db, me.id, {r.routine_id for r in new_rows})
+    new_rows = [r for r in new_rows if r.routine_id in live]
+
     if new_rows:
         db.add_all(new_rows)
-        db.commit()
+        await db.run_sync(mood_stats.refresh_days, me.id, {r.date for r in new_rows})
+        await db.commit()
 
     return {"created": len(new_rows)}
 
 @router.post("", response_model=RoutineActivityResponse, status_code=201)
-def create_routine(
+async def create_routine(
     payload: RoutineActivityCreate, 
-    db: Session = Depends(get_db), 
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    me: Principal = Depends(current_user)
 ):
     """
     สร้างแม่แบบกิจกรรมประจำวันใหม่
@@ -155,39 +198,41 @@ def create_routine(
 
     row = RoutineActivity(user_id=me.id, **data)
     db.add(row)
-    db.commit()
-    db.refresh(row)
+    await db.commit()
+    await db.refresh(row)
+    await load_routine_templates.invalidate(me.id)
 
     today = date.today()
     week_end = get_week_end(today)
     target_date = get_date_for_day_in_week(today, row.day_of_week)
 
     if today <= target_date <= week_end:
-        existing = db.query(Activity).filter(
+        existing = await db.scalar(select(Activity.id).where(
             Activity.user_id == me.id,
             Activity.routine_id == row.id,
             Activity.date == target_date
-        ).first()
+        ).limit(1))
 
         if not existing:
             db.add(build_activity_from_routine(me, row, target_date))
-            db.commit()
+            await db.run_sync(mood_stats.refresh_days, me.id, [target_date])
+            await db.commit()
     return row
 
 @router.put("/{routine_id}", response_model=RoutineActivityResponse)
-def update_routine(
+async def update_routine(
     routine_id: UUID, 
     payload: RoutineActivityUpdate, 
-    db: Session = Depends(get_db), 
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    me: Principal = Depends(current_user)
 ):
     """
     อัปเดตแม่แบบกิจกรรมประจำวัน
     """
-    row = db.query(RoutineActivity).filter(
+    row = await db.scalar(select(RoutineActivity).where(
         RoutineActivity.id == routine_id, 
         RoutineActivity.user_id == me.id
-    ).first()
+    ))
     if not row:
         raise HTTPException(404, "ไม่พบกิจกรรมประจำวัน")
     
@@ -195,31 +240,34 @@ def update_routine(
     for k, v in update_data.items():
         setattr(row, k, v)
 
-    db.commit()
-    db.refresh(row)
+    await db.commit()
+    await db.refresh(row)
+    await load_routine_templates.invalidate(me.id)
 
     today = date.today()
     week_end = get_week_end(today)
 
-    db.query(Activity).filter(
+    await db.execute(delete(Activity).where(
         Activity.user_id == me.id,
         Activity.routine_id == row.id,
         Activity.date >= today,
         Activity.date <= week_end,
-    ).delete(synchronize_session=False)
+    ).execution_options(synchronize_session=False))
 
     target_date = get_date_for_day_in_week(today, row.day_of_week)
     if today <= target_date <= week_end:
         db.add(build_activity_from_routine(me, row, target_date))
 
-    db.commit()
+    # กิจกรรมที่ถูกลบ/สร้างใหม่อยู่ในช่วง today..week_end
+    await db.run_sync(mood_stats.refresh_days, me.id, [today + timedelta(days=i) for i in range((week_end - today).days + 1)])
+    await db.commit()
     return row
 
 @router.delete("/{routine_id}", status_code=204)
-def delete_routine(
+async def delete_routine(
     routine_id: UUID, 
-    db: Session = Depends(get_db), 
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    me: Principal = Depends(current_user)
 ):
     """
     ลบแม่แบบกิจกรรมประจำวัน
@@ -228,20 +276,23 @@ def delete_routine(
     """
     from models.activity import Activity
     
-    row = db.query(RoutineActivity).filter(
+    # FOR UPDATE: รอ request ที่กำลังสร้างกิจกรรมจากแม่แบบนี้ (lock_live_routines) ให้ commit ก่อน
+    # update ด้านล่างจึงเห็นกิจกรรมเหล่านั้นด้วย และ DELETE ไม่ชน FK
+    row = await db.scalar(select(RoutineActivity).where(
         RoutineActivity.id == routine_id, 
         RoutineActivity.user_id == me.id
-    ).first()
+    ).with_for_update())
     if not row:
         raise HTTPException(404, "ไม่พบกิจกรรมประจำวัน")
     
     # ตั้งค่า routine_id เป็น NULL สำหรับกิจกรรมที่สร้างจากแม่แบบนี้
-    db.query(Activity).filter(
+    await db.execute(update(Activity).where(
         Activity.routine_id == routine_id,
         Activity.user_id == me.id
-    ).update({"routine_id": None}, synchronize_session=False)
+    ).values(routine_id=None).execution_options(synchronize_session=False))
     
     # ลบแม่แบบ
-    db.delete(row)
-    db.commit()
+    await db.delete(row)
+    await db.commit()
+    await load_routine_templates.invalidate(me.id)
     return
\ No newline at end of file
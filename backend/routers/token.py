@@ -1,42 +1,74 @@
 """
-token.py - Stateless refresh endpoint using JWT refresh tokens
+token.py - Refresh endpoint using rotating JWT refresh tokens
 
-POST /auth/refresh - รับ refresh_token ใน body และคืน access token ใหม่
+POST /auth/refresh - รับ refresh_token ใน body คืน access token ใหม่ + refresh token ใหม่ (rotation)
+POST /auth/logout  - revoke refresh token ที่ส่งมา
 
-การออกแบบ: ใช้ JWT เป็น refresh token (stateless). ตรวจสอบ signature, exp และ type=="refresh".
+การออกแบบ: refresh token เป็น JWT (ตรวจ signature, exp และ type=="refresh") ที่มี jti และ ver
+- refresh token แต่ละอันใช้ได้ครั้งเดียว ใช้แล้วถูก revoke และได้อันใหม่กลับไปแทน
+- ตรวจ revoke ใน memory ก่อน แล้วใช้ INSERT เดียวทั้งตรวจและ revoke ใน DB (ดู core/token_revocation.py)
+- เปลี่ยนรหัสผ่าน / ลบบัญชี revoke ทุก token ของ user (token_revocation.revoke_all)
 """
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from schemas.login import RefreshRequest
-from schemas.login import TokenResponse
-from core import security
-from jose import ExpiredSignatureError, JWTError
+from schemas.login import TokenPairResponse
+from core import security, token_revocation
+from db.session import get_async_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/refresh", response_model=TokenResponse)
-def refresh_token(payload: RefreshRequest):
-    token = payload.refresh_token
+def _decode_refresh(token: str) -> dict:
     try:
         decoded = security.decode_token(token)
-    except ExpiredSignatureError:
+    except security.TokenExpired:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
-    except JWTError:
+    except security.InvalidToken:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
     # ตรวจสอบว่าเป็น refresh token
     if decoded.get("type") != "refresh":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
 
-    sub = decoded.get("sub")
-    if not sub:
+    if not decoded.get("sub"):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    return decoded
 
-    # สร้าง access token ใหม่ (stateless)
+
+@router.post("/refresh", response_model=TokenPairResponse)
+async def refresh_token(payload: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    decoded = _decode_refresh(payload.refresh_token)
+
+    # revoke token เดิม (ใช้ได้ครั้งเดียว)
+    try:
+        user_id, version = await db.run_sync(token_revocation.use_refresh_token, decoded)
+    except token_revocation.RefreshTokenRevoked:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token revoked")
+
+    # สร้าง access token + refresh token ใหม่
     try:
-        new_access = security.create_token(str(sub), token_type="access")
+        new_access = security.create_token(str(user_id), token_type="access")
+        new_refresh = security.create_token(str(user_id), token_type="refresh", claims={"ver": version})
     except Exception:
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Unable to create access token")
 
-    return TokenResponse(access_token=new_access)
+    await db.commit()
+    return TokenPairResponse(access_token=new_access, refresh_token=new_refresh)
+
+
+@router.post("/logout")
+async def logout(payload: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """revoke refresh token ของอุปกรณ์นี้ (token ที่หมดอายุหรือไม่ถูกต้องถือว่า logout แล้ว)"""
+    try:
+        decoded = security.decode_token(payload.refresh_token)
+    except security.InvalidToken:
+        return {"detail": "ออกจากระบบสำเร็จ"}
+
+    if decoded.get("type") == "refresh":
+        await db.run_sync(token_revocation.revoke_token, decoded)
+        await db.commit()
+    return {"detail": "ออกจากระบบสำเร็จ"}
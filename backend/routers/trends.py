@@ -6,6 +6,8 @@ trends.py - API Endpoints สำหรับหน้า Dashboard/Trends
 - GET /trends/mood-factors - ปัจจัยที่ส่งผลต่ออารมณ์ (Mood Tags Analysis)
 - GET /trends/completion - สรุปความสำเร็จของกิจกรรม (Completion Rate)
 - GET /trends/life-balance - สมดุลชีวิตตามหมวดหมู่ (Category Distribution)
+- GET /trends/mood-correlation - mood เฉลี่ยของวันที่มี/ไม่มีกิจกรรมแต่ละหมวด และตามช่วง completion rate
+  (อ่านจากสถิติที่อัปเดตแบบ incremental ใน core/mood_stats.py)
 
 Query Parameters:
 - period: 'week' | 'month' | 'year' (default: 'week')
@@ -14,16 +16,24 @@ Data Flow:
 1. คำนวณ date range จาก period ที่เลือก
 2. Query ข้อมูลจาก diaries และ activities
 3. ประมวลผลและส่งกลับในรูปแบบที่พร้อมใช้กับ charts
+
+helper ทั้งหมดเป็น async (AsyncSession) /summary จึง await ต่อกันใน event loop เดียวโดยไม่จอง thread
+helper ของ community (ข้อมูลรวมทุก user) ถูก cache ร่วมกันทุก user/worker ผ่าน core/cache.py
 """
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, case
-from db.session import get_db
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy import func, case, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.diary import Diary
 from models.activity import Activity
-from models.user import User
+from core.auth_cache import Principal
 from routers.profile import current_user
+from core import mood_stats
+from core.cache import cached
+from core.config import settings
+from core.query_budget import query_budget
+from core.responses import ORJSONResponse, etag_for, etag_matches
 from datetime import datetime, timedelta
 from typing import Literal, Optional
 from collections import Counter
@@ -54,18 +64,18 @@ def calculate_average(scores):
     return round(sum(scores) / len(scores), 1) if scores else 0
 
 
-def fetch_diaries(db: Session, start_date, end_date, user_id=None, require_tags=False):
-    query = db.query(Diary).filter(
+async def fetch_diaries(db: AsyncSession, start_date, end_date, user_id=None, require_tags=False):
+    query = select(Diary).where(
         Diary.date >= start_date,
         Diary.date <= end_date,
     )
     if require_tags:
-        query = query.filter(Diary.mood_tags.isnot(None))
+        query = query.where(Diary.mood_tags.isnot(None))
     else:
-        query = query.filter(Diary.mood_score.isnot(None))
+        query = query.where(Diary.mood_score.isnot(None))
     if user_id:
-        query = query.filter(Diary.user_id == user_id)
-    return query.order_by(Diary.date).all()
+        query = query.where(Diary.user_id == user_id)
+    return (await db.execute(query.order_by(Diary.date))).scalars().all()
 
 
 def bucket_score(score: float):
@@ -107,9 +117,9 @@ def calculate_best_streak(daily_completion_rates: list) -> int:
     return max_streak
 
 
-def analyze_mood_factors(period: str, offset: int, db: Session, user_id=None, limit: int = 5):
+async def analyze_mood_factors(period: str, offset: int, db: AsyncSession, user_id=None, limit: int = 5):
     start_date, end_date = get_date_range(period, offset)
-    diaries = fetch_diaries(db, start_date, end_date, user_id=user_id, require_tags=True)
+    diaries = await fetch_diaries(db, start_date, end_date, user_id=user_id, require_tags=True)
 
     positive_tags = []
     negative_tags = []
@@ -201,15 +211,15 @@ CATEGORY_LABELS = {
 }
 
 
-def calculate_completion_stats(period: str, offset: int, db: Session, user_id=None):
+async def calculate_completion_stats(period: str, offset: int, db: AsyncSession, user_id=None):
     start_date, end_date = get_date_range(period, offset)
-    query = db.query(Activity).filter(
+    query = select(Activity).where(
         Activity.date >= start_date,
         Activity.date <= end_date
     )
     if user_id:
-        query = query.filter(Activity.user_id == user_id)
-    activities = query.all()
+        query = query.where(Activity.user_id == user_id)
+    activities = (await db.execute(query)).scalars().all()
 
     total = len(activities)
     if total == 0:
@@ -372,11 +382,11 @@ def get_date_range(period: str, offset: int = 0):
 
 
 @router.get("/mood")
-def get_mood_trend(
+async def get_mood_trend(
     period: Literal['week', 'month'] = Query('week'),
     offset: int = Query(0, description="ย้อนหลัง: 0=ปัจจุบัน, -1=ช่วงที่แล้ว, -2=ช่วงก่อนหน้า 2 ช่วง"),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     ดึงข้อมูลแนวโน้มอารมณ์ (Mood Trend) สำหรับ Line Chart
@@ -409,7 +419,7 @@ def get_mood_trend(
         }
     """
     start_date, end_date = get_date_range(period, offset)
-    diaries = fetch_diaries(db, start_date, end_date, user_id=me.id)
+    diaries = await fetch_diaries(db, start_date, end_date, user_id=me.id)
     
     # แปลง mood_score เป็น numeric (1-5)
     data = []
@@ -457,7 +467,7 @@ def get_mood_trend(
     
     # เปรียบเทียบกับช่วงก่อนหน้า
     prev_start, prev_end = get_date_range(period, offset - 1)
-    prev_diaries = fetch_diaries(db, prev_start, prev_end, user_id=me.id)
+    prev_diaries = await fetch_diaries(db, prev_start, prev_end, user_id=me.id)
     prev_scores = [normalize_score(d.mood_score) for d in prev_diaries if normalize_score(d.mood_score) is not None]
     prev_average = calculate_average(prev_scores) if prev_scores else None
     trend_diff = round(average - prev_average, 1) if prev_average is not None else None
@@ -484,11 +494,11 @@ def get_mood_trend(
 
 
 @router.get("/mood-factors")
-def get_mood_factors(
+async def get_mood_factors(
     period: Literal['week', 'month'] = Query('week'),
     offset: int = Query(0, description="ย้อนหลัง: 0=ปัจจุบัน, -1=ช่วงที่แล้ว"),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     วิเคราะห์ปัจจัยที่ส่งผลต่ออารมณ์ (Mood Tags Analysis) สำหรับ Bar Chart
@@ -514,15 +524,15 @@ def get_mood_factors(
             "neutral": [...]
         }
     """
-    return analyze_mood_factors(period, offset, db, user_id=me.id)
+    return await analyze_mood_factors(period, offset, db, user_id=me.id)
 
 
 @router.get("/completion")
-def get_completion_rate(
+async def get_completion_rate(
     period: Literal['week', 'month'] = Query('week'),
     offset: int = Query(0, description="ย้อนหลัง: 0=ปัจจุบัน, -1=ช่วงที่แล้ว"),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     สรุปความสำเร็จของกิจกรรม (Completion Rate) สำหรับ Donut Chart
@@ -555,15 +565,48 @@ def get_completion_rate(
             ]
         }
     """
-    return calculate_completion_stats(period, offset, db, user_id=me.id)
+    return await calculate_completion_stats(period, offset, db, user_id=me.id)
+
+
+@router.get("/mood-correlation")
+async def get_mood_correlation(
+    min_days: int = Query(1, ge=1, description="ไม่แสดงหมวดที่มีจำนวนวันน้อยกว่านี้"),
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
+):
+    """
+    ความสัมพันธ์ระหว่าง mood กับกิจกรรม (ทั้งประวัติของ user)
+
+    การคำนวณ:
+    - mood ของวัน = ค่าเฉลี่ย mood_score ของ diary วันนั้น (นับเฉพาะวันที่มี mood)
+    - ต่อหมวด: mood เฉลี่ยของวันที่มีกิจกรรมหมวดนั้น เทียบกับวันที่ไม่มี (พร้อมจำนวนวัน)
+    - ต่อช่วง completion rate ของวัน: 0-25, 25-50, 50-75, 75-100 (%) และ none = ไม่มีกิจกรรม
+    - อ่านจาก sufficient statistics ต่อ (user, หมวด) ที่อัปเดตทุกครั้งที่เขียน diary/activity
+      จึงไม่ต้อง join ประวัติทั้งหมดทุก request
+
+    Returns:
+        {
+            "overall": {"days": 40, "avg_mood": 3.6, "stddev": 0.9},
+            "categories": [
+                {
+                    "category": "health",
+                    "with": {"days": 12, "avg_mood": 4.1, "stddev": 0.7},
+                    "without": {"days": 28, "avg_mood": 3.39, "stddev": 0.88},
+                    "difference": 0.71
+                }
+            ],
+            "completion_bands": [{"band": "75-100", "days": 9, "avg_mood": 4.2, "stddev": 0.6}, ...]
+        }
+    """
+    return await db.run_sync(mood_stats.read_correlation, me.id, min_days)
 
 
 @router.get("/life-balance")
-def get_life_balance(
+async def get_life_balance(
     period: Literal['week', 'month'] = Query('week'),
     offset: int = Query(0, description="ย้อนหลัง: 0=ปัจจุบัน, -1=ช่วงที่แล้ว"),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     สมดุลชีวิตตามหมวดหมู่ (Category Distribution) สำหรับ Pie Chart
@@ -596,11 +639,11 @@ def get_life_balance(
     start_date, end_date = get_date_range(period, offset)
     
     # Query activities ในช่วงเวลาที่เลือก
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.user_id == me.id,
         Activity.date >= start_date,
         Activity.date <= end_date
-    ).all()
+    ))).scalars().all()
     
     total = len(activities)
     if total == 0:
@@ -699,9 +742,20 @@ def get_life_balance(
     }
 
 
-def get_community_mood(period: Literal['week', 'month'], offset: int, db: Session, my_average: Optional[float] = None):
+def _community_key(period: str, offset: int, db: AsyncSession):
+    # ใช้ช่วงวันที่จริงแทน offset: ข้ามสัปดาห์/เดือนแล้วไม่ได้ค่าของช่วงเก่า
+    return (period, *get_date_range(period, offset))
+
+
+# ข้อมูล community เหมือนกันทุก user: cache ร่วมกัน (ไม่ invalidate ตอนเขียน หมดอายุตาม CACHE_COMMUNITY_TTL_SECONDS)
+cached_community = cached("community", key=_community_key, ttl=settings.cache_community_ttl_seconds)
+
+
+@cached_community
+async def _community_mood_snapshot(period: Literal['week', 'month'], offset: int, db: AsyncSession):
+    """ส่วนของ get_community_mood ที่ไม่ขึ้นกับ user (scores เก็บไว้คำนวณ percentile ของแต่ละคน)"""
     start_date, end_date = get_date_range(period, offset)
-    diaries = fetch_diaries(db, start_date, end_date)
+    diaries = await fetch_diaries(db, start_date, end_date)
 
     scores = []
     user_ids = set()
@@ -716,28 +770,42 @@ def get_community_mood(period: Literal['week', 'month'], offset: int, db: Sessio
     stddev = calculate_stddev(scores)
 
     prev_start, prev_end = get_date_range(period, offset - 1)
-    prev_diaries = fetch_diaries(db, prev_start, prev_end)
+    prev_diaries = await fetch_diaries(db, prev_start, prev_end)
     prev_scores = [normalize_score(d.mood_score) for d in prev_diaries if normalize_score(d.mood_score) is not None]
     prev_average = calculate_average(prev_scores) if prev_scores else None
     trend_diff = round(average - prev_average, 1) if prev_average is not None else None
 
+    return {
+        "average": average,
+        "stddev": stddev,
+        "trend_diff": trend_diff,
+        "user_count": len(user_ids),
+        "scores": scores,
+    }
+
+
+async def get_community_mood(period: Literal['week', 'month'], offset: int, db: AsyncSession, my_average: Optional[float] = None):
+    snapshot = await _community_mood_snapshot(period, offset, db)
+    scores = snapshot["scores"]
+
     # Calculate percentile of user's mood
     percentile_of_me = calculate_percentile(my_average, scores) if my_average is not None else None
 
     return {
         "period": period,
-        "average": average,
-        "stddev": stddev,
-        "trend_diff": trend_diff,
+        "average": snapshot["average"],
+        "stddev": snapshot["stddev"],
+        "trend_diff": snapshot["trend_diff"],
         "total_entries": len(scores),
-        "user_count": len(user_ids),
+        "user_count": snapshot["user_count"],
         "percentile_of_me": percentile_of_me
     }
 
 
-def get_community_mood_distribution(period: Literal['week', 'month'], offset: int, db: Session):
+@cached_community
+async def get_community_mood_distribution(period: Literal['week', 'month'], offset: int, db: AsyncSession):
     start_date, end_date = get_date_range(period, offset)
-    diaries = fetch_diaries(db, start_date, end_date)
+    diaries = await fetch_diaries(db, start_date, end_date)
     scores = [normalize_score(d.mood_score) for d in diaries if normalize_score(d.mood_score) is not None]
     buckets = Counter(bucket_score(score) for score in scores)
     distribution = [{"score": score, "count": buckets.get(score, 0)} for score in range(1, 6)]
@@ -748,24 +816,27 @@ def get_community_mood_distribution(period: Literal['week', 'month'], offset: in
     }
 
 
-def get_community_mood_factors(period: Literal['week', 'month'], offset: int, db: Session):
-    return analyze_mood_factors(period, offset, db, user_id=None, limit=5)
+@cached_community
+async def get_community_mood_factors(period: Literal['week', 'month'], offset: int, db: AsyncSession):
+    return await analyze_mood_factors(period, offset, db, user_id=None, limit=5)
 
 
-def get_community_completion(period: Literal['week', 'month'], offset: int, db: Session):
-    return calculate_completion_stats(period, offset, db, user_id=None)
+@cached_community
+async def get_community_completion(period: Literal['week', 'month'], offset: int, db: AsyncSession):
+    return await calculate_completion_stats(period, offset, db, user_id=None)
 
 
-def get_activity_heatmap(period: Literal['week', 'month'], offset: int, db: Session):
+@cached_community
+async def get_activity_heatmap(period: Literal['week', 'month'], offset: int, db: AsyncSession):
     """Build a 7x24 heatmap of activity counts (all users) by weekday and hour.
     All-day activities will be ignored for heatmap/time-based analysis.
     Returns a dict: { days: [...], hours: [0..23], matrix: number[7][24] }
     """
     start_date, end_date = get_date_range(period, offset)
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.date >= start_date,
         Activity.date <= end_date
-    ).all()
+    ))).scalars().all()
 
     # Initialize 7x24 matrix
     matrix = [[0 for _ in range(24)] for _ in range(7)]
@@ -799,16 +870,17 @@ def get_activity_heatmap(period: Literal['week', 'month'], offset: int, db: Sess
     }
 
 
-def get_peak_time(period: Literal['week', 'month'], offset: int, db: Session):
+@cached_community
+async def get_peak_time(period: Literal['week', 'month'], offset: int, db: AsyncSession):
     """Calculate percentage distribution of activities by time buckets for all users.
     Buckets: morning(5-11), noon(11-15), evening(17-21), night(21-5).
     Returns: { morning, noon, evening, night, summary }
     """
     start_date, end_date = get_date_range(period, offset)
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.date >= start_date,
         Activity.date <= end_date
-    ).all()
+    ))).scalars().all()
 
     buckets = {
         "morning": 0,   # 05:00 - 10:59
@@ -857,15 +929,16 @@ def get_peak_time(period: Literal['week', 'month'], offset: int, db: Session):
     return pct
 
 
-def get_community_category_mix(period: Literal['week', 'month'], offset: int, db: Session):
+@cached_community
+async def get_community_category_mix(period: Literal['week', 'month'], offset: int, db: AsyncSession):
     """Return category distribution across all users.
     Shape: { items: [{ label, value }] } with value as percentage.
     """
     start_date, end_date = get_date_range(period, offset)
-    activities = db.query(Activity).filter(
+    activities = (await db.execute(select(Activity).where(
         Activity.date >= start_date,
         Activity.date <= end_date
-    ).all()
+    ))).scalars().all()
 
     total = len(activities)
     if total == 0:
@@ -888,11 +961,13 @@ def get_community_category_mix(period: Literal['week', 'month'], offset: int, db
 
 
 @router.get("/summary")
-def get_dashboard_summary(
+@query_budget(16)
+async def get_dashboard_summary(
+    request: Request,
     period: Literal['week', 'month'] = Query('week'),
     offset: int = Query(0, description="ย้อนหลัง: 0=ปัจจุบัน, -1=ช่วงที่แล้ว"),
-    db: Session = Depends(get_db),
-    me: User = Depends(current_user)
+    db: AsyncSession = Depends(get_async_db),
+    me: Principal = Depends(current_user)
 ):
     """
     สรุปข้อมูลทั้งหมดสำหรับ Dashboard (เรียกครั้งเดียวได้หมด)
@@ -928,21 +1003,23 @@ def get_dashboard_summary(
             }
         }
     """
-    my_mood = get_mood_trend(period, offset, db, me)
-    my_mood_factors = analyze_mood_factors(period, offset, db, user_id=me.id)
-    my_completion = calculate_completion_stats(period, offset, db, user_id=me.id)
-    my_life_balance = get_life_balance(period, offset, db, me)
-
-    community_mood = get_community_mood(period, offset, db, my_average=my_mood.get("average"))
-    community_mood_distribution = get_community_mood_distribution(period, offset, db)
-    community_mood_factors = get_community_mood_factors(period, offset, db)
-    community_completion = get_community_completion(period, offset, db)
+    # AsyncSession ใช้พร้อมกันหลาย query ไม่ได้ จึง await ทีละตัว (ไม่ใช้ asyncio.gather)
+    my_mood = await get_mood_trend(period, offset, db, me)
+    my_mood_factors = await analyze_mood_factors(period, offset, db, user_id=me.id)
+    my_completion = await calculate_completion_stats(period, offset, db, user_id=me.id)
+    my_life_balance = await get_life_balance(period, offset, db, me)
+
+    community_mood = await get_community_mood(period, offset, db, my_average=my_mood.get("average"))
+    community_mood_distribution = await get_community_mood_distribution(period, offset, db)
+    community_mood_factors = await get_community_mood_factors(period, offset, db)
+    community_completion = await get_community_completion(period, offset, db)
     # Activity patterns (community-wide)
-    activity_heatmap = get_activity_heatmap(period, offset, db)
-    peak_time = get_peak_time(period, offset, db)
-    category_mix = get_community_category_mix(period, offset, db)
+    activity_heatmap = await get_activity_heatmap(period, offset, db)
+    peak_time = await get_peak_time(period, offset, db)
+    category_mix = await get_community_category_mix(period, offset, db)
 
-    return {
+    # คืน Response เอง: ข้าม jsonable_encoder (ไล่แปลงทุก node ของ dict ใหญ่ด้วย Python) แล้ว encode ด้วย orjson ทีเดียว
+    response = ORJSONResponse({
         "me": {
             "mood": my_mood,
             "mood_factors": my_mood_factors,
@@ -960,4 +1037,12 @@ def get_dashboard_summary(
                 "category_mix": category_mix
             }
         }
-    }
+    })
+
+    # ETag จาก body: แอปที่ refresh ซ้ำได้ 304 ถ้าข้อมูลไม่เปลี่ยน และ CompressionMiddleware ใช้ body ที่บีบไว้แล้วซ้ำได้
+    etag = etag_for(response.body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
@@ -11,6 +11,7 @@ Schemas:
 - DiaryCreate: สำหรับสร้าง diary ใหม่ (POST)
 - DiaryUpdate: สำหรับแก้ไข diary (PUT) - ทุก field เป็น optional
 - DiaryResponse: รูปแบบข้อมูลที่ส่งกลับไป
+- DiarySearchHit / DiarySearchResponse: ผลการค้นหา (GET /diary/search) พร้อม rank และ highlight
 
 2D Mood System:
 - mood_score: รับได้ทั้ง int (1-5) หรือ string ('good'/'bad')
@@ -20,7 +21,7 @@ Schemas:
 from pydantic import BaseModel, Field
 import datetime
 from uuid import UUID
-from typing import List, Union, Optional
+from typing import Dict, List, Union, Optional
 
 class ActivityFeedback(BaseModel):
     """ข้อมูลกิจกรรมพร้อม rating และ mood ที่บันทึกลง diary"""
@@ -79,3 +80,12 @@ class DiaryResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class DiarySearchHit(DiaryResponse):
+    rank: float = 0.0
+    # ข้อความบางส่วนที่ตรงกับคำค้น ครอบด้วย <mark>...</mark> (ส่วนอื่น HTML-escape แล้ว) เช่น {"title": "...", "detail": "..."}
+    highlights: Dict[str, str] = {}
+
+class DiarySearchResponse(BaseModel):
+    items: List[DiarySearchHit]
+    next_cursor: Optional[str] = None
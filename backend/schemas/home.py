@@ -16,4 +16,5 @@ class DiaryItem(BaseModel):
 
 class DiaryListResponse(BaseModel):
     items: list[DiaryItem]
-    total: int
+    total: int | None = None  # None เมื่อ include_total=false
+    next_cursor: str | None = None  # None = ไม่มีหน้าถัดไป
@@ -9,10 +9,12 @@ profile.py - Pydantic Schemas สำหรับ Profile API
 หมายเหตุ:
 - email แก้ไม่ได้ (เพราะเป็น unique identifier)
 - avatar อัปโหลดแยกต่างหากที่ POST /profile/avatar
+- avatar_variants: URL รูปย่อ 64/128/512 px (มีเฉพาะ avatar ที่เก็บแบบ content-addressed)
 """
 
-from pydantic import BaseModel, EmailStr, Field, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
 from uuid import UUID
+from core.avatars import avatar_variant_urls
 
 class ProfileMe(BaseModel):
     id: UUID
@@ -21,10 +23,17 @@ class ProfileMe(BaseModel):
     gender: str
     age: int
     avatar_url: str | None = None
+    avatar_variants: dict[str, str] | None = None
 
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def _fill_avatar_variants(self):
+        if self.avatar_variants is None:
+            self.avatar_variants = avatar_variant_urls(self.avatar_url)
+        return self
+
 class ProfileUpdateRequest(BaseModel):
     username: str = Field(..., min_length=2, max_length=100)
     gender: str
@@ -0,0 +1,135 @@
+"""
+ยิง request พร้อมกันจำนวนมากใส่ API ที่รันอยู่ แล้ววัด throughput / latency
+
+ใช้เทียบก่อน-หลังเปลี่ยนโค้ด (เช่น sync Session → AsyncSession): รันกับแต่ละ build ด้วย --concurrency เท่ากัน
+แล้วเทียบ req/s และ p95/p99 (ใส่ --label เพื่อแยกผลแต่ละรอบ, --json เพื่อเก็บผลไว้เทียบทีหลัง)
+
+ตัวอย่าง:
+    python scripts/bench_concurrency.py --email demo@example.com --password secret --concurrency 200 --duration 30
+    python scripts/bench_concurrency.py --token "$TOKEN" --endpoint /home/diaries --requests 5000 --label async --json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_ENDPOINTS = ["/home/diaries", "/activities?qdate={today}", "/trends/summary"]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    resp = await client.post("/login/token", json={"email": email, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def worker(client: httpx.AsyncClient, endpoints: list[str], budget: dict, results: dict) -> None:
+    i = 0
+    while True:
+        if budget["deadline"] is not None and time.perf_counter() >= budget["deadline"]:
+            return
+        if budget["remaining"] is not None:
+            if budget["remaining"] <= 0:
+                return
+            budget["remaining"] -= 1
+
+        path = endpoints[i % len(endpoints)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            ok = resp.status_code < 400
+            status = resp.status_code
+        except httpx.HTTPError as exc:
+            ok = False
+            status = type(exc).__name__
+        elapsed = (time.perf_counter() - started) * 1000
+        results["latencies"].append(elapsed)
+        if not ok:
+            results["errors"][str(status)] = results["errors"].get(str(status), 0) + 1
+
+
+async def run(args) -> dict:
+    today = time.strftime("%Y-%m-%d")
+    endpoints = [e.format(today=today) for e in (args.endpoint or DEFAULT_ENDPOINTS)]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        token = args.token or await login(client, args.email, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        # warm-up: ให้ connection pool ของ server/DB พร้อมก่อนจับเวลา
+        for path in endpoints:
+            await client.get(path)
+
+        results = {"latencies": [], "errors": {}}
+        started = time.perf_counter()
+        budget = {
+            "remaining": None if args.duration else args.requests,
+            "deadline": started + args.duration if args.duration else None,
+        }
+        await asyncio.gather(*(worker(client, endpoints, budget, results) for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    latencies = sorted(results["latencies"])
+    total = len(latencies)
+    return {
+        "label": args.label,
+        "endpoints": endpoints,
+        "concurrency": args.concurrency,
+        "requests": total,
+        "errors": results["errors"],
+        "seconds": round(wall, 3),
+        "rps": round(total / wall, 1) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(latencies[-1], 1) if latencies else 0.0,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent load test for authenticated read endpoints")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", help="Access token (otherwise log in with --email/--password)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--concurrency", type=int, default=100, help="Simultaneous in-flight requests")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed count")
+    parser.add_argument("--endpoint", action="append", help="GET path to hit (repeatable); {today} is substituted")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--label", default="run", help="Name printed with the result (e.g. sync / async)")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+    if not args.token and not (args.email and args.password):
+        parser.error("either --token or --email/--password is required")
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    lat = result["latency_ms"]
+    print(f"[{result['label']}] concurrency={result['concurrency']} endpoints={', '.join(result['endpoints'])}")
+    print(f"  requests={result['requests']} in {result['seconds']}s -> {result['rps']} req/s")
+    print(f"  latency ms: mean={lat['mean']} p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    if result["errors"]:
+        print(f"  errors: {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+วัดเวลา serialize response ขนาดใหญ่ (default 1,000 รายการ) ระหว่างทางเดิมกับทางใหม่ - ไม่ต้องมี DB/server
+
+ทางเดิม (เลียนแบบ FastAPI + JSONResponse):
+    model_validate ทีละแถว → validate response_model ซ้ำ → dump เป็น dict → json.dumps
+    dict ของ /trends/summary: jsonable_encoder → json.dumps
+ทางใหม่ (core/responses.py):
+    serialized(): TypeAdapter validate ครั้งเดียวจาก attribute ของแถว → dump_json ใน pydantic-core
+    ORJSONResponse: orjson.dumps ตรง ๆ
+
+ตัวอย่าง:
+    python scripts/bench_serialization.py
+    python scripts/bench_serialization.py --items 5000 --repeat 30 --json
+"""
+
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from core.responses import ORJSONResponse, adapter, serialized  # noqa: E402
+from schemas.activities import ActivityList, ActivityOut  # noqa: E402
+from schemas.home import DiaryItem, DiaryListResponse  # noqa: E402
+
+
+def diary_rows(n: int) -> list:
+    today = datetime.date.today()
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(), date=today - datetime.timedelta(days=i), time=datetime.time(8 + i % 12, i % 60),
+            title=f"บันทึกวันที่ {i}", detail="วันนี้ไปออกกำลังกายแล้วอ่านหนังสือต่อ " * 4, mood="🙂", tags="health,reading",
+        )
+        for i in range(n)
+    ]
+
+
+def activity_rows(n: int) -> list:
+    today = datetime.date.today()
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(), date=today, all_day=False, time=datetime.time(i % 24, i % 60), title=f"กิจกรรม {i}",
+            category="work", status="normal", remind=True, remind_offset_min=5, remind_type="simple", remind_sound=True,
+            notification_sent=False, notification_id=None, notes="รายละเอียด" * 5, routine_id=uuid.uuid4(),
+            subtasks=[{"id": str(uuid.uuid4()), "text": f"งานย่อย {j}", "completed": j % 2 == 0} for j in range(3)],
+        )
+        for i in range(n)
+    ]
+
+
+def summary_payload(n: int) -> dict:
+    days = [datetime.date.today() - datetime.timedelta(days=i) for i in range(n)]
+    return {
+        "me": {
+            "mood": {"average": 3.7, "trend": [{"date": d, "score": 3 + i % 3} for i, d in enumerate(days)]},
+            "completion": {"completion_rate": 71.4, "by_day": {d.isoformat(): {"done": i % 5, "total": 5} for i, d in enumerate(days)}},
+        },
+        "community": {
+            "activity_patterns": {"heatmap": [[i % 7, i % 24, i] for i in range(n)]},
+            "mood_distribution": {str(k): k * 10 for k in range(1, 6)},
+        },
+    }
+
+
+def legacy_json(content) -> bytes:
+    # JSONResponse.render ของ Starlette
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def legacy_model(schema, item_schema, rows, extra: dict):
+    # router: model_validate ทีละแถว, FastAPI: validate response_model อีกรอบแล้ว dump เป็น dict
+    built = schema(items=[item_schema.model_validate(r) for r in rows], **extra)
+    ta = adapter(schema)
+    return legacy_json(ta.dump_python(ta.validate_python(built, from_attributes=True), mode="json"))
+
+
+def measure(fn, repeat: int) -> tuple[float, int]:
+    size = len(fn())  # warm up (สร้าง validator/serializer ครั้งแรก)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare legacy and fast JSON serialization of large responses")
+    parser.add_argument("--items", type=int, default=1000, help="Rows per response")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per case (median is reported)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    diaries = diary_rows(args.items)
+    activities = activity_rows(args.items)
+    summary = summary_payload(args.items)
+    diary_extra = {"total": args.items, "next_cursor": None}
+
+    cases = {
+        "home_diaries": (
+            lambda: legacy_model(DiaryListResponse, DiaryItem, diaries, diary_extra),
+            lambda: serialized(DiaryListResponse, {"items": diaries, **diary_extra}).body,
+        ),
+        "activities": (
+            lambda: legacy_model(ActivityList, ActivityOut, activities, {}),
+            lambda: serialized(ActivityList, {"items": activities}).body,
+        ),
+        "trends_summary": (
+            lambda: legacy_json(jsonable_encoder(summary)),
+            lambda: ORJSONResponse(summary).body,
+        ),
+    }
+
+    results = {}
+    for name, (legacy, fast) in cases.items():
+        legacy_ms, legacy_bytes = measure(legacy, args.repeat)
+        fast_ms, fast_bytes = measure(fast, args.repeat)
+        results[name] = {
+            "legacy_ms": round(legacy_ms, 2),
+            "fast_ms": round(fast_ms, 2),
+            "speedup": round(legacy_ms / fast_ms, 1) if fast_ms else None,
+            "legacy_bytes": legacy_bytes,
+            "fast_bytes": fast_bytes,
+        }
+
+    if args.json:
+        print(json.dumps({"items": args.items, "repeat": args.repeat, "results": results}, indent=2))
+        return
+    print(f"{args.items} items, median of {args.repeat} runs")
+    for name, r in results.items():
+        print(f"  {name:<15} legacy {r['legacy_ms']:8.2f} ms   fast {r['fast_ms']:8.2f} ms   x{r['speedup']}   "
+              f"({r['legacy_bytes']} / {r['fast_bytes']} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+วัดเวลา bcrypt บนเครื่องนี้ แล้วแนะนำค่า BCRYPT_ROUNDS ที่ใกล้เวลาเป้าหมายที่สุด (ไม่เกินเป้า)
+
+cost เพิ่ม 1 = เวลาเพิ่มประมาณ 2 เท่า ควรรันบนเครื่อง production (หรือสเปกเดียวกัน)
+หลังเปลี่ยนค่า hash เดิมจะถูก hash ใหม่อัตโนมัติตอน user login สำเร็จ
+
+ตัวอย่าง:
+    python scripts/calibrate_bcrypt.py
+    python scripts/calibrate_bcrypt.py --target-ms 250 --samples 5 --min-rounds 10 --max-rounds 15
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# ให้ import โมดูลของ backend ได้ และให้ Settings อ่าน .env ของ backend
+sys.path.insert(0, str(BACKEND_DIR))
+os.chdir(BACKEND_DIR)
+
+from core.config import settings  # noqa: E402
+from core.security import get_pwd_context  # noqa: E402
+
+SAMPLE_PASSWORD = "Calibrate-bcrypt-1!"
+
+
+def measure(rounds: int, samples: int) -> float:
+    """เวลา hash (มิลลิวินาที, ค่ามัธยฐาน) ที่ cost นี้"""
+    context = get_pwd_context().using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash(SAMPLE_PASSWORD)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pick a bcrypt cost that hashes in about --target-ms on this host")
+    parser.add_argument("--target-ms", type=float, default=250, help="Target hash time in milliseconds")
+    parser.add_argument("--samples", type=int, default=3, help="Hashes per cost (median is used)")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+
+    chosen = args.min_rounds
+    print(f"Current BCRYPT_ROUNDS={settings.bcrypt_rounds}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        elapsed = measure(rounds, args.samples)
+        print(f"rounds={rounds:2d}  {elapsed:8.1f} ms")
+        if elapsed > args.target_ms:
+            break
+        chosen = rounds
+
+    print(f"\nRecommended (<= {args.target_ms:.0f} ms): BCRYPT_ROUNDS={chosen}")
+    if chosen != settings.bcrypt_rounds:
+        print("Set it in .env and restart; existing hashes are upgraded on each user's next login.")
+
+
+if __name__ == "__main__":
+    main()
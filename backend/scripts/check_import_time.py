@@ -0,0 +1,99 @@
+"""
+วัดเวลา import main (cold start ของ worker) เทียบกับงบที่ตั้งไว้ และตรวจว่าไม่มีโมดูลหนักถูกโหลดตอน boot
+
+แต่ละรอบรัน python process ใหม่ด้วย -X importtime แล้ว import main เท่านั้น (ไม่ต่อ DB ไม่ start server)
+ออกด้วย exit code 1 ถ้าค่ามัธยฐานเกิน --budget-ms หรือมีโมดูลใน --forbid ถูก import ใช้ใน CI ได้
+
+ตัวอย่าง:
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget-ms 800 --runs 5 --top 15
+    python scripts/check_import_time.py --forbid jose --forbid passlib --forbid PIL
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# โมดูลที่ควรโหลดตอนใช้ครั้งแรกเท่านั้น (auth/password/รูปภาพ)
+DEFAULT_FORBIDDEN = ["jose", "passlib", "PIL"]
+
+PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "print(json.dumps({'ms': (time.perf_counter() - started) * 1000, 'modules': sorted(sys.modules)}))\n"
+)
+
+
+def run_once() -> tuple[float, list[str], list[tuple[int, str]]]:
+    """(เวลา import main เป็น ms, โมดูลที่โหลด, [(cumulative us, ชื่อโมดูล)] จาก -X importtime)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import main failed (exit {proc.returncode})")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    cumulative = []
+    for line in proc.stderr.splitlines():
+        # "import time:       123 |       4567 |   package.module"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative.append((int(cum), name.rstrip()))
+    return result["ms"], result["modules"], cumulative
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the cold import time of main.py against a budget")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Fail when the median import time exceeds this")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure (median is used)")
+    parser.add_argument("--top", type=int, default=10, help="How many of main's slowest imports to list")
+    parser.add_argument("--forbid", action="append", help="Module that must not be imported at startup (repeatable)")
+    args = parser.parse_args()
+    forbidden = args.forbid or DEFAULT_FORBIDDEN
+
+    timings = []
+    modules: list[str] = []
+    cumulative: list[tuple[int, str]] = []
+    for _ in range(max(1, args.runs)):
+        ms, modules, cumulative = run_once()
+        timings.append(ms)
+    median = statistics.median(timings)
+
+    print(f"import main: median {median:.0f} ms over {len(timings)} run(s) "
+          f"({', '.join(f'{t:.0f}' for t in timings)}) budget {args.budget_ms:.0f} ms")
+    # โมดูลที่ main import ตรง ๆ: -X importtime เยื้องชื่อ 2 ช่องต่อระดับ (main อยู่ระดับบนสุด ลูกของ main เยื้อง 3 ช่อง)
+    top_level = sorted(
+        ((us, name.strip()) for us, name in cumulative if name.startswith("   ") and not name.startswith("    ")),
+        reverse=True,
+    )
+    if top_level:
+        print("slowest imports from main (last run):")
+        for us, name in top_level[: args.top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+    loaded = sorted({m for m in modules for f in forbidden if m == f or m.startswith(f + ".")})
+    failed = False
+    if loaded:
+        print(f"FAIL: modules that should be lazy were imported at startup: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: import time {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
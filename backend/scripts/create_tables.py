@@ -0,0 +1,54 @@
+"""
+สร้างตารางทั้งหมดจาก models (Base.metadata.create_all) สำหรับฐานข้อมูลใหม่
+
+แต่ก่อน main.py ทำขั้นตอนนี้ทุกครั้งที่ import (ทุก worker ตอน boot) ตอนนี้แยกออกมาเป็นขั้นตอน deploy
+รันครั้งเดียวตอนตั้งฐานข้อมูลใหม่ หรือหลังเพิ่ม model ใหม่ (ตารางที่มีอยู่แล้วจะไม่ถูกแก้)
+คอลัมน์/index ที่เพิ่มทีหลังยังต้อง apply จาก migrations/*.sql ตามลำดับเหมือนเดิม
+
+ตัวอย่าง:
+    python scripts/create_tables.py
+    python scripts/create_tables.py --dry-run
+"""
+
+import argparse
+import importlib
+import os
+import pkgutil
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# ให้ import โมดูลของ backend ได้ และให้ Settings อ่าน .env ของ backend
+sys.path.insert(0, str(BACKEND_DIR))
+os.chdir(BACKEND_DIR)
+
+from sqlalchemy import inspect  # noqa: E402
+
+import models  # noqa: E402
+from db.session import Base, engine  # noqa: E402
+
+
+def load_models() -> None:
+    """import ทุกโมดูลใน models/ เพื่อให้ทุกตารางลงทะเบียนใน Base.metadata"""
+    for module in pkgutil.iter_modules(models.__path__):
+        importlib.import_module(f"models.{module.name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create any missing tables from the SQLAlchemy models")
+    parser.add_argument("--dry-run", action="store_true", help="List the tables that would be created")
+    args = parser.parse_args()
+
+    load_models()
+    if args.dry_run:
+        existing = set(inspect(engine).get_table_names())
+        missing = [t.name for t in Base.metadata.sorted_tables if t.name not in existing]
+        print("Missing tables:", ", ".join(missing) if missing else "(none)")
+        return
+
+    Base.metadata.create_all(bind=engine)
+    print(f"Ensured {len(Base.metadata.tables)} tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+CLI สำหรับนำเข้ากิจกรรม/ไดอารี่จำนวนมากให้ user (ฝั่ง admin)
+ใช้ logic เดียวกับ POST /import (routers/imports.py)
+
+ตัวอย่าง:
+    python scripts/import_data.py --email someone@example.com --kind activities --file activities.ndjson
+    python scripts/import_data.py --email someone@example.com --kind diaries --file diaries.csv --start-chunk 4
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# ให้ import โมดูลของ backend ได้ และให้ Settings อ่าน .env ของ backend
+sys.path.insert(0, str(BACKEND_DIR))
+os.chdir(BACKEND_DIR)
+
+from db.session import SessionLocal  # noqa: E402
+from models.user import User  # noqa: E402
+from routers.imports import DEFAULT_CHUNK_SIZE, IMPORTERS, detect_format, run_import  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import activities or diaries for a user")
+    parser.add_argument("--email", required=True, help="Email of the user to import data for")
+    parser.add_argument("--kind", required=True, choices=sorted(IMPORTERS))
+    parser.add_argument("--file", required=True, type=Path, help="NDJSON or CSV file")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default=None)
+    parser.add_argument("--start-chunk", type=int, default=0, help="Resume from this chunk")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.file.name, None)
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == args.email).first()
+        if not user:
+            print(f"User not found: {args.email}")
+            sys.exit(1)
+
+        with args.file.open("r", encoding="utf-8-sig", newline="") as stream:
+            result = run_import(
+                db,
+                user.id,
+                args.kind,
+                stream,
+                fmt,
+                start_chunk=args.start_chunk,
+                chunk_size=args.chunk_size,
+            )
+    finally:
+        db.close()
+
+    for err in result["errors"]:
+        print(f"line {err['line']} (chunk {err['chunk']}): {json.dumps(err['errors'], ensure_ascii=False)}")
+    print(f"Inserted: {result['inserted']} rows in {result['chunks_committed']} chunks")
+    print(f"Errors: {result['error_count']}")
+    if result["resume_from_chunk"] is not None:
+        print(f"Stopped at chunk {result['failed_chunk']}; re-run with --start-chunk {result['resume_from_chunk']}")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
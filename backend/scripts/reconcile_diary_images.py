@@ -0,0 +1,109 @@
+"""
+Reconcile ไฟล์ใน media/diary_images/ กับตาราง diary_images
+
+- ไฟล์ที่ยังไม่มี row: insert metadata (ขนาดไฟล์, width/height, created_at จากเวลาแก้ไขไฟล์)
+- row ที่ไม่มีไฟล์แล้ว: ลบ row ทิ้งเมื่อส่ง --prune
+- folder ที่ไม่มี diary อยู่ในฐานข้อมูลจะถูกข้ามและรายงานไว้
+- --variants: สร้างรูปย่อ WebP + ลบ EXIF ให้รูปที่ยังไม่มี (ทำทันที ไม่ผ่าน worker pool)
+
+ตัวอย่าง:
+    python scripts/reconcile_diary_images.py
+    python scripts/reconcile_diary_images.py --prune --dry-run
+    python scripts/reconcile_diary_images.py --variants
+"""
+
+import argparse
+import datetime
+import os
+import sys
+from pathlib import Path
+from uuid import UUID
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.chdir(BACKEND_DIR)
+
+from core import thumbnails  # noqa: E402
+from core.config import settings  # noqa: E402
+from db.session import SessionLocal  # noqa: E402
+from models.diary import Diary  # noqa: E402
+from models.diary_image import DiaryImage  # noqa: E402
+from routers.diary import _build_image_row, _list_image_files  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import existing diary image files into diary_images")
+    parser.add_argument("--prune", action="store_true", help="Delete rows whose file no longer exists")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, do not write")
+    parser.add_argument("--variants", action="store_true", help="Generate missing WebP variants and strip EXIF")
+    args = parser.parse_args()
+
+    root = Path(settings.media_dir) / "diary_images"
+    if not root.exists():
+        print(f"Nothing to do: {root} does not exist")
+        return
+
+    inserted = pruned = 0
+    pending_variants = []
+    orphan_dirs = []
+    db = SessionLocal()
+    try:
+        for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+            try:
+                diary_id = UUID(folder.name)
+            except ValueError:
+                orphan_dirs.append(folder.name)
+                continue
+            if db.get(Diary, diary_id) is None:
+                orphan_dirs.append(folder.name)
+                continue
+
+            rows = {img.name: img for img in db.query(DiaryImage).filter(DiaryImage.diary_id == diary_id)}
+            files = _list_image_files(folder)
+
+            for name in files:
+                if name in rows:
+                    continue
+                target = folder / name
+                image = _build_image_row(diary_id, target)
+                image.created_at = datetime.datetime.fromtimestamp(
+                    target.stat().st_mtime, tz=datetime.timezone.utc
+                )
+                if not args.dry_run:
+                    db.add(image)
+                    pending_variants.append((image.id, target))
+                inserted += 1
+
+            for name, image in rows.items():
+                if name in files and not image.has_variants:
+                    pending_variants.append((image.id, folder / name))
+
+            if args.prune:
+                for name, image in rows.items():
+                    if name not in files:
+                        if not args.dry_run:
+                            db.delete(image)
+                        pruned += 1
+
+            if not args.dry_run:
+                db.commit()
+    finally:
+        db.close()
+
+    if args.variants and not args.dry_run:
+        for image_id, path in pending_variants:
+            thumbnails.process_diary_image(image_id, path)
+        print(f"Processed variants: {len(pending_variants)}")
+
+    prefix = "[dry-run] " if args.dry_run else ""
+    print(f"{prefix}Inserted rows: {inserted}")
+    if args.prune:
+        print(f"{prefix}Pruned rows: {pruned}")
+    if orphan_dirs:
+        print(f"Skipped folders without a diary: {len(orphan_dirs)}")
+        for name in orphan_dirs:
+            print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()